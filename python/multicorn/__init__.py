@@ -49,6 +49,34 @@ Attributes:
         in the postgresql cluster.
 """
 
+Aggregate = namedtuple("Aggregate", ["function", "attname"])
+
+"""
+An Aggregate describes an aggregate function an SQL query requested, over
+the rows matching the quals.
+
+Attributes:
+    function(str):  The name of the aggregate function: one of 'count',
+        'sum', 'avg', 'min' or 'max'.
+    attname(str):   The name of the column the function is applied to, or
+        None for count(*).
+"""
+
+JoinClause = namedtuple("JoinClause",
+                        ["outer_column", "operator", "inner_column"])
+
+"""
+A JoinClause describes a condition of a join between two foreign tables, of
+the form::
+
+    outer_table.outer_column operator inner_table.inner_column
+
+Attributes:
+    outer_column(str):  The name of the column from the outer table.
+    operator(str):      The name of the operator. Example: =, <=, <>
+    inner_column(str):  The name of the column from the inner table.
+"""
+
 class Qual(object):
     """A Qual describes a postgresql qualifier.
 
@@ -140,6 +168,43 @@ class Qual(object):
         return hash((self.field_name, self.operator, self.value))
 
 
+class BoolQual(object):
+    """A BoolQual describes an AND, OR or NOT combination of qualifiers.
+
+    For example::
+
+        mycolumn = 3 OR othercolumn > 4
+        NOT (mycolumn = 3 AND othercolumn > 4)
+
+    They are only passed to the :meth:`ForeignDataWrapper.execute` method if
+    the `_bool_quals` attribute of the foreign data wrapper is True.
+
+    Attributes:
+        operator (str): 'and', 'or' or 'not'.
+        quals (list): The combined :class:`Qual` or :class:`BoolQual`
+            instances. A 'not' combination has exactly one.
+    """
+
+    def __init__(self, operator, quals):
+        self.operator = operator
+        self.quals = quals
+
+    def __repr__(self):
+        if self.operator == 'not':
+            return 'not (%r)' % (self.quals[0],)
+        return '(%s)' % (' %s ' % self.operator).join(
+            repr(qual) for qual in self.quals)
+
+    def __eq__(self, other):
+        if isinstance(other, BoolQual):
+            return (self.operator == other.operator and
+                    self.quals == other.quals)
+        return False
+
+    def __hash__(self):
+        return hash((self.operator, tuple(self.quals)))
+
+
 
 
 
@@ -153,6 +218,40 @@ class ForeignDataWrapper(object):
 
     _startup_cost = 20
 
+    #: If True, :meth:`execute` yields batches (lists or tuples) of rows
+    #: instead of individual rows. This saves a round trip between
+    #: PostgreSQL and python for every row on large scans.
+    _batch_results = False
+
+    #: If True, scans may be run by parallel workers. See
+    #: :meth:`get_scan_partitions`.
+    _parallel_safe = False
+
+    #: If True, scans of partitions may be run concurrently on PostgreSQL 14
+    #: and later, using :meth:`execute_async`.
+    _async_capable = False
+
+    #: Number of seconds during which the answers of :meth:`get_rel_size`,
+    #: :meth:`get_path_keys` and :meth:`can_sort` are reused when planning
+    #: queries, or None to compute them for every query. They are cached
+    #: according to the columns and operators of the quals, but not their
+    #: values, and the set of requested columns: only set it if the estimates
+    #: do not depend on the values of the quals.
+    _planner_cache_ttl = None
+
+    #: Maximum number of rows kept by a scan run again for each outer row of
+    #: a nested loop, so that parameter values seen before are answered
+    #: without calling :meth:`execute` again. With `_batch_results`, this
+    #: counts batches instead of rows. Results which do not fit are streamed
+    #: and not kept. Set it to None or 0 if :meth:`execute` must be called
+    #: for every outer row.
+    _param_cache_rows = 10000
+
+    #: If True, the restrictions combining simple quals with AND, OR or NOT
+    #: are passed to :meth:`execute` and :meth:`explain` as the `bool_quals`
+    #: argument, a list of :class:`BoolQual`.
+    _bool_quals = False
+
     def __init__(self, fdw_options, fdw_columns):
         """The foreign data wrapper is initialized on the first query.
 
@@ -182,9 +281,37 @@ class ForeignDataWrapper(object):
             columns (list): The list of columns that must be returned.
 
         Returns:
-            A tuple of the form (expected_number_of_rows, avg_row_width (in bytes))
+            A tuple of the form (expected_number_of_rows, avg_row_width (in bytes)),
+            or None to let PostgreSQL estimate it from the statistics
+            gathered by ANALYZE (see :meth:`analyze`). If the table was
+            never analyzed, 100000000 rows of 100 bytes per column are
+            assumed.
+
+            This default implementation returns None. It used to return
+            (100000000, len(columns) * 100): subclasses calling it must handle
+            None.
         """
-        return (100000000, len(columns) * 100)
+        return None
+
+    def analyze(self, sample_size):
+        """
+        Method called by ANALYZE to get a sample of the rows of the foreign
+        table, from which PostgreSQL computes the column statistics used by
+        the planner.
+
+        By default, every row returned by :meth:`execute` is read, and
+        sampled by PostgreSQL.
+
+        Args:
+            sample_size (int): The number of rows PostgreSQL wants to sample.
+
+        Returns:
+            A tuple of the form (total_number_of_rows, rows), where rows is
+            an iterable of at most sample_size rows, in the same format as
+            the rows returned by :meth:`execute`. If None is returned, the
+            sample is taken from the output of :meth:`execute`.
+        """
+        return None
 
     def can_sort(self, sortkeys):
         """
@@ -212,6 +339,103 @@ class ForeignDataWrapper(object):
         """
         return []
 
+    def can_limit(self, quals, limit, offset):
+        """
+        Method called from the planner to ask the FDW whether it can apply a
+        LIMIT and OFFSET clause itself, to avoid fetching every row.
+
+        This is only asked for queries on a single foreign table, where every
+        restriction could be converted to a qual, and whose ordering is
+        enforced by the FDW (see :meth:`can_sort`). The quals are those known
+        at planning time: quals whose value is only known at execution time
+        are not included.
+
+        If the FDW accepts, the limit and offset are passed to the
+        :meth:`execute` and :meth:`explain` methods, and the FDW MUST apply
+        them after filtering the rows according to ALL the quals.
+
+        Args:
+            quals (list): A list of :class:`Qual` instances.
+            limit (int): The maximum number of rows to return, or None.
+            offset (int): The number of rows to skip, or None.
+
+        Return:
+            True if the FDW can apply the limit and offset.
+        """
+        return False
+
+    def exact_quals(self, quals):
+        """
+        Method called from the planner to ask the FDW which quals it fully
+        enforces, so that PostgreSQL does not check them again on every
+        returned row.
+
+        The quals are those known at planning time: quals whose value is only
+        known at execution time are always checked again. They are still
+        passed to the :meth:`execute` method, and the FDW MUST only return
+        rows matching them.
+
+        Args:
+            quals (list): A list of :class:`Qual` instances.
+
+        Return:
+            The list of the :class:`Qual` instances, among those given, which
+            the FDW enforces exactly.
+        """
+        return []
+
+    def can_aggregate(self, group_by, aggregates, quals):
+        """
+        Method called from the planner to ask the FDW whether it can compute
+        the grouping and aggregates of a query itself, to avoid fetching every
+        row.
+
+        This is only asked for queries on a single foreign table, where every
+        restriction could be converted to a qual known at planning time.
+
+        If the FDW accepts, the group_by and aggregates arguments are passed
+        to the :meth:`execute` and :meth:`explain` methods, and the FDW MUST
+        compute them over the rows matching ALL the quals.
+
+        Args:
+            group_by (list): The names of the grouping columns.
+            aggregates (list): A list of :class:`Aggregate` instances.
+            quals (list): A list of :class:`Qual` instances.
+
+        Return:
+            True if the FDW can compute the grouping and aggregates.
+        """
+        return False
+
+    def can_join(self, inner, join_type, clauses, outer_quals, inner_quals):
+        """
+        Method called from the planner to ask the FDW whether it can compute
+        a join between its foreign table (the outer table) and another foreign
+        table from the same server (the inner table) itself, instead of
+        scanning both tables.
+
+        This is only asked if every restriction on both tables could be
+        converted to a qual known at planning time, and if every join
+        condition compares a column from each table.
+
+        If the FDW accepts, the :meth:`execute_join` and :meth:`explain_join`
+        methods are called instead of :meth:`execute` and :meth:`explain`.
+
+        Args:
+            inner (ForeignDataWrapper): The instance of the inner table.
+            join_type (str): One of 'inner', 'left', 'right' or 'full'.
+            clauses (list): A list of :class:`JoinClause` instances, all of
+                which must be true for two rows to be joined.
+            outer_quals (list): A list of :class:`Qual` instances,
+                restricting the rows of the outer table.
+            inner_quals (list): A list of :class:`Qual` instances,
+                restricting the rows of the inner table.
+
+        Return:
+            True if the FDW can compute the join.
+        """
+        return False
+
     def get_path_keys(self):
         u"""
         Method called from the planner to add additional Path to the planner.
@@ -269,17 +493,82 @@ class ForeignDataWrapper(object):
         """
         return []
 
-    def explain(self, quals, columns, sortkeys=None, verbose=False):
+    def get_scan_partitions(self, quals, columns):
+        """
+        Method called at the start of a parallel scan, to split it into
+        partitions which will be claimed in turn by the processes taking part
+        in the scan. Every participant calls :meth:`execute` with the
+        `partition` keyword argument for each partition it claims, using its
+        own instance of the foreign data wrapper.
+
+        Parallel scans are only considered if the `_parallel_safe` attribute
+        is True.
+
+        Args:
+            quals (list): A list of :class:`Qual` instances, as passed to
+                :meth:`execute`.
+            columns (list): The list of columns that must be returned.
+
+        Returns:
+            A list of picklable partition descriptors, or None if the scan
+            cannot be split. In that case, a single process performs the whole
+            scan.
+        """
+        return None
+
+    def explain(self, quals, columns, sortkeys=None, verbose=False,
+                **kwargs):
         """Hook called on explain.
 
         The arguments are the same as the :meth:`execute`, with the addition of
         a "verbose" keyword arg for when the EXPLAIN is called with the VERBOSE
-        option.
+        option. The limit, offset, aggregation and trees of quals pushed down
+        to the scan are passed as keyword arguments too.
         Returns:
             An iterable of strings to display in the EXPLAIN output.
         """
         return []
 
+    def explain_join(self, inner, join_type, clauses, outer_quals,
+                     inner_quals, outer_columns, inner_columns,
+                     verbose=False):
+        """Hook called on explain, for joins accepted in :meth:`can_join`.
+
+        The arguments are the same as the :meth:`execute_join`, with the
+        addition of a "verbose" keyword arg.
+        Returns:
+            An iterable of strings to display in the EXPLAIN output.
+        """
+        return []
+
+    def execute_join(self, inner, join_type, clauses, outer_quals,
+                     inner_quals, outer_columns, inner_columns):
+        """Execute a join accepted in :meth:`can_join`.
+
+        The outer_quals and inner_quals restrict the rows of each table
+        BEFORE they are joined: for outer joins, they do not filter out the
+        rows which are completed with nulls.
+
+        Args:
+            inner (ForeignDataWrapper): The instance of the inner table.
+            join_type (str): One of 'inner', 'left', 'right' or 'full'.
+            clauses (list): A list of :class:`JoinClause` instances.
+            outer_quals (list): A list of :class:`Qual` instances for the
+                outer table.
+            inner_quals (list): A list of :class:`Qual` instances for the
+                inner table.
+            outer_columns (list): The names of the columns needed from the
+                outer table.
+            inner_columns (list): The names of the columns needed from the
+                inner table.
+
+        Returns:
+            An iterable of sequences, one per joined row, containing the
+            values of the outer_columns followed by the values of the
+            inner_columns, in order.
+        """
+        raise NotImplementedError("This FDW does not support joins")
+
     def execute(self, quals, columns, sortkeys=None):
         """Execute a query in the foreign data wrapper.
 
@@ -313,6 +602,22 @@ class ForeignDataWrapper(object):
                 should be in the sequence.
             sortkeys (list): A list of :class:`SortKey`
                 that the FDW said it can enforce.
+            partition (object): In a parallel scan, one of the descriptors
+                returned by :meth:`get_scan_partitions`. Only the rows from
+                this partition should be returned. This argument is only
+                passed for partitioned scans.
+            limit (int): The maximum number of rows to return, if the FDW
+                accepted it in :meth:`can_limit`.
+            offset (int): The number of rows to skip before returning any
+                row, if the FDW accepted it in :meth:`can_limit`.
+            group_by (list): The grouping columns names, if the FDW accepted
+                to aggregate the rows in :meth:`can_aggregate`.
+            aggregates (list): The :class:`Aggregate` to compute, if the FDW
+                accepted to aggregate the rows in :meth:`can_aggregate`.
+            bool_quals (list): A list of :class:`BoolQual` instances, for the
+                where clauses combining basic ones with AND, OR or NOT. This
+                argument is only passed if the `_bool_quals` attribute is
+                True and there are such clauses.
 
         Returns:
             An iterable of python objects which can be converted back to PostgreSQL.
@@ -323,9 +628,44 @@ class ForeignDataWrapper(object):
             If the sortkeys wasn't empty, the FDW has to return the data in the
             expected order.
 
+            If the group_by and aggregates arguments are passed, the iterable
+            must instead yield one sequence per group, containing the values
+            of the grouping columns followed by the values of the aggregates,
+            in order.
+
+            If the `_batch_results` attribute is True, the iterable must
+            instead yield lists or tuples of such objects, or
+            column-oriented batches as described in
+            :mod:`multicorn.columnar`.
+
         """
         pass
 
+    def execute_async(self, quals, columns, sortkeys=None, **kwargs):
+        """Start a scan whose rows are fetched without blocking.
+
+        This method is called instead of :meth:`execute`, with the same
+        arguments, if the `_async_capable` attribute is True and the scan is
+        one of several foreign scans of an Append node, for example the
+        partitions of a partitioned table. PostgreSQL then waits for all of
+        them at once instead of one after the other.
+
+        The returned object must have two methods:
+
+            - `fileno()`, returning a file descriptor which becomes readable
+              whenever rows are available, or when the scan is over.
+            - `fetch()`, returning the list of rows available right now
+              (possibly empty), or None once the scan is over. It must never
+              block.
+
+        Note that python code only runs in the backend thread while
+        PostgreSQL calls into multicorn: a background thread will not make
+        progress while the backend waits on the file descriptor. The
+        underlying I/O must be driven by `fetch()` itself, for example on a
+        non-blocking socket or by running one step of an asyncio loop.
+        """
+        raise NotImplementedError("This FDW does not support async scans")
+
     @property
     def rowid_column(self):
         """
@@ -355,6 +695,26 @@ class ForeignDataWrapper(object):
         """
         raise NotImplementedError("This FDW does not support the writable API")
 
+    def bulk_insert(self, rows):
+        """
+        Insert several tuples at once in the foreign table.
+
+        This method is called instead of :meth:`insert` when the
+        ``batch_size`` option of the foreign table (or of its server) is
+        greater than 1, and the inserted values are not needed back by
+        PostgreSQL (no RETURNING clause, row trigger or check option).
+        Rows are then buffered, and sent by batches of at most
+        ``batch_size`` rows.
+
+        The default implementation calls :meth:`insert` for each row.
+
+        Args:
+            rows (list): a list of dictionaries mapping column names to
+                column values
+        """
+        for values in rows:
+            self.insert(values)
+
     def update(self, oldvalues, newvalues):
         """
         Update a tuple containing ''oldvalues'' to the ''newvalues''.
@@ -382,6 +742,62 @@ class ForeignDataWrapper(object):
         """
         raise NotImplementedError("This FDW does not support the writable API")
 
+    def can_modify_directly(self, operation, quals, assignments):
+        """
+        Method called from the planner to ask the FDW whether it can apply an
+        UPDATE or DELETE statement itself, instead of having PostgreSQL fetch
+        every matching row and call :meth:`update` or :meth:`delete` for each
+        of them.
+
+        This is only asked for statements on a single foreign table, without
+        any RETURNING clause or row trigger, where every restriction could be
+        converted to a qual known at planning time, and whose new values are
+        constants.
+
+        If the FDW accepts, :meth:`update_where` or :meth:`delete_where` is
+        called instead, and the FDW MUST enforce ALL the quals.
+
+        Args:
+            operation (str): Either 'update' or 'delete'.
+            quals (list): A list of :class:`Qual` instances.
+            assignments (dict): A dictionary mapping the updated column names
+                to their new values. It is empty for a delete.
+
+        Return:
+            True if the FDW can modify the rows directly.
+        """
+        return False
+
+    def update_where(self, quals, assignments):
+        """
+        Update every row matching the quals, if the FDW accepted it in
+        :meth:`can_modify_directly`.
+
+        Args:
+            quals (list): A list of :class:`Qual` instances, all of which
+                must be true for a row to be updated.
+            assignments (dict): A dictionary mapping the updated column names
+                to their new values.
+
+        Returns:
+            The number of updated rows.
+        """
+        raise NotImplementedError("This FDW does not support direct updates")
+
+    def delete_where(self, quals):
+        """
+        Delete every row matching the quals, if the FDW accepted it in
+        :meth:`can_modify_directly`.
+
+        Args:
+            quals (list): A list of :class:`Qual` instances, all of which
+                must be true for a row to be deleted.
+
+        Returns:
+            The number of deleted rows.
+        """
+        raise NotImplementedError("This FDW does not support direct deletes")
+
     def pre_commit(self):
         """
         Hook called just before a commit is issued, on PostgreSQL >=9.3.
@@ -408,6 +824,27 @@ class ForeignDataWrapper(object):
         """
         pass
 
+    def scan_stats(self):
+        """
+        Report counters specific to the wrapper about the last execution of
+        a scan, such as the number of remote rows fetched or of quals which
+        could not be pushed down.
+
+        With EXPLAIN ANALYZE, this method is called right before and after
+        each call to :meth:`execute`. Several scans of the same table share
+        the same instance, so :meth:`execute` must start a new dictionary of
+        counters each time it is called, and keep updating that one while
+        its rows are fetched. The numeric counters of every execution of a
+        scan, for example on the inner side of a nested loop, are summed.
+        They are shown next to the statistics gathered by multicorn: the
+        time spent in :meth:`execute`, fetching the rows and converting them.
+
+        Returns:
+            A dictionary mapping counter names to integers, floats or
+            strings, or None.
+        """
+        return None
+
     def end_modify(self):
         """
         Hook called at the end of a foreign modify (DML operations)
@@ -0,0 +1,76 @@
+"""
+Helpers for foreign data wrappers returning column-oriented batches.
+
+When the `_batch_results` attribute of a foreign data wrapper is set, its
+execute method may yield column-oriented batches instead of lists of rows.
+A column-oriented batch is either:
+
+    - a mapping of column names to their values. Values are read directly
+      from objects implementing the buffer protocol with a numeric format
+      (array.array, memoryview, numpy arrays...). Any other sequence is
+      converted value by value. Missing columns are null.
+    - an Arrow RecordBatch. Primitive columns without nulls are exposed as
+      memoryviews over their data buffer, other ones are converted to lists.
+
+"""
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+# Arrow type names mapped to their buffer protocol format.
+ARROW_FORMATS = {
+    'int8': 'b',
+    'uint8': 'B',
+    'int16': 'h',
+    'uint16': 'H',
+    'int32': 'i',
+    'uint32': 'I',
+    'int64': 'q',
+    'uint64': 'Q',
+    'float': 'f',
+    'double': 'd',
+}
+
+
+def is_arrow_batch(batch):
+    """
+    Returns:
+        True if batch looks like an Arrow RecordBatch.
+    """
+    return (hasattr(batch, 'schema') and hasattr(batch, 'column') and
+            hasattr(batch, 'num_rows'))
+
+
+def arrow_column(array):
+    """Convert an Arrow array to an object which can be read by the C
+    extension, without copying its values if possible."""
+    if hasattr(array, 'chunks'):
+        # A ChunkedArray, as found in Arrow tables.
+        if len(array.chunks) != 1:
+            return array.to_pylist()
+        array = array.chunks[0]
+    fmt = ARROW_FORMATS.get(str(array.type))
+    if fmt is None or array.null_count or not hasattr(memoryview, 'cast'):
+        return array.to_pylist()
+    data = memoryview(array.buffers()[1]).cast(fmt)
+    return data[array.offset:array.offset + len(array)]
+
+
+def as_columns(batch):
+    """
+    Internal function called from the C extension for every batch which is
+    not a list or a tuple.
+
+    Returns:
+        A mapping of column names to columns if the batch is column-oriented,
+        None otherwise.
+    """
+    if isinstance(batch, Mapping):
+        return batch
+    if is_arrow_batch(batch):
+        return dict((name, arrow_column(batch.column(index)))
+                    for index, name in enumerate(batch.schema.names))
+    return None
@@ -147,6 +147,7 @@ class FilesystemFdw(TransactionAwareForeignDataWrapper):
         self.invisible_files = set()
         # Keep a dictionary of updated content.
         self.updated_content = dict()
+        self._stats = None
         # Assume 100 files/folder per folder
         self.total_files = 100 ** len(pattern.split('/'))
         if self.filename_column:
@@ -241,6 +242,12 @@ class FilesystemFdw(TransactionAwareForeignDataWrapper):
             if qual.operator == '=' and qual.field_name in properties))
 
     def items_to_dicts(self, items, columns):
+        # The counters of each scan are distinct, even if several scans of
+        # the table are running.
+        self._stats = {'Matched Files': 0, 'Read Files': 0}
+        return self._items_to_dicts(items, columns, self._stats)
+
+    def _items_to_dicts(self, items, columns, stats):
         content_column = self.content_column
         filename_column = self.filename_column
         has_content = content_column and content_column in columns
@@ -248,11 +255,13 @@ class FilesystemFdw(TransactionAwareForeignDataWrapper):
         for item in items:
             if item.full_filename in self.invisible_files:
                 continue
+            stats['Matched Files'] += 1
             new_item = dict(item)
             if has_content:
                 content = self.updated_content.get(item.full_filename, None)
                 if content is None:
                     content = item.read()
+                    stats['Read Files'] += 1
                 new_item[content_column] = content
             if has_filename:
                 new_item[filename_column] = item.filename
@@ -425,6 +434,9 @@ class FilesystemFdw(TransactionAwareForeignDataWrapper):
     def rowid_column(self):
         return self.filename_column
 
+    def scan_stats(self):
+        return self._stats
+
     def end_scan(self):
         self.structured_directory.clear_cache(only_shared=True)
 
@@ -67,7 +67,7 @@ requesting the payload_column if you don't need it.
 """
 
 
-from . import ForeignDataWrapper, ANY, ALL
+from . import ForeignDataWrapper, ANY, ALL, BoolQual
 from .utils import log_to_postgres, ERROR, WARNING
 
 from imaplib import IMAP4
@@ -136,6 +136,8 @@ class ImapFdw(ForeignDataWrapper):
     """An imap foreign data wrapper
     """
 
+    _bool_quals = True
+
     def __init__(self, options, columns):
         super(ImapFdw, self).__init__(options, columns)
         self._imap_agent = None
@@ -153,6 +155,7 @@ class ImapFdw(ForeignDataWrapper):
         self.payload_column = options.get('payload_column', None)
         self.flags_column = options.get('flags_column', None)
         self.internaldate_column = options.get('internaldate_column', None)
+        self._stats = None
 
     def get_rel_size(self, quals, columns):
         """Inform the planner that it can be EXTREMELY costly to use the
@@ -271,7 +274,43 @@ class ImapFdw(ForeignDataWrapper):
         conditions = [x for x in conditions if x not in (None, '()')]
         return conditions
 
-    def execute(self, quals, columns):
+    def _bool_condition(self, bool_qual):
+        """Build an imap search criteria string from an AND / OR tree of
+        quals, or return an empty string if it cannot be.
+
+        NOT is not translated: the imap search being less strict than the
+        quals, its negation could miss matching mails."""
+        if bool_qual.operator == 'not':
+            return ''
+        conditions = []
+        for qual in bool_qual.quals:
+            try:
+                if isinstance(qual, BoolQual):
+                    condition = self._bool_condition(qual)
+                else:
+                    condition = ' '.join(self.extract_conditions([qual]))
+            except NoMatchPossible:
+                if bool_qual.operator == 'and':
+                    raise
+                continue
+            if condition:
+                conditions.append(condition)
+            elif bool_qual.operator == 'or':
+                # This branch matches any mail.
+                return ''
+        if bool_qual.operator == 'or':
+            if not conditions:
+                raise NoMatchPossible()
+            return make_or(['(%s)' % condition for condition in conditions])
+        return ' '.join(conditions)
+
+    def can_limit(self, quals, limit, offset):
+        # IMAP searches are less strict than the quals they are built from,
+        # so the limit can only be applied when there is nothing to filter.
+        return not quals
+
+    def execute(self, quals, columns, limit=None, offset=None,
+                bool_quals=None):
         # The header dictionary maps columns to their imap search string
         col_to_imap = {}
         headers = []
@@ -287,13 +326,30 @@ class ImapFdw(ForeignDataWrapper):
                                        column.upper())
                 headers.append(column)
         try:
-            conditions = self.extract_conditions(quals) or ['ALL']
+            conditions = self.extract_conditions(quals)
+            for bool_qual in bool_quals or []:
+                condition = self._bool_condition(bool_qual)
+                if condition:
+                    conditions.append(condition)
+            conditions = conditions or ['ALL']
         except NoMatchPossible:
+            conditions = []
             matching_mails = []
         else:
             matching_mails = self.imap_agent.search(
                 charset=self.imap_server_charset,
                 criteria=conditions)
+        self._stats = {'Search Criteria': ' '.join(conditions),
+                       'Matching Mails': len(matching_mails),
+                       'Fetched Mails': 0}
+        if offset is not None or limit is not None:
+            start = offset or 0
+            end = start + limit if limit is not None else None
+            matching_mails = matching_mails[start:end]
+        return self._fetch_mails(matching_mails, col_to_imap, headers,
+                                 self._stats)
+
+    def _fetch_mails(self, matching_mails, col_to_imap, headers, stats):
         if matching_mails:
             data = self.imap_agent.fetch(list(compact_fetch(matching_mails)),
                                          list(col_to_imap.values()))
@@ -315,4 +371,8 @@ class ImapFdw(ForeignDataWrapper):
                                                     charset, WARNING)
                             else:
                                 item[column] = decoded_header
+                stats['Fetched Mails'] += 1
                 yield item
+
+    def scan_stats(self):
+        return self._stats
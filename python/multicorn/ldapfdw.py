@@ -81,7 +81,7 @@ definition:
 
 """
 
-from . import ForeignDataWrapper
+from . import ForeignDataWrapper, BoolQual
 
 import ldap3
 from multicorn.utils import log_to_postgres, ERROR
@@ -113,6 +113,8 @@ class LdapFdw(ForeignDataWrapper):
 
     """
 
+    _bool_quals = True
+
     def __init__(self, fdw_options, fdw_columns):
         super(LdapFdw, self).__init__(fdw_options, fdw_columns)
         if "address" in fdw_options:
@@ -134,22 +136,52 @@ class LdapFdw(ForeignDataWrapper):
             col.column_name for name, col in self.field_definitions.items()
             if col.type_name.endswith('[]')]
 
-    def execute(self, quals, columns):
-        request = unicode_("(objectClass=%s)") % self.object_class
-        for qual in quals:
-            if isinstance(qual.operator, tuple):
-                operator = qual.operator[0]
+    def _qual_filter(self, qual):
+        """Translate a qual to an ldap filter, or return None if its
+        operator is not supported."""
+        if isinstance(qual.operator, tuple):
+            operator = qual.operator[0]
+        else:
+            operator = qual.operator
+        if operator not in ("=", "~~"):
+            return None
+        if hasattr(qual.value, "translate"):
+            baseval = qual.value.translate(SPECIAL_CHARS)
+            val = (baseval.replace("%", "*")
+                   if operator == "~~" else baseval)
+        else:
+            val = qual.value
+        return unicode_("(%s=%s)") % (qual.field_name, val)
+
+    def _bool_filter(self, bool_qual):
+        """Translate an AND / OR tree of quals to an ldap filter, or return
+        None if it cannot be.
+
+        NOT is not translated: the ldap matching rules being less strict
+        than the quals, its negation could miss matching entries."""
+        filters = []
+        for qual in bool_qual.quals:
+            if isinstance(qual, BoolQual):
+                qual_filter = self._bool_filter(qual)
             else:
-                operator = qual.operator
-            if operator in ("=", "~~"):
-                if hasattr(qual.value, "translate"):
-                    baseval = qual.value.translate(SPECIAL_CHARS)
-                    val = (baseval.replace("%", "*")
-                           if operator == "~~" else baseval)
-                else:
-                    val = qual.value
-                request = unicode_("(&%s(%s=%s))") % (
-                    request, qual.field_name, val)
+                qual_filter = self._qual_filter(qual)
+            if qual_filter is not None:
+                filters.append(qual_filter)
+            elif bool_qual.operator == 'or':
+                return None
+        if bool_qual.operator == 'not' or not filters:
+            return None
+        return unicode_("(%s%s)") % ('&' if bool_qual.operator == 'and'
+                                     else '|', ''.join(filters))
+
+    def execute(self, quals, columns, bool_quals=None):
+        request = unicode_("(objectClass=%s)") % self.object_class
+        filters = [self._qual_filter(qual) for qual in quals]
+        filters.extend(self._bool_filter(bool_qual)
+                       for bool_qual in bool_quals or [])
+        for qual_filter in filters:
+            if qual_filter is not None:
+                request = unicode_("(&%s%s)") % (request, qual_filter)
         self.ldap.search(
             self.path, request, self.scope,
             attributes=list(self.field_definitions))
@@ -0,0 +1,190 @@
+"""
+A cache of scan results shared by every PostgreSQL backend.
+
+It is enabled by setting the ``cache_ttl`` option, in seconds, on a foreign
+table or on its server. The rows returned by the execute method of the
+foreign data wrapper are then kept for that long, and any backend running
+the same scan (same database, foreign table, user, quals, columns, sort
+keys, limit, offset and aggregation) is answered from the cache instead of
+calling execute.
+
+The results are pickled in an SQLite database, located in the temporary
+files directory of the cluster and accessed through a memory mapping. The
+``cache_size`` option bounds the size of the results of a foreign table, in
+kilobytes (10240 by default): the least recently used ones are evicted
+first. Reading results does not write to the database: a backend records
+the results it read, and updates their access times the next time it stores
+results.
+
+Writing to the foreign table through PostgreSQL drops its cached results.
+Changes made to the remote data by other means are only seen once the
+results expire.
+
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+from .utils import log_to_postgres, WARNING
+
+
+#: The database file, relative to the data directory of the cluster.
+CACHE_PATH = os.path.join('base', 'pgsql_tmp', 'pgsql_tmp_multicorn_results.db')
+
+#: Bytes of the database file mapped in memory.
+MMAP_SIZE = 256 * 1024 * 1024
+
+_connection = None
+
+#: Access times of the results read by this backend, by key, which are not
+#: written to the database yet.
+_accessed = {}
+
+
+def get_connection():
+    """Open the cache database, once per backend."""
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(CACHE_PATH)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another backend created it in the meantime.
+                pass
+        connection = sqlite3.connect(CACHE_PATH, timeout=1,
+                                     isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.execute('PRAGMA mmap_size=%d' % MMAP_SIZE)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, database_oid INTEGER, table_oid INTEGER, '
+            'expires REAL, accessed REAL, size INTEGER, rows BLOB)')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS results_table_oid '
+            'ON results (database_oid, table_oid, accessed)')
+        _connection = connection
+    return _connection
+
+
+def freeze(value):
+    """Convert the arguments of a scan to a picklable and comparable
+    structure, which does not depend on the ordering of sets and
+    dictionaries."""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((freeze(item) for item in value), key=repr))
+    if isinstance(value, dict):
+        return tuple(sorted((freeze(item) for item in value.items()),
+                            key=repr))
+    if hasattr(value, '__dict__'):
+        # Quals, sort keys and aggregates.
+        return (value.__class__.__name__, freeze(vars(value)))
+    return value
+
+
+class CachedExecute(object):
+    """Wrap the execute method of a foreign data wrapper, so that its results
+    are read from and stored in the cache."""
+
+    def __init__(self, execute, database_oid, table_oid, user_oid, ttl, size):
+        self.execute = execute
+        self.database_oid = database_oid
+        self.table_oid = table_oid
+        self.user_oid = user_oid
+        self.ttl = ttl
+        self.size = size * 1024
+
+    def __call__(self, quals, columns, **kwargs):
+        try:
+            key = hashlib.sha1(pickle.dumps(
+                freeze((self.database_oid, self.table_oid, self.user_oid,
+                        quals, columns, kwargs)), 2)).hexdigest()
+        except Exception:
+            # Some value cannot be pickled: do not cache this scan.
+            return self.execute(quals, columns, **kwargs)
+        try:
+            rows = self.lookup(key)
+        except sqlite3.Error as e:
+            log_to_postgres('Cannot read the result cache: %s' % e, WARNING)
+            return self.execute(quals, columns, **kwargs)
+        if rows is not None:
+            return rows
+        result = self.execute(quals, columns, **kwargs)
+        if result is None:
+            return None
+        rows = list(result)
+        try:
+            self.store(key, rows)
+        except sqlite3.Error as e:
+            log_to_postgres('Cannot write the result cache: %s' % e, WARNING)
+        except Exception:
+            # The rows cannot be pickled.
+            pass
+        return rows
+
+    def lookup(self, key):
+        """Returns the cached rows, or None if they are missing or expired."""
+        now = time.time()
+        row = get_connection().execute(
+            'SELECT rows FROM results WHERE key = ? AND expires > ?',
+            (key, now)).fetchone()
+        if row is None:
+            return None
+        _accessed[key] = now
+        return pickle.loads(bytes(row[0]))
+
+    def store(self, key, rows):
+        """Store the rows, evicting the least recently used results of the
+        table if they no longer fit."""
+        data = pickle.dumps(rows, 2)
+        if len(data) > self.size:
+            return
+        connection = get_connection()
+        now = time.time()
+        table = (self.database_oid, self.table_oid)
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'UPDATE results SET accessed = MAX(accessed, ?) WHERE key = ?',
+                [(accessed, old_key)
+                 for old_key, accessed in _accessed.items()])
+            connection.execute(
+                'DELETE FROM results WHERE database_oid = ? AND table_oid = ? '
+                'AND expires <= ?', table + (now,))
+            connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key,) + table + (now + self.ttl, now, len(data),
+                                  sqlite3.Binary(data)))
+            used = connection.execute(
+                'SELECT SUM(size) FROM results WHERE database_oid = ? '
+                'AND table_oid = ?', table).fetchone()[0]
+            for old_key, size in connection.execute(
+                    'SELECT key, size FROM results WHERE database_oid = ? '
+                    'AND table_oid = ? ORDER BY accessed', table).fetchall():
+                if used <= self.size:
+                    break
+                connection.execute('DELETE FROM results WHERE key = ?',
+                                   (old_key,))
+                used -= size
+            connection.execute('COMMIT')
+            _accessed.clear()
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+
+def invalidate(database_oid, table_oid):
+    """Drop the cached results of a foreign table."""
+    try:
+        get_connection().execute(
+            'DELETE FROM results WHERE database_oid = ? AND table_oid = ?',
+            (database_oid, table_oid))
+    except sqlite3.Error as e:
+        log_to_postgres('Cannot invalidate the result cache: %s' % e,
+                        WARNING)
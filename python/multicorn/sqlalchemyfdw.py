@@ -73,6 +73,23 @@ Other options
 ``schema``
   The schema in which this table resides on the remote side
 
+``partition_column``
+  An integer column used to split scans between parallel workers. Each worker
+  fetches the rows for which this column, modulo ``partitions``, matches
+  its partition. The rows where it is null belong to the first partition.
+
+``partitions``
+  The number of partitions for parallel scans (default: 4). Only used if a
+  ``partition_column`` is set.
+
+``exact_quals``
+  If set to ``true``, PostgreSQL does not check again the quals pushed to the
+  remote database. By default, this is only the case for the comparisons of
+  integer, numeric, floating point, date and boolean columns: the remote
+  database may compare text with another collation, or apply LIKE with other
+  rules. LIMIT clauses, aggregates, joins and direct modifications are only
+  pushed to the remote database when every qual is exact.
+
 When defining the table, the local column names will be used to retrieve the
 remote column data.
 Moreover, the local column types will be used to interpret the results in the
@@ -91,8 +108,20 @@ What does it do to reduce the amount of fetched data ?
     - like, ilike and their negations
     - IN clauses with scalars, = ANY (array)
     - NOT IN clauses, != ALL (array)
+    - tests of boolean columns
+    - AND, OR and NOT combinations of the above
 - the set of needed columns is pushed to the remote_side, and only those columns
   will be fetched.
+- on PostgreSQL 12 and later, LIMIT and OFFSET clauses, and the GROUP BY
+  clause with the count, sum, avg, min and max aggregates are pushed to the
+  remote database when every qual is exact (see the ``exact_quals`` option).
+  Grouping, min and max are only pushed on the columns of the types whose
+  comparisons are exact.
+- on PostgreSQL 12 and later, joins between two tables sharing the same
+  database url are sent as a single JOIN statement, when the join conditions
+  and every qual are exact.
+- on PostgreSQL 12 and later, UPDATE and DELETE statements setting constant
+  values are sent as a single remote statement when every qual is exact.
 
 Sort push-down support
 ----------------------
@@ -150,12 +179,13 @@ such as pymysql):
 
 """
 
-from . import ForeignDataWrapper, TableDefinition, ColumnDefinition
+from . import (ForeignDataWrapper, TableDefinition, ColumnDefinition,
+               BoolQual)
 from .utils import log_to_postgres, ERROR, WARNING, DEBUG
 from sqlalchemy import create_engine
 from sqlalchemy.engine.url import make_url, URL
-from sqlalchemy.sql import select, operators as sqlops, and_
-from sqlalchemy.sql.expression import nullsfirst, nullslast
+from sqlalchemy.sql import select, operators as sqlops, and_, or_, func
+from sqlalchemy.sql.expression import nullsfirst, nullslast, literal_column
 
 # Handle the sqlalchemy 0.8 / 0.9 changes
 try:
@@ -224,6 +254,23 @@ OPERATORS = {
     ('<>', False): not_(sqlops.in_op)
 }
 
+#: The quals which the remote database evaluates like PostgreSQL, on the
+#: columns of the EXACT_TYPES types. Text comparisons depend on the collation
+#: of each database, and LIKE on its own rules.
+EXACT_OPERATORS = ('=', '<', '>', '<=', '>=', '<>', ('=', True),
+                   ('<>', False))
+
+EXACT_TYPES = ('smallint', 'integer', 'bigint', 'numeric', 'real',
+               'double precision', 'date', 'boolean')
+
+AGGREGATES = {
+    'count': func.count,
+    'sum': func.sum,
+    'avg': func.avg,
+    'min': func.min,
+    'max': func.max
+}
+
 def basic_converter(new_type):
     def converter(c):
         old_args = c.type.__dict__
@@ -273,6 +320,8 @@ class SqlAlchemyFdw(ForeignDataWrapper):
 
     """
 
+    _bool_quals = True
+
     def __init__(self, fdw_options, fdw_columns):
         super(SqlAlchemyFdw, self).__init__(fdw_options, fdw_columns)
         if 'tablename' not in fdw_options:
@@ -291,6 +340,14 @@ class SqlAlchemyFdw(ForeignDataWrapper):
         self.transaction = None
         self._connection = None
         self._row_id_column = fdw_options.get('primary_key', None)
+        self._partition_column = fdw_options.get('partition_column', None)
+        self._partitions = int(fdw_options.get('partitions', 4))
+        self._parallel_safe = self._partition_column is not None
+        self._exact_quals = fdw_options.get('exact_quals') == 'true'
+        self._exact_columns = set(
+            col.column_name for col in fdw_columns.values()
+            if re.sub(r'\(.*\)', '', col.type_name) in EXACT_TYPES)
+        self._stats = None
 
 
 
@@ -321,25 +378,170 @@ class SqlAlchemyFdw(ForeignDataWrapper):
             return []
         return sortkeys
 
-    def explain(self, quals, columns, sortkeys=None, verbose=False):
+    def _is_exact(self, operator, column):
+        """Whether the remote database applies the operator to the column
+        with the same results as PostgreSQL, unless told otherwise."""
+        if self._exact_quals:
+            return operator in OPERATORS
+        return operator in EXACT_OPERATORS and column in self._exact_columns
+
+    def can_limit(self, quals, limit, offset):
+        # Every qual must be applied remotely for the limit to be correct.
+        return len(self.exact_quals(quals)) == len(quals)
+
+    def exact_quals(self, quals):
+        return [qual for qual in quals
+                if self._is_exact(qual.operator, qual.field_name)]
+
+    def can_aggregate(self, group_by, aggregates, quals):
+        # The remote database may group and order text differently.
+        return (len(self.exact_quals(quals)) == len(quals) and
+                all(column in self._exact_columns for column in group_by) and
+                all(aggregate.function in AGGREGATES and
+                    (aggregate.function not in ('min', 'max') or
+                     aggregate.attname in self._exact_columns)
+                    for aggregate in aggregates))
+
+    def can_join(self, inner, join_type, clauses, outer_quals, inner_quals):
+        # Both tables must live in the same remote database.
+        return (isinstance(inner, SqlAlchemyFdw) and
+                str(inner.engine.url) == str(self.engine.url) and
+                all(self._is_exact(clause.operator, clause.outer_column) and
+                    inner._is_exact(clause.operator, clause.inner_column)
+                    for clause in clauses) and
+                len(self.exact_quals(outer_quals)) == len(outer_quals) and
+                len(inner.exact_quals(inner_quals)) == len(inner_quals))
+
+    def get_scan_partitions(self, quals, columns):
+        if self._partition_column is None:
+            return None
+        return list(range(self._partitions))
+
+    def explain(self, quals, columns, sortkeys=None, verbose=False,
+                limit=None, offset=None, group_by=None, aggregates=None,
+                bool_quals=None):
         sortkeys = sortkeys or []
-        statement = self._build_statement(quals, columns, sortkeys)
+        statement = self._build_statement(quals, columns, sortkeys,
+                                          limit=limit, offset=offset,
+                                          group_by=group_by,
+                                          aggregates=aggregates,
+                                          bool_quals=bool_quals)
         return [str(statement)]
 
-    def _build_statement(self, quals, columns, sortkeys):
-        statement = select([self.table])
+    def _aggregate_column(self, aggregate):
+        function = AGGREGATES[aggregate.function]
+        if aggregate.attname is None:
+            # count(*)
+            return function()
+        return function(self.table.c[aggregate.attname])
+
+    def _where_clauses(self, table, quals):
         clauses = []
         for qual in quals:
             operator = OPERATORS.get(qual.operator, None)
             if operator:
-                clauses.append(operator(self.table.c[qual.field_name],
+                clauses.append(operator(table.c[qual.field_name],
                                         qual.value))
             else:
                 log_to_postgres('Qual not pushed to foreign db: %s' % qual,
                                 WARNING)
+        return clauses
+
+    def _bool_clause(self, table, bool_qual):
+        """Translate a tree of quals, or return None if one of its
+        operators cannot be pushed."""
+        clauses = []
+        for qual in bool_qual.quals:
+            if isinstance(qual, BoolQual):
+                clause = self._bool_clause(table, qual)
+            elif qual.operator in OPERATORS:
+                clause = OPERATORS[qual.operator](table.c[qual.field_name],
+                                                  qual.value)
+            else:
+                clause = None
+            if clause is None:
+                return None
+            clauses.append(clause)
+        if bool_qual.operator == 'and':
+            return and_(*clauses)
+        elif bool_qual.operator == 'or':
+            return or_(*clauses)
+        return ~clauses[0]
+
+    def _filtered_table(self, table, quals):
+        """Returns a selectable restricted to the rows matching the quals,
+        before joining it."""
+        clauses = self._where_clauses(table, quals)
+        if clauses:
+            return select([table]).where(and_(*clauses)).alias()
+        return table.alias()
+
+    def _build_join_statement(self, inner, join_type, clauses, outer_quals,
+                              inner_quals, outer_columns, inner_columns):
+        outer_table = self._filtered_table(self.table, outer_quals)
+        inner_table = self._filtered_table(inner.table, inner_quals)
+        onclause = and_(*[
+            OPERATORS[clause.operator](outer_table.c[clause.outer_column],
+                                       inner_table.c[clause.inner_column])
+            for clause in clauses])
+        if join_type == 'right':
+            joined = inner_table.join(outer_table, onclause, isouter=True)
+        else:
+            joined = outer_table.join(inner_table, onclause,
+                                      isouter=join_type != 'inner',
+                                      full=join_type == 'full')
+        columns = ([outer_table.c[col] for col in outer_columns] +
+                   [inner_table.c[col] for col in inner_columns])
+        if not columns:
+            columns = [literal_column('1')]
+        return select(columns).select_from(joined)
+
+    def explain_join(self, inner, join_type, clauses, outer_quals,
+                     inner_quals, outer_columns, inner_columns,
+                     verbose=False):
+        statement = self._build_join_statement(
+            inner, join_type, clauses, outer_quals, inner_quals,
+            outer_columns, inner_columns)
+        return [str(statement)]
+
+    def execute_join(self, inner, join_type, clauses, outer_quals,
+                     inner_quals, outer_columns, inner_columns):
+        statement = self._build_join_statement(
+            inner, join_type, clauses, outer_quals, inner_quals,
+            outer_columns, inner_columns)
+        log_to_postgres(str(statement), DEBUG)
+        return self._fetch(statement, self._reset_stats(outer_quals +
+                                                        inner_quals), tuple)
+
+    def _build_statement(self, quals, columns, sortkeys, partition=None,
+                         limit=None, offset=None, group_by=None,
+                         aggregates=None, bool_quals=None):
+        statement = select([self.table])
+        clauses = self._where_clauses(self.table, quals)
+        for bool_qual in bool_quals or []:
+            clause = self._bool_clause(self.table, bool_qual)
+            if clause is not None:
+                clauses.append(clause)
+            else:
+                log_to_postgres('Qual not pushed to foreign db: %s' %
+                                bool_qual, WARNING)
+        if partition is not None:
+            column = self.table.c[self._partition_column]
+            clause = ((column % self._partitions + self._partitions) %
+                      self._partitions == partition)
+            if partition == 0:
+                # The modulo of a null value is null: the first partition
+                # also fetches those rows.
+                clause = or_(clause, column.is_(None))
+            clauses.append(clause)
         if clauses:
             statement = statement.where(and_(*clauses))
-        if columns:
+        if aggregates is not None:
+            group_by = [self.table.c[col] for col in group_by]
+            columns = group_by + [self._aggregate_column(aggregate)
+                                  for aggregate in aggregates]
+            statement = statement.group_by(*group_by)
+        elif columns:
             columns = [self.table.c[col] for col in columns]
         else:
             columns = self.table.c
@@ -355,16 +557,33 @@ class SqlAlchemyFdw(ForeignDataWrapper):
             if null_ordering:
                 column = null_ordering(column)
             statement = statement.order_by(column)
+        if limit is not None:
+            statement = statement.limit(limit)
+        if offset is not None:
+            statement = statement.offset(offset)
         return statement
 
 
-    def execute(self, quals, columns, sortkeys=None):
+    def execute(self, quals, columns, sortkeys=None, partition=None,
+                limit=None, offset=None, group_by=None, aggregates=None,
+                bool_quals=None):
         """
-        The quals are turned into an and'ed where clause.
+        The quals and the trees of quals are turned into an and'ed where
+        clause.
         """
         sortkeys = sortkeys or []
-        statement = self._build_statement(quals, columns, sortkeys)
+        statement = self._build_statement(quals, columns, sortkeys,
+                                          partition=partition,
+                                          limit=limit, offset=offset,
+                                          group_by=group_by,
+                                          aggregates=aggregates,
+                                          bool_quals=bool_quals)
         log_to_postgres(str(statement), DEBUG)
+        # Grouped rows are returned in the statement columns order.
+        return self._fetch(statement, self._reset_stats(quals),
+                           dict if aggregates is None else tuple)
+
+    def _fetch(self, statement, stats, row_type):
         rs = (self.connection
               .execution_options(stream_results=True)
               .execute(statement))
@@ -374,7 +593,21 @@ class SqlAlchemyFdw(ForeignDataWrapper):
             rs = list(rs)
 
         for item in rs:
-            yield dict(item)
+            stats['Remote Rows'] += 1
+            yield row_type(item)
+
+    def _reset_stats(self, quals):
+        """Start the counters of a new scan, and return them: they are
+        distinct from those of the other scans of the table, which may be
+        running at the same time."""
+        pushed = sum(1 for qual in quals if qual.operator in OPERATORS)
+        self._stats = {'Remote Rows': 0,
+                       'Pushed Quals': pushed,
+                       'Local Quals': len(quals) - pushed}
+        return self._stats
+
+    def scan_stats(self):
+        return self._stats
 
     @property
     def connection(self):
@@ -412,6 +645,10 @@ class SqlAlchemyFdw(ForeignDataWrapper):
     def insert(self, values):
         self.connection.execute(self.table.insert(values=values))
 
+    def bulk_insert(self, rows):
+        # A single executemany round trip for the whole batch.
+        self.connection.execute(self.table.insert(), rows)
+
     def update(self, rowid, newvalues):
         self.connection.execute(
             self.table.update()
@@ -423,6 +660,22 @@ class SqlAlchemyFdw(ForeignDataWrapper):
             self.table.delete()
             .where(self.table.c[self._row_id_column] == rowid))
 
+    def can_modify_directly(self, operation, quals, assignments):
+        return len(self.exact_quals(quals)) == len(quals)
+
+    def _modify_directly(self, statement, quals):
+        clauses = self._where_clauses(self.table, quals)
+        if clauses:
+            statement = statement.where(and_(*clauses))
+        return self.connection.execute(statement).rowcount
+
+    def update_where(self, quals, assignments):
+        return self._modify_directly(self.table.update().values(assignments),
+                                     quals)
+
+    def delete_where(self, quals):
+        return self._modify_directly(self.table.delete(), quals)
+
     def _get_column_type(self, format_type):
         """Blatant ripoff from PG_Dialect.get_column_info"""
         # strip (*) from character varying(5), timestamp(5)
@@ -0,0 +1,157 @@
+# coding: utf8
+
+"""
+
+Tests for the result cache.
+
+"""
+
+
+import os
+import shutil
+import tempfile
+
+from . import resultcache
+from .resultcache import CachedExecute, invalidate
+
+
+class Clock(object):
+    """Replaces the time module of the result cache."""
+
+    def __init__(self):
+        self.now = 1000.
+
+    def time(self):
+        return self.now
+
+
+class Wrapper(object):
+    """Counts the calls to its execute method."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def execute(self, quals, columns, **kwargs):
+        self.calls += 1
+        return iter(self.rows)
+
+
+def with_cache(function):
+    def wrapper():
+        directory = tempfile.mkdtemp()
+        cache_path = resultcache.CACHE_PATH
+        time_module = resultcache.time
+        resultcache.CACHE_PATH = os.path.join(directory, 'results.db')
+        resultcache.time = Clock()
+        resultcache._connection = None
+        resultcache._accessed.clear()
+        try:
+            return function(resultcache.time)
+        finally:
+            resultcache._connection.close()
+            resultcache._connection = None
+            resultcache._accessed.clear()
+            resultcache.time = time_module
+            resultcache.CACHE_PATH = cache_path
+            shutil.rmtree(directory)
+    wrapper.__doc__ = function.__doc__
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+
+@with_cache
+def test_hit(clock):
+    """
+    The same scan is only executed once.
+    """
+    wrapper = Wrapper([{'a': 1}, {'a': 2}])
+    cached = CachedExecute(wrapper.execute, 1, 2, 3, 60, 10)
+    assert cached([], ['a']) == [{'a': 1}, {'a': 2}]
+    assert cached([], ['a']) == [{'a': 1}, {'a': 2}]
+    assert wrapper.calls == 1
+    # Other columns, or another user
+    cached([], ['a', 'b'])
+    assert wrapper.calls == 2
+    CachedExecute(wrapper.execute, 1, 2, 4, 60, 10)([], ['a'])
+    assert wrapper.calls == 3
+
+
+@with_cache
+def test_databases(clock):
+    """
+    Foreign tables with the same oid in other databases do not share their
+    results.
+    """
+    wrapper = Wrapper([{'a': 1}])
+    CachedExecute(wrapper.execute, 1, 2, 3, 60, 10)([], ['a'])
+    CachedExecute(wrapper.execute, 5, 2, 3, 60, 10)([], ['a'])
+    assert wrapper.calls == 2
+    CachedExecute(wrapper.execute, 5, 2, 3, 60, 10)([], ['a'])
+    assert wrapper.calls == 2
+
+
+@with_cache
+def test_expiry(clock):
+    """
+    Results are executed again once expired.
+    """
+    wrapper = Wrapper([{'a': 1}])
+    cached = CachedExecute(wrapper.execute, 1, 2, 3, 60, 10)
+    cached([], ['a'])
+    clock.now += 59
+    cached([], ['a'])
+    assert wrapper.calls == 1
+    clock.now += 1
+    cached([], ['a'])
+    assert wrapper.calls == 2
+
+
+@with_cache
+def test_eviction(clock):
+    """
+    The least recently used results of a table are evicted when the results
+    exceed the size of its cache.
+    """
+    wrapper = Wrapper([{'a': 'x' * 400}])
+    cached = CachedExecute(wrapper.execute, 1, 2, 3, 60, 1)
+    cached(['first'], ['a'])
+    clock.now += 1
+    cached(['second'], ['a'])
+    clock.now += 1
+    # Reading the first results makes the second ones the least recently
+    # used.
+    cached(['first'], ['a'])
+    assert wrapper.calls == 2
+    clock.now += 1
+    cached(['third'], ['a'])
+    assert wrapper.calls == 3
+    cached(['first'], ['a'])
+    cached(['third'], ['a'])
+    assert wrapper.calls == 3
+    cached(['second'], ['a'])
+    assert wrapper.calls == 4
+    # Results larger than the cache are not stored.
+    big = Wrapper([{'a': 'x' * 2000}])
+    cached = CachedExecute(big.execute, 1, 2, 3, 60, 1)
+    cached([], ['a'])
+    cached([], ['a'])
+    assert big.calls == 2
+
+
+@with_cache
+def test_invalidation(clock):
+    """
+    Invalidating a table drops its results in its database only.
+    """
+    wrapper = Wrapper([{'a': 1}])
+    first = CachedExecute(wrapper.execute, 1, 2, 3, 60, 10)
+    other_table = CachedExecute(wrapper.execute, 1, 4, 3, 60, 10)
+    other_database = CachedExecute(wrapper.execute, 5, 2, 3, 60, 10)
+    for cached in (first, other_table, other_database):
+        cached([], ['a'])
+    assert wrapper.calls == 3
+    invalidate(1, 2)
+    for cached in (first, other_table, other_database):
+        cached([], ['a'])
+    assert wrapper.calls == 4
@@ -2,9 +2,11 @@
 from multicorn import ForeignDataWrapper, TableDefinition, ColumnDefinition
 from multicorn.compat import unicode_
 from .utils import log_to_postgres, WARNING, ERROR
-from itertools import cycle
+from array import array
+from itertools import cycle, islice
 from datetime import datetime
 from operator import itemgetter
+import os
 
 
 class TestForeignDataWrapper(ForeignDataWrapper):
@@ -17,6 +19,7 @@ class TestForeignDataWrapper(ForeignDataWrapper):
         self.test_type = options.get('test_type', None)
         self.test_subtype = options.get('test_subtype', None)
         self.tx_hook = options.get('tx_hook', False)
+        self._stats = None
         self._row_id_column = options.get('row_id_column',
                                           list(self.columns.keys())[0])
         log_to_postgres(str(sorted(options.items())))
@@ -26,6 +29,14 @@ class TestForeignDataWrapper(ForeignDataWrapper):
             if column.options:
                 log_to_postgres('Column %s options: %s' %
                                 (column.column_name, column.options))
+        if self.test_subtype in ('batch', 'columnar'):
+            self._batch_results = True
+        if self.test_subtype == 'async':
+            self._async_capable = True
+        if self.test_subtype == 'bool_quals':
+            self._bool_quals = True
+        if 'param_cache_rows' in options:
+            self._param_cache_rows = int(options['param_cache_rows'])
         if self.test_type == 'logger':
             log_to_postgres("An error is about to occur", WARNING)
             log_to_postgres("An error occured", ERROR)
@@ -60,7 +71,10 @@ class TestForeignDataWrapper(ForeignDataWrapper):
                                                      next(random_thing), 14,
                                                      30, 25)
                     elif self.test_type == 'int':
-                        line[column_name] = index
+                        if column.type_name == 'boolean':
+                            line[column_name] = index % 2 == 0
+                        else:
+                            line[column_name] = index
                     elif self.test_type == 'encoding':
                         line[column_name] = (b'\xc3\xa9\xc3\xa0\xc2\xa4'
                                              .decode('utf-8'))
@@ -77,32 +91,116 @@ class TestForeignDataWrapper(ForeignDataWrapper):
                                                           index)
             yield line
 
-    def execute(self, quals, columns, sortkeys=None):
+    def execute(self, quals, columns, sortkeys=None, limit=None, offset=None,
+                group_by=None, aggregates=None, bool_quals=None):
         sortkeys = sortkeys or []
         log_to_postgres(str(sorted(quals)))
         log_to_postgres(str(sorted(columns)))
+        if bool_quals is not None:
+            log_to_postgres('bool quals: %s' % bool_quals)
         if (len(sortkeys)) > 0:
             log_to_postgres("requested sort(s): ")
             for k in sortkeys:
                 log_to_postgres(k)
+        if aggregates is not None:
+            message = 'aggregates: %s' % ', '.join(
+                '%s(%s)' % (aggregate.function, aggregate.attname or '*')
+                for aggregate in aggregates)
+            if group_by:
+                message += ' group by %s' % ', '.join(group_by)
+            log_to_postgres(message)
+        if limit is not None or offset is not None:
+            log_to_postgres('limit: %s, offset: %s' % (limit, offset))
+        self._stats = {'Executed Scans': 1, 'Generated Rows': 0,
+                       'Test Type': self.test_type}
         if self.test_type == 'None':
             return None
         elif self.test_type == 'iter_none':
             return [None, None]
         else:
+            res = self._count_rows(self._as_generator(quals, columns),
+                                   self._stats)
+            if self.test_subtype == 'exact':
+                exact = self.exact_quals(quals)
+                res = (line for line in res
+                       if all(line[qual.field_name] == qual.value
+                              for qual in exact))
+            if aggregates is not None:
+                res = self._aggregate(res, group_by, aggregates)
             if (len(sortkeys) > 0):
                 # testfdw don't have tables with more than 2 fields, without
                 # duplicates, so we only need to worry about sorting on 1st
                 # asked column
                 k = sortkeys[0];
-                res = self._as_generator(quals, columns)
                 if (self.test_type == 'sequence'):
-                    return sorted(res, key=itemgetter(k.attnum - 1),
-                                  reverse=k.is_reversed)
+                    res = sorted(res, key=itemgetter(k.attnum - 1),
+                                 reverse=k.is_reversed)
                 else:
-                    return sorted(res, key=itemgetter(k.attname),
-                                  reverse=k.is_reversed)
-            return self._as_generator(quals, columns)
+                    res = sorted(res, key=itemgetter(k.attname),
+                                 reverse=k.is_reversed)
+            if limit is not None or offset is not None:
+                start = offset or 0
+                end = start + limit if limit is not None else None
+                res = islice(res, start, end)
+            if self._batch_results:
+                return self._as_batches(res)
+            return res
+
+    def execute_async(self, quals, columns, sortkeys=None, **kwargs):
+        return AsyncResult(self.execute(quals, columns, sortkeys, **kwargs))
+
+    def _count_rows(self, rows, stats):
+        for row in rows:
+            stats['Generated Rows'] += 1
+            yield row
+
+    def scan_stats(self):
+        return self._stats
+
+    def _aggregate(self, rows, group_by, aggregates):
+        groups = {}
+        for row in rows:
+            key = tuple(row[column_name] for column_name in group_by)
+            groups.setdefault(key, []).append(row)
+        if not groups and not group_by:
+            groups[()] = []
+        for key, group in groups.items():
+            line = list(key)
+            for aggregate in aggregates:
+                if aggregate.attname is None:
+                    line.append(len(group))
+                    continue
+                values = [row[aggregate.attname] for row in group
+                          if row[aggregate.attname] is not None]
+                if aggregate.function == 'count':
+                    line.append(len(values))
+                elif values:
+                    function = min if aggregate.function == 'min' else max
+                    line.append(function(values))
+                else:
+                    line.append(None)
+            yield line
+
+    def _as_batches(self, rows, size=7):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == size:
+                yield self._as_batch(batch)
+                batch = []
+        if batch:
+            yield self._as_batch(tuple(batch))
+
+    def _as_batch(self, rows):
+        if self.test_subtype != 'columnar':
+            return rows
+        batch = {}
+        for column_name in self.columns:
+            values = [row[column_name] for row in rows]
+            if self.test_type == 'int':
+                values = array('l', values)
+            batch[column_name] = values
+        return batch
 
     def get_rel_size(self, quals, columns):
         if self.test_type == 'planner':
@@ -118,6 +216,49 @@ class TestForeignDataWrapper(ForeignDataWrapper):
         # assume sort pushdown ok for all cols, in any order, any collation
         return sortkeys
 
+    def can_aggregate(self, group_by, aggregates, quals):
+        # Rows are not filtered by this fdw.
+        return (not quals and self.test_type != 'sequence' and
+                self.test_subtype != 'columnar' and
+                all(aggregate.function in ('count', 'min', 'max')
+                    for aggregate in aggregates))
+
+    def can_join(self, inner, join_type, clauses, outer_quals, inner_quals):
+        # Rows are not filtered by this fdw.
+        return (isinstance(inner, TestForeignDataWrapper) and
+                not outer_quals and not inner_quals and
+                'sequence' not in (self.test_type, inner.test_type) and
+                join_type in ('inner', 'left') and
+                all(clause.operator == '=' for clause in clauses))
+
+    def execute_join(self, inner, join_type, clauses, outer_quals,
+                     inner_quals, outer_columns, inner_columns):
+        log_to_postgres('%s join on %s' % (join_type, clauses))
+        log_to_postgres(str(outer_columns))
+        log_to_postgres(str(inner_columns))
+        inner_rows = list(inner._as_generator(inner_quals, inner_columns))
+        for outer_row in self._as_generator(outer_quals, outer_columns):
+            values = [outer_row[column_name] for column_name in outer_columns]
+            matched = False
+            for inner_row in inner_rows:
+                if all(outer_row[clause.outer_column] ==
+                       inner_row[clause.inner_column] for clause in clauses):
+                    matched = True
+                    yield values + [inner_row[column_name]
+                                    for column_name in inner_columns]
+            if not matched and join_type == 'left':
+                yield values + [None] * len(inner_columns)
+
+    def can_limit(self, quals, limit, offset):
+        # Rows are not filtered by this fdw.
+        return not quals
+
+    def exact_quals(self, quals):
+        if self.test_subtype == 'exact':
+            return [qual for qual in quals
+                    if qual.field_name == 'test1' and qual.operator == '=']
+        return []
+
     def update(self, rowid, newvalues):
         if self.test_type == 'nowrite':
             super(TestForeignDataWrapper, self).update(rowid, newvalues)
@@ -142,6 +283,10 @@ class TestForeignDataWrapper(ForeignDataWrapper):
                 values[key] = "INSERTED: %s" % values.get(key, None)
             return values
 
+    def bulk_insert(self, rows):
+        log_to_postgres("BULK INSERTING: %s rows" % len(rows))
+        super(TestForeignDataWrapper, self).bulk_insert(rows)
+
     @property
     def rowid_column(self):
         return self._row_id_column
@@ -198,3 +343,43 @@ class TestForeignDataWrapper(ForeignDataWrapper):
                                      options={"option1": "value1"}))
             rv.append(table)
         return rv
+
+
+class AsyncResult(object):
+    """Rows of an async scan, signaled through a pipe.
+
+    Every other call to fetch finds no rows, so that PostgreSQL has to wait
+    on the file descriptor before getting the next ones.
+    """
+
+    def __init__(self, rows, size=7):
+        self._rows = iter(rows or [])
+        self._size = size
+        self._pending = False
+        self._read, self._write = os.pipe()
+        os.write(self._write, b'.')
+
+    def fileno(self):
+        return self._read
+
+    def fetch(self):
+        os.read(self._read, 1)
+        self._pending = not self._pending
+        if self._pending:
+            os.write(self._write, b'.')
+            return []
+        rows = list(islice(self._rows, self._size))
+        if not rows:
+            self.close()
+            return None
+        os.write(self._write, b'.')
+        return rows
+
+    def close(self):
+        if self._read is not None:
+            os.close(self._read)
+            os.close(self._write)
+            self._read = self._write = None
+
+    def __del__(self):
+        self.close()
@@ -11,3 +11,42 @@ LANGUAGE C STRICT;
 
 CREATE FOREIGN DATA WRAPPER multicorn
 VALIDATOR multicorn_validator HANDLER multicorn_handler;
+
+-- cumulative statistics of the foreign tables, collected when multicorn is
+-- in shared_preload_libraries
+CREATE OR REPLACE FUNCTION multicorn_stat_foreign_tables (
+    OUT dbid oid,
+    OUT foreigntableid oid,
+    OUT scans bigint,
+    OUT rows bigint,
+    OUT total_python_time double precision,
+    OUT max_python_time double precision,
+    OUT planner_calls bigint,
+    OUT insert_calls bigint,
+    OUT update_calls bigint,
+    OUT delete_calls bigint,
+    OUT xact_calls bigint
+)
+RETURNS SETOF record
+AS 'MODULE_PATHNAME'
+LANGUAGE C STRICT VOLATILE;
+
+CREATE OR REPLACE FUNCTION multicorn_stat_reset ()
+RETURNS void
+AS 'MODULE_PATHNAME'
+LANGUAGE C STRICT;
+
+REVOKE ALL ON FUNCTION multicorn_stat_reset () FROM PUBLIC;
+
+CREATE VIEW multicorn_stat_foreign_tables AS
+  SELECT s.foreigntableid AS relid, n.nspname AS schemaname, c.relname,
+         srv.srvname AS servername, s.scans, s.rows, s.total_python_time,
+         s.max_python_time, s.planner_calls, s.insert_calls, s.update_calls,
+         s.delete_calls, s.xact_calls
+    FROM multicorn_stat_foreign_tables() s
+    JOIN pg_database d ON d.oid = s.dbid
+    JOIN pg_class c ON c.oid = s.foreigntableid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_foreign_table ft ON ft.ftrelid = c.oid
+    JOIN pg_foreign_server srv ON srv.oid = ft.ftserver
+   WHERE d.datname = current_database();
@@ -14,19 +14,42 @@
 #include "optimizer/clauses.h"
 #if PG_VERSION_NUM < 120000
 #include "optimizer/var.h"
+#else
+#include "optimizer/optimizer.h"
+#include "access/table.h"
+#endif
+#if PG_VERSION_NUM >= 140000
+#include "optimizer/appendinfo.h"
+#include "executor/execAsync.h"
+#include "pgstat.h"
+#include "storage/latch.h"
 #endif
+#include "optimizer/tlist.h"
 #include "access/reloptions.h"
 #include "access/relscan.h"
 #include "access/sysattr.h"
 #include "access/xact.h"
 #include "nodes/makefuncs.h"
 #include "catalog/pg_type.h"
+#include "catalog/pg_aggregate.h"
+#include "catalog/pg_namespace.h"
+#include "commands/vacuum.h"
+#include "utils/guc.h"
+#include "utils/inval.h"
 #include "utils/memutils.h"
 #include "miscadmin.h"
 #include "utils/lsyscache.h"
 #include "utils/rel.h"
 #include "parser/parsetree.h"
 #include "fmgr.h"
+#include "utils/selfuncs.h"
+#if PG_VERSION_NUM >= 90500
+#include "utils/sampling.h"
+#endif
+#if PG_VERSION_NUM >= 90600
+#include "access/parallel.h"
+#include "optimizer/cost.h"
+#endif
 
 
 PG_MODULE_MAGIC;
@@ -91,6 +114,20 @@ static TupleTableSlot *multicornExecForeignDelete(EState *estate, ResultRelInfo
 static TupleTableSlot *multicornExecForeignUpdate(EState *estate, ResultRelInfo *resultRelInfo,
 						   TupleTableSlot *slot, TupleTableSlot *planSlot);
 static void multicornEndForeignModify(EState *estate, ResultRelInfo *resultRelInfo);
+#if PG_VERSION_NUM >= 110000
+static void multicornBeginForeignInsert(ModifyTableState *mtstate,
+							ResultRelInfo *resultRelInfo);
+static void multicornEndForeignInsert(EState *estate,
+						  ResultRelInfo *resultRelInfo);
+#endif
+#if PG_VERSION_NUM >= 140000
+static int	multicornGetForeignModifyBatchSize(ResultRelInfo *resultRelInfo);
+static TupleTableSlot **multicornExecForeignBatchInsert(EState *estate,
+								ResultRelInfo *resultRelInfo,
+								TupleTableSlot **slots,
+								TupleTableSlot **planSlots,
+								int *numSlots);
+#endif
 
 static void multicorn_subxact_callback(SubXactEvent event, SubTransactionId mySubid,
 						   SubTransactionId parentSubid, void *arg);
@@ -99,17 +136,153 @@ static void multicorn_subxact_callback(SubXactEvent event, SubTransactionId mySu
 #if PG_VERSION_NUM >= 90500
 static List *multicornImportForeignSchema(ImportForeignSchemaStmt * stmt,
 							 Oid serverOid);
+static bool multicornAnalyzeForeignTable(Relation relation,
+							 AcquireSampleRowsFunc *func,
+							 BlockNumber *totalpages);
+static int multicornAcquireSampleRows(Relation relation, int elevel,
+						   HeapTuple *rows, int targrows,
+						   double *totalrows,
+						   double *totaldeadrows);
+#endif
+
+#if PG_VERSION_NUM >= 90600
+static bool multicornIsForeignScanParallelSafe(PlannerInfo *root,
+								   RelOptInfo *rel,
+								   RangeTblEntry *rte);
+static Size multicornEstimateDSMForeignScan(ForeignScanState *node,
+								ParallelContext *pcxt);
+static void multicornInitializeDSMForeignScan(ForeignScanState *node,
+								  ParallelContext *pcxt,
+								  void *coordinate);
+static void multicornInitializeWorkerForeignScan(ForeignScanState *node,
+									 shm_toc *toc,
+									 void *coordinate);
+#endif
+#if PG_VERSION_NUM >= 100000
+static void multicornReInitializeDSMForeignScan(ForeignScanState *node,
+									ParallelContext *pcxt,
+									void *coordinate);
+#endif
+
+#if PG_VERSION_NUM >= 120000
+static void multicornGetForeignUpperPaths(PlannerInfo *root,
+							  UpperRelationKind stage,
+							  RelOptInfo *input_rel,
+							  RelOptInfo *output_rel,
+							  void *extra);
+static void multicornAddFinalPaths(PlannerInfo *root,
+					   RelOptInfo *input_rel,
+					   RelOptInfo *output_rel,
+					   FinalPathExtraData *extra);
+static void multicornAddGroupingPaths(PlannerInfo *root,
+						  RelOptInfo *input_rel,
+						  RelOptInfo *output_rel);
+static void multicornGetForeignJoinPaths(PlannerInfo *root,
+							 RelOptInfo *joinrel,
+							 RelOptInfo *outerrel,
+							 RelOptInfo *innerrel,
+							 JoinType jointype,
+							 JoinPathExtraData *extra);
+static bool multicornPlanDirectModify(PlannerInfo *root,
+						  ModifyTable *plan,
+						  Index resultRelation,
+						  int subplan_index);
+static void multicornBeginDirectModify(ForeignScanState *node, int eflags);
+static TupleTableSlot *multicornIterateDirectModify(ForeignScanState *node);
+static void multicornEndDirectModify(ForeignScanState *node);
+#endif
+
+#if PG_VERSION_NUM >= 140000
+static bool multicornIsForeignPathAsyncCapable(ForeignPath *path);
+static void multicornForeignAsyncRequest(AsyncRequest *areq);
+static void multicornForeignAsyncConfigureWait(AsyncRequest *areq);
+static void multicornForeignAsyncNotify(AsyncRequest *areq);
 #endif
 
 static void multicorn_xact_callback(XactEvent event, void *arg);
+static void multicorn_relcache_callback(Datum arg, Oid relid);
+static void multicorn_syscache_callback(Datum arg, int cacheid,
+							uint32 hashvalue);
 
 /*	Helpers functions */
 void	   *serializePlanState(MulticornPlanState * planstate);
 MulticornExecState *initializeExecState(void *internal_plan_state);
+static int	getIntegerOption(Oid foreigntableid, const char *name,
+				 int default_value);
+static void invalidateResultCache(Oid foreigntableid);
 
 /* Hash table mapping oid to fdw instances */
 HTAB	   *InstancesHash;
 
+/* Comma-separated wrapper classes to import when loading the library */
+static char *multicorn_preload_wrappers = NULL;
+
+/* Scans and modifications taking longer, in milliseconds, are logged */
+static int	multicorn_log_min_duration = -1;
+
+
+/*
+ * Import the classes listed in multicorn.preload_wrappers, with their
+ * dependencies. When the library is in shared_preload_libraries, this is
+ * done once in the postmaster instead of on the first query of each
+ * backend.
+ *
+ * A class which cannot be imported only raises a warning, so that a typo
+ * does not prevent the server from starting.
+ */
+static void
+preloadWrappers(void)
+{
+	char	   *classNames,
+			   *className;
+	MemoryContext context = CurrentMemoryContext;
+
+	if (multicorn_preload_wrappers == NULL || multicorn_preload_wrappers[0] == '\0')
+	{
+		return;
+	}
+	classNames = pstrdup(multicorn_preload_wrappers);
+	for (className = strtok(classNames, ", "); className != NULL;
+		 className = strtok(NULL, ", "))
+	{
+		PG_TRY();
+		{
+			Py_DECREF(getClassString(className));
+		}
+		PG_CATCH();
+		{
+			ErrorData  *edata;
+
+			MemoryContextSwitchTo(context);
+			edata = CopyErrorData();
+			FlushErrorState();
+			ereport(WARNING, (errmsg("could not preload the wrapper \"%s\"",
+									 className),
+							  errdetail("%s", edata->message)));
+			FreeErrorData(edata);
+		}
+		PG_END_TRY();
+	}
+	pfree(classNames);
+	if (process_shared_preload_libraries_in_progress)
+	{
+		/*
+		 * Keep the garbage collector from touching the imported objects, so
+		 * that their memory stays shared with the backends.
+		 */
+		PyObject   *p_gc = PyImport_ImportModule("gc"),
+				   *p_result = NULL;
+
+		if (p_gc != NULL && PyObject_HasAttrString(p_gc, "freeze"))
+		{
+			p_result = PyObject_CallMethod(p_gc, "freeze", "()");
+		}
+		Py_XDECREF(p_result);
+		Py_XDECREF(p_gc);
+		PyErr_Clear();
+	}
+}
+
 
 void
 _PG_init()
@@ -148,7 +321,48 @@ _PG_init()
 	InstancesHash = hash_create("multicorn instances", 32,
 								&ctl,
 								HASH_ELEM | HASH_FUNCTION);
+	/* Catalog changes which may make the instances obsolete */
+	CacheRegisterRelcacheCallback(multicorn_relcache_callback, (Datum) 0);
+	CacheRegisterSyscacheCallback(FOREIGNTABLEREL, multicorn_syscache_callback,
+								  (Datum) 0);
+	CacheRegisterSyscacheCallback(FOREIGNSERVEROID, multicorn_syscache_callback,
+								  (Datum) 0);
+	CacheRegisterSyscacheCallback(USERMAPPINGOID, multicorn_syscache_callback,
+								  (Datum) 0);
+	DefineCustomStringVariable("multicorn.preload_wrappers",
+							   "Wrapper classes imported when multicorn is loaded.",
+							   "A comma-separated list of python classes, such as "
+							   "multicorn.sqlalchemyfdw.SqlAlchemyFdw. Add multicorn "
+							   "to shared_preload_libraries to import them before "
+							   "the backends are started.",
+							   &multicorn_preload_wrappers,
+							   "",
+							   PGC_SIGHUP,
+							   0,
+							   NULL,
+							   NULL,
+							   NULL);
+	DefineCustomIntVariable("multicorn.log_min_duration",
+							"Sets the minimum execution time above which "
+							"multicorn scans and modifications are logged.",
+							"Zero logs all of them, -1 disables the logging.",
+							&multicorn_log_min_duration,
+							-1,
+							-1,
+							INT_MAX,
+							PGC_SUSET,
+							GUC_UNIT_MS,
+							NULL,
+							NULL,
+							NULL);
+#if PG_VERSION_NUM >= 150000
+	MarkGUCPrefixReserved("multicorn");
+#else
+	EmitWarningsOnPlaceholders("multicorn");
+#endif
 	MemoryContextSwitchTo(oldctx);
+	initTableStats();
+	preloadWrappers();
 }
 
 void
@@ -185,10 +399,49 @@ multicorn_handler(PG_FUNCTION_ARGS)
 	fdw_routine->ExecForeignDelete = multicornExecForeignDelete;
 	fdw_routine->ExecForeignUpdate = multicornExecForeignUpdate;
 	fdw_routine->EndForeignModify = multicornEndForeignModify;
+#if PG_VERSION_NUM >= 110000
+	fdw_routine->BeginForeignInsert = multicornBeginForeignInsert;
+	fdw_routine->EndForeignInsert = multicornEndForeignInsert;
+#endif
+#if PG_VERSION_NUM >= 140000
+	fdw_routine->GetForeignModifyBatchSize = multicornGetForeignModifyBatchSize;
+	fdw_routine->ExecForeignBatchInsert = multicornExecForeignBatchInsert;
+#endif
 #endif
 
 #if PG_VERSION_NUM >= 90500
 	fdw_routine->ImportForeignSchema = multicornImportForeignSchema;
+	fdw_routine->AnalyzeForeignTable = multicornAnalyzeForeignTable;
+#endif
+
+#if PG_VERSION_NUM >= 90600
+	/* Parallel scans */
+	fdw_routine->IsForeignScanParallelSafe = multicornIsForeignScanParallelSafe;
+	fdw_routine->EstimateDSMForeignScan = multicornEstimateDSMForeignScan;
+	fdw_routine->InitializeDSMForeignScan = multicornInitializeDSMForeignScan;
+	fdw_routine->InitializeWorkerForeignScan = multicornInitializeWorkerForeignScan;
+#endif
+#if PG_VERSION_NUM >= 100000
+	fdw_routine->ReInitializeDSMForeignScan = multicornReInitializeDSMForeignScan;
+#endif
+
+#if PG_VERSION_NUM >= 120000
+	/* Upper relations and joins pushdown */
+	fdw_routine->GetForeignUpperPaths = multicornGetForeignUpperPaths;
+	fdw_routine->GetForeignJoinPaths = multicornGetForeignJoinPaths;
+	/* Direct modification */
+	fdw_routine->PlanDirectModify = multicornPlanDirectModify;
+	fdw_routine->BeginDirectModify = multicornBeginDirectModify;
+	fdw_routine->IterateDirectModify = multicornIterateDirectModify;
+	fdw_routine->EndDirectModify = multicornEndDirectModify;
+#endif
+
+#if PG_VERSION_NUM >= 140000
+	/* Asynchronous scans */
+	fdw_routine->IsForeignPathAsyncCapable = multicornIsForeignPathAsyncCapable;
+	fdw_routine->ForeignAsyncRequest = multicornForeignAsyncRequest;
+	fdw_routine->ForeignAsyncConfigureWait = multicornForeignAsyncConfigureWait;
+	fdw_routine->ForeignAsyncNotify = multicornForeignAsyncNotify;
 #endif
 
 	PG_RETURN_POINTER(fdw_routine);
@@ -221,6 +474,21 @@ multicorn_validator(PG_FUNCTION_ARGS)
 				className = (char *) defGetString(def);
 			}
 		}
+		else if (strcmp(def->defname, "batch_size") == 0 ||
+				 strcmp(def->defname, "cache_ttl") == 0 ||
+				 strcmp(def->defname, "cache_size") == 0)
+		{
+			char	   *value = defGetString(def);
+			char	   *end;
+			long		number = strtol(value, &end, 10);
+
+			if (*end != '\0' || number <= 0 || number > INT_MAX)
+			{
+				ereport(ERROR, (errcode(ERRCODE_INVALID_PARAMETER_VALUE),
+								errmsg("%s requires a positive integer value",
+									   def->defname)));
+			}
+		}
 	}
 	if (catalog == ForeignServerRelationId)
 	{
@@ -251,11 +519,13 @@ multicornGetForeignRelSize(PlannerInfo *root,
 	ForeignTable *ftable = GetForeignTable(foreigntableid);
 	ListCell   *lc;
 	bool		needWholeRow = false;
+	int		   *width;
 	TupleDesc	desc;
 
 	baserel->fdw_private = planstate;
 	planstate->fdw_instance = getInstance(foreigntableid);
 	planstate->foreigntableid = foreigntableid;
+	planstate->limit = -1;
 	/* Initialize the conversion info array */
 	{
 		Relation	rel = RelationIdGetRelation(ftable->relid);
@@ -309,18 +579,38 @@ multicornGetForeignRelSize(PlannerInfo *root,
 		}
 	}
 	/* Extract the restrictions from the plan. */
+	planstate->quals_supported = true;
 	foreach(lc, baserel->baserestrictinfo)
 	{
-		extractRestrictions(baserel->relids, ((RestrictInfo *) lfirst(lc))->clause,
-							&planstate->qual_list);
+		RestrictInfo *rinfo = (RestrictInfo *) lfirst(lc);
+		int			nbquals = list_length(planstate->qual_list);
 
+		extractRestrictions(baserel->relids, rinfo->clause,
+							&planstate->qual_list);
+		if (rinfo->pseudoconstant ||
+			list_length(planstate->qual_list) == nbquals)
+		{
+			planstate->quals_supported = false;
+		}
 	}
-	/* Inject the "rows" and "width" attribute into the baserel */
+	/*
+	 * Inject the "rows" and "width" attribute into the baserel. If the python
+	 * implementation does not estimate them, keep the estimates made by
+	 * PostgreSQL from the statistics gathered by ANALYZE, if any.
+	 */
 #if PG_VERSION_NUM >= 90600
-	getRelSize(planstate, root, &baserel->rows, &baserel->reltarget->width);
-	planstate->width = baserel->reltarget->width;
+	width = &baserel->reltarget->width;
 #else
-	getRelSize(planstate, root, &baserel->rows, &baserel->width);
+	width = &baserel->width;
+#endif
+	if (!getRelSize(planstate, root, &baserel->rows, width) &&
+		baserel->pages == 0)
+	{
+		baserel->rows = 100000000;
+		*width = list_length(planstate->target_list) * 100;
+	}
+#if PG_VERSION_NUM >= 90600
+	planstate->width = *width;
 #endif
 }
 
@@ -370,6 +660,33 @@ multicornGetForeignPaths(PlannerInfo *root,
 #endif
 			NULL));
 
+#if PG_VERSION_NUM >= 90600
+	/*
+	 * Add a partial path, whose partitions will be claimed by the parallel
+	 * workers. The planner only considers parallelism if the python
+	 * implementation declared itself parallel safe.
+	 */
+	if (baserel->consider_parallel && max_parallel_workers_per_gather > 0)
+	{
+		ForeignPath *partial_path;
+		int			parallel_workers = max_parallel_workers_per_gather;
+		double		rows = baserel->rows / (parallel_workers + 1);
+
+		partial_path = create_foreignscan_path(root, baserel,
+											   NULL,	/* default pathtarget */
+											   rows,
+											   planstate->startupCost,
+											   rows * baserel->reltarget->width,
+											   NIL,		/* no pathkeys */
+											   NULL,
+											   NULL,
+											   NULL);
+		partial_path->path.parallel_aware = true;
+		partial_path->path.parallel_workers = parallel_workers;
+		add_partial_path(baserel, (Path *) partial_path);
+	}
+#endif
+
 	/* Handle sort pushdown */
 	if (root->query_pathkeys)
 	{
@@ -434,9 +751,53 @@ multicornGetForeignPlan(PlannerInfo *root,
 	Index		scan_relid = baserel->relid;
 	MulticornPlanState *planstate = (MulticornPlanState *) baserel->fdw_private;
 	ListCell   *lc;
+	List	   *local_clauses;
+#if PG_VERSION_NUM >= 90500
+	List	   *fdw_scan_tlist = NIL;
+	List	   *exact_clauses = NIL;
+#endif
+#if PG_VERSION_NUM >= 120000
+	if (baserel->reloptkind == RELOPT_UPPER_REL)
+	{
+		/*
+		 * A limit pushed down on top of our scan: this is still a plain scan
+		 * on the base relation, which must check its restrictions.
+		 */
+		scan_relid = planstate->scan_relid;
+		scan_clauses = find_base_rel(root, scan_relid)->baserestrictinfo;
+		if (planstate->scan_tlist != NIL)
+		{
+			/*
+			 * An aggregation pushed down: the scan returns the grouped rows.
+			 * The python implementation enforces every restriction, which
+			 * are only carried in the private state to build the quals.
+			 */
+			planstate->base_clauses = extract_actual_clauses(scan_clauses,
+															 false);
+			planstate->numattrs = list_length(planstate->scan_tlist);
+			fdw_scan_tlist = planstate->scan_tlist;
+			scan_relid = 0;
+			scan_clauses = NIL;
+		}
+	}
+	else if (baserel->reloptkind == RELOPT_JOINREL)
+	{
+		/*
+		 * A join pushed down: the scan returns the joined rows, and the
+		 * python implementation enforces every clause.
+		 */
+		planstate->numattrs = list_length(planstate->scan_tlist);
+		fdw_scan_tlist = planstate->scan_tlist;
+		scan_relid = 0;
+		scan_clauses = NIL;
+	}
+	else
+#endif
+	{
 #if PG_VERSION_NUM >= 90600
-	best_path->path.pathtarget->width = planstate->width;
+		best_path->path.pathtarget->width = planstate->width;
 #endif
+	}
 	scan_clauses = extract_actual_clauses(scan_clauses, false);
 	/* Extract the quals coming from a parameterized path, if any */
 	if (best_path->path.param_info)
@@ -449,199 +810,1460 @@ multicornGetForeignPlan(PlannerInfo *root,
 		}
 	}
 	planstate->pathkeys = (List *) best_path->fdw_private;
+	local_clauses = scan_clauses;
+#if PG_VERSION_NUM >= 90500
+	if (scan_relid > 0 && scan_clauses != NIL)
+	{
+		/*
+		 * The clauses enforced by the python implementation are not checked
+		 * on every row, only when rechecking a row locked by a concurrent
+		 * update.
+		 */
+		exact_clauses = exactClauses(planstate,
+									 bms_make_singleton(scan_relid),
+									 scan_clauses);
+		local_clauses = list_difference_ptr(scan_clauses, exact_clauses);
+	}
+#endif
 	return make_foreignscan(tlist,
-							scan_clauses,
+							local_clauses,
 							scan_relid,
 							scan_clauses,		/* no expressions to evaluate */
 							serializePlanState(planstate)
 #if PG_VERSION_NUM >= 90500
-							, NULL
-							, NULL /* All quals are meant to be rechecked */
+							, fdw_scan_tlist
+							, exact_clauses
 							, NULL
 #endif
 							);
 }
 
+#if PG_VERSION_NUM >= 120000
 /*
- * multicornExplainForeignScan
- *		Placeholder for additional "EXPLAIN" information.
- *		This should (at least) output the python class name, as well
- *		as information that was taken into account for the choice of a path.
+ * multicornGetForeignUpperPaths
+ *		Add paths for the post-scan processing steps which can be pushed
+ *		down to the python implementation.
  */
 static void
-multicornExplainForeignScan(ForeignScanState *node, ExplainState *es)
+multicornGetForeignUpperPaths(PlannerInfo *root, UpperRelationKind stage,
+							  RelOptInfo *input_rel, RelOptInfo *output_rel,
+							  void *extra)
 {
-	PyObject *p_iterable = execute(node, es),
-			 *p_item,
-			 *p_str;
-	Py_INCREF(p_iterable);
-	while((p_item = PyIter_Next(p_iterable))){
-		p_str = PyObject_Str(p_item);
-		ExplainPropertyText("Multicorn", PyString_AsString(p_str), es);
-		Py_DECREF(p_str);
+	/* Skip any duplicate calls. */
+	if (output_rel->fdw_private != NULL)
+	{
+		return;
 	}
-	Py_DECREF(p_iterable);
-	errorCheck();
-}
-
-/*
- *	multicornBeginForeignScan
- *		Initialize the foreign scan.
- *		This (primarily) involves :
- *			- retrieving cached info from the plan phase
- *			- initializing various buffers
- */
-static void
-multicornBeginForeignScan(ForeignScanState *node, int eflags)
-{
-	ForeignScan *fscan = (ForeignScan *) node->ss.ps.plan;
-	MulticornExecState *execstate;
-	TupleDesc	tupdesc = RelationGetDescr(node->ss.ss_currentRelation);
-	ListCell   *lc;
-
-	execstate = initializeExecState(fscan->fdw_private);
-	execstate->values = palloc(sizeof(Datum) * tupdesc->natts);
-	execstate->nulls = palloc(sizeof(bool) * tupdesc->natts);
-	execstate->qual_list = NULL;
-	foreach(lc, fscan->fdw_exprs)
+	switch (stage)
 	{
-		extractRestrictions(bms_make_singleton(fscan->scan.scanrelid),
-							((Expr *) lfirst(lc)),
-							&execstate->qual_list);
+		case UPPERREL_GROUP_AGG:
+			multicornAddGroupingPaths(root, input_rel, output_rel);
+			break;
+		case UPPERREL_FINAL:
+			multicornAddFinalPaths(root, input_rel, output_rel,
+								   (FinalPathExtraData *) extra);
+			break;
+		default:
+			break;
 	}
-	initConversioninfo(execstate->cinfos, TupleDescGetAttInMetadata(tupdesc));
-	node->fdw_state = execstate;
 }
 
-
 /*
- * multicornIterateForeignScan
- *		Retrieve next row from the result set, or clear tuple slot to indicate
- *		EOF.
- *
- *		This is done by iterating over the result from the "execute" python
- *		method.
+ * Check if every restriction of a scan was converted to a qual whose value
+ * is known while planning.
  */
-static TupleTableSlot *
-multicornIterateForeignScan(ForeignScanState *node)
+static bool
+hasPlanningQualsOnly(MulticornPlanState * planstate)
 {
-	TupleTableSlot *slot = node->ss.ss_ScanTupleSlot;
-	MulticornExecState *execstate = node->fdw_state;
-	PyObject   *p_value;
+	ListCell   *lc;
 
-	if (execstate->p_iterator == NULL)
-	{
-		execute(node, NULL);
-	}
-	ExecClearTuple(slot);
-	if (execstate->p_iterator == Py_None)
+	if (!planstate->quals_supported)
 	{
-		/* No iterator returned from get_iterator */
-		Py_DECREF(execstate->p_iterator);
-		return slot;
+		return false;
 	}
-	p_value = PyIter_Next(execstate->p_iterator);
-	errorCheck();
-	/* A none value results in an empty slot. */
-	if (p_value == NULL || p_value == Py_None)
+	foreach(lc, planstate->qual_list)
 	{
-		Py_XDECREF(p_value);
-		return slot;
+		if (((MulticornBaseQual *) lfirst(lc))->right_type != T_Const)
+		{
+			return false;
+		}
 	}
-	slot->tts_values = execstate->values;
-	slot->tts_isnull = execstate->nulls;
-	pythonResultToTuple(p_value, slot, execstate->cinfos, execstate->buffer);
-	ExecStoreVirtualTuple(slot);
-	Py_DECREF(p_value);
-
-	return slot;
+	return true;
 }
 
 /*
- * multicornReScanForeignScan
- *		Restart the scan
+ * Check if a Var is a column of the given relation.
  */
-static void
-multicornReScanForeignScan(ForeignScanState *node)
+static bool
+isRelationColumn(Expr *expr, Index relid)
 {
-	MulticornExecState *state = node->fdw_state;
+	Var		   *var = (Var *) expr;
 
-	if (state->p_iterator)
-	{
-		Py_DECREF(state->p_iterator);
-		state->p_iterator = NULL;
-	}
+	return IsA(var, Var) && var->varno == relid && var->varlevelsup == 0 &&
+		var->varattno > 0;
 }
 
 /*
- *	multicornEndForeignScan
- *		Finish scanning foreign table and dispose objects used for this scan.
+ * Deparse an aggregate which can be computed by the python implementation:
+ * count(*), or count, sum, avg, min or max applied to a column of the scanned
+ * relation, without any DISTINCT, ORDER BY or FILTER clause.
+ *
+ * The result is a list of two strings: the function name, and the column
+ * name (empty for count(*)). NIL is returned for unsupported aggregates.
  */
-static void
-multicornEndForeignScan(ForeignScanState *node)
+static List *
+deparseAggregate(Aggref *aggref, Index relid, MulticornPlanState * planstate)
 {
-	MulticornExecState *state = node->fdw_state;
-	PyObject   *result = PyObject_CallMethod(state->fdw_instance, "end_scan", "()");
+	char	   *funcname;
+	char	   *attname = "";
+
+	if (aggref->aggdistinct != NIL || aggref->aggorder != NIL ||
+		aggref->aggfilter != NULL || aggref->aggvariadic ||
+		aggref->aggkind != AGGKIND_NORMAL ||
+		aggref->aggsplit != AGGSPLIT_SIMPLE ||
+		aggref->agglevelsup != 0 ||
+		get_func_namespace(aggref->aggfnoid) != PG_CATALOG_NAMESPACE)
+	{
+		return NIL;
+	}
+	funcname = get_func_name(aggref->aggfnoid);
+	if (aggref->aggstar)
+	{
+		if (strcmp(funcname, "count") != 0)
+		{
+			return NIL;
+		}
+	}
+	else
+	{
+		Expr	   *arg;
 
-	errorCheck();
-	Py_DECREF(result);
-	Py_DECREF(state->fdw_instance);
-	Py_XDECREF(state->p_iterator);
-	state->p_iterator = NULL;
+		if (strcmp(funcname, "count") != 0 && strcmp(funcname, "sum") != 0 &&
+			strcmp(funcname, "avg") != 0 && strcmp(funcname, "min") != 0 &&
+			strcmp(funcname, "max") != 0)
+		{
+			return NIL;
+		}
+		if (list_length(aggref->args) != 1)
+		{
+			return NIL;
+		}
+		arg = ((TargetEntry *) linitial(aggref->args))->expr;
+		if (!isRelationColumn(arg, relid))
+		{
+			return NIL;
+		}
+		attname = planstate->cinfos[((Var *) arg)->varattno - 1]->attrname;
+	}
+	return list_make2(makeString(funcname), makeString(attname));
 }
 
-
-
-#if PG_VERSION_NUM >= 90300
 /*
- * multicornAddForeigUpdateTargets
- *		Add resjunk columns needed for update/delete.
+ * multicornAddGroupingPaths
+ *		Push the grouping and aggregation of a scan on one of our tables down
+ *		to the python implementation, if it accepts them.
+ *
+ *		The grouped rows are described by a target list containing the
+ *		grouping columns, followed by the aggregates.
  */
 static void
-multicornAddForeignUpdateTargets(Query *parsetree,
-								 RangeTblEntry *target_rte,
-								 Relation target_relation)
+multicornAddGroupingPaths(PlannerInfo *root, RelOptInfo *input_rel,
+						  RelOptInfo *output_rel)
 {
-	Var		   *var = NULL;
-	TargetEntry *tle,
-			   *returningTle;
-	PyObject   *instance = getInstance(target_relation->rd_id);
-	const char *attrname = getRowIdColumn(instance);
-	TupleDesc	desc = target_relation->rd_att;
+	Query	   *parse = root->parse;
+	PathTarget *grouping_target = output_rel->reltarget;
+	MulticornPlanState *planstate = (MulticornPlanState *) input_rel->fdw_private,
+			   *upperstate;
+	Index		relid = input_rel->relid;
+	List	   *group_tlist = NIL,
+			   *agg_tlist = NIL,
+			   *group_exprs = NIL,
+			   *group_by = NIL,
+			   *aggregates = NIL,
+			   *columns = NIL;
+	ForeignPath *grouppath;
+	ListCell   *lc;
 	int			i;
-	ListCell   *cell;
+	double		rows;
 
-	foreach(cell, parsetree->returningList)
+	if (input_rel->reloptkind != RELOPT_BASEREL || parse->groupingSets ||
+		parse->havingQual != NULL)
 	{
-		returningTle = lfirst(cell);
-		tle = copyObject(returningTle);
-		tle->resjunk = true;
-		parsetree->targetList = lappend(parsetree->targetList, tle);
+		return;
 	}
-
-
-	for (i = 0; i < desc->natts; i++)
+	/* Every row filtered locally would make the aggregates wrong. */
+	if (!hasPlanningQualsOnly(planstate))
 	{
-		Form_pg_attribute att = TupleDescAttr(desc, i);
+		return;
+	}
+	/* Collect the grouping columns. */
+	i = 0;
+	foreach(lc, grouping_target->exprs)
+	{
+		Expr	   *expr = (Expr *) lfirst(lc);
+		Index		sgref = get_pathtarget_sortgroupref(grouping_target, i++);
+		TargetEntry *tle;
+		char	   *attname;
 
-		if (!att->attisdropped)
+		if (!sgref || !get_sortgroupref_clause_noerr(sgref, parse->groupClause))
 		{
-			if (strcmp(NameStr(att->attname), attrname) == 0)
-			{
-				var = makeVar(parsetree->resultRelation,
-							  att->attnum,
-							  att->atttypid,
-							  att->atttypmod,
-							  att->attcollation,
-							  0);
-				break;
-			}
+			continue;
 		}
+		if (!isRelationColumn(expr, relid))
+		{
+			return;
+		}
+		if (tlist_member(expr, group_tlist))
+		{
+			continue;
+		}
+		attname = planstate->cinfos[((Var *) expr)->varattno - 1]->attrname;
+		tle = makeTargetEntry(expr, list_length(group_tlist) + 1,
+							  pstrdup(attname), false);
+		tle->ressortgroupref = sgref;
+		group_tlist = lappend(group_tlist, tle);
+		group_exprs = lappend(group_exprs, expr);
+		group_by = lappend(group_by, makeString(attname));
+		columns = lappend(columns, makeString(attname));
 	}
-	if (var == NULL)
+	/* Then the aggregates used by the other expressions. */
+	i = 0;
+	foreach(lc, grouping_target->exprs)
 	{
-		ereport(ERROR, (errmsg("%s", "The rowid attribute does not exist")));
-	}
+		Expr	   *expr = (Expr *) lfirst(lc);
+		Index		sgref = get_pathtarget_sortgroupref(grouping_target, i++);
+		List	   *nodes;
+		ListCell   *lc_node;
+
+		if (sgref && get_sortgroupref_clause_noerr(sgref, parse->groupClause))
+		{
+			continue;
+		}
+		nodes = pull_var_clause((Node *) expr, PVC_INCLUDE_AGGREGATES |
+								PVC_INCLUDE_PLACEHOLDERS);
+		foreach(lc_node, nodes)
+		{
+			Expr	   *node = (Expr *) lfirst(lc_node);
+			List	   *aggregate;
+			char	   *attname;
+
+			if (IsA(node, Var) && tlist_member(node, group_tlist))
+			{
+				continue;
+			}
+			if (!IsA(node, Aggref))
+			{
+				return;
+			}
+			if (tlist_member(node, agg_tlist))
+			{
+				continue;
+			}
+			aggregate = deparseAggregate((Aggref *) node, relid, planstate);
+			if (aggregate == NIL)
+			{
+				return;
+			}
+			attname = strVal(lsecond(aggregate));
+			agg_tlist = lappend(agg_tlist,
+								makeTargetEntry(node, 0,
+												psprintf("%s(%s)",
+														 strVal(linitial(aggregate)),
+														 *attname ? attname : "*"),
+												false));
+			aggregates = lappend(aggregates, aggregate);
+			if (*attname)
+			{
+				columns = lappend(columns, makeString(attname));
+			}
+		}
+	}
+	if (group_by == NIL && aggregates == NIL)
+	{
+		return;
+	}
+	if (!canAggregate(planstate, group_by, aggregates))
+	{
+		return;
+	}
+	upperstate = palloc(sizeof(MulticornPlanState));
+	memcpy(upperstate, planstate, sizeof(MulticornPlanState));
+	upperstate->scan_relid = relid;
+	upperstate->target_list = columns;
+	upperstate->group_by = group_by;
+	upperstate->aggregates = aggregates;
+	upperstate->scan_tlist = list_concat(group_tlist, agg_tlist);
+	i = 1;
+	foreach(lc, upperstate->scan_tlist)
+	{
+		((TargetEntry *) lfirst(lc))->resno = i++;
+	}
+	output_rel->fdw_private = upperstate;
+
+	if (group_exprs == NIL)
+	{
+		rows = 1;
+	}
+	else
+	{
+		rows = estimate_num_groups(root, group_exprs, input_rel->rows, NULL
+#if PG_VERSION_NUM >= 140000
+								   , NULL
+#endif
+			);
+	}
+	/* Only the grouped rows are transferred. */
+	grouppath = create_foreign_upper_path(root, output_rel, grouping_target,
+										  rows,
+										  planstate->startupCost,
+										  planstate->startupCost +
+										  rows * grouping_target->width,
+										  NIL,
+										  NULL,
+										  NIL);
+	add_path(output_rel, (Path *) grouppath);
+}
+
+/*
+ * Deparse a join clause comparing a column from each side of a join.
+ *
+ * The result is a list of three strings: the outer column name, the operator
+ * name and the inner column name. NIL is returned for unsupported clauses.
+ */
+static List *
+deparseJoinClause(Expr *clause, RelOptInfo *outerrel, RelOptInfo *innerrel)
+{
+	OpExpr	   *opexpr = (OpExpr *) clause;
+	MulticornPlanState *outerstate = (MulticornPlanState *) outerrel->fdw_private,
+			   *innerstate = (MulticornPlanState *) innerrel->fdw_private;
+	Expr	   *left,
+			   *right;
+	Oid			opno;
+
+	if (!IsA(opexpr, OpExpr) || list_length(opexpr->args) != 2)
+	{
+		return NIL;
+	}
+	left = (Expr *) linitial(opexpr->args);
+	right = (Expr *) lsecond(opexpr->args);
+	while (IsA(left, RelabelType))
+	{
+		left = ((RelabelType *) left)->arg;
+	}
+	while (IsA(right, RelabelType))
+	{
+		right = ((RelabelType *) right)->arg;
+	}
+	opno = opexpr->opno;
+	if (isRelationColumn(left, innerrel->relid) &&
+		isRelationColumn(right, outerrel->relid))
+	{
+		Expr	   *tmp = left;
+
+		left = right;
+		right = tmp;
+		opno = get_commutator(opno);
+		if (opno == InvalidOid)
+		{
+			return NIL;
+		}
+	}
+	if (!isRelationColumn(left, outerrel->relid) ||
+		!isRelationColumn(right, innerrel->relid))
+	{
+		return NIL;
+	}
+	return list_make3(makeString(outerstate->cinfos[((Var *) left)->varattno - 1]->attrname),
+					  makeString(get_opname(opno)),
+					  makeString(innerstate->cinfos[((Var *) right)->varattno - 1]->attrname));
+}
+
+/*
+ * multicornGetForeignJoinPaths
+ *		Push a join between two of our tables down to the python
+ *		implementation of the outer table, if it accepts it.
+ *
+ *		The joined rows are described by a target list containing the needed
+ *		columns of the outer table, followed by those of the inner table.
+ */
+static void
+multicornGetForeignJoinPaths(PlannerInfo *root, RelOptInfo *joinrel,
+							 RelOptInfo *outerrel, RelOptInfo *innerrel,
+							 JoinType jointype, JoinPathExtraData *extra)
+{
+	MulticornPlanState *outerstate,
+			   *innerstate,
+			   *joinstate;
+	List	   *join_clauses = NIL,
+			   *outer_tlist = NIL,
+			   *inner_tlist = NIL,
+			   *outer_columns = NIL,
+			   *inner_columns = NIL;
+	char	   *join_type;
+	ForeignPath *joinpath;
+	ListCell   *lc;
+	int			i;
+
+	/* Skip any duplicate calls. */
+	if (joinrel->fdw_private != NULL)
+	{
+		return;
+	}
+	if (root->parse->commandType != CMD_SELECT || root->parse->rowMarks ||
+		!bms_is_empty(joinrel->lateral_relids) ||
+		outerrel->reloptkind != RELOPT_BASEREL ||
+		innerrel->reloptkind != RELOPT_BASEREL)
+	{
+		return;
+	}
+	switch (jointype)
+	{
+		case JOIN_INNER:
+			join_type = "inner";
+			break;
+		case JOIN_LEFT:
+			join_type = "left";
+			break;
+		case JOIN_RIGHT:
+			join_type = "right";
+			break;
+		case JOIN_FULL:
+			join_type = "full";
+			break;
+		default:
+			return;
+	}
+	outerstate = (MulticornPlanState *) outerrel->fdw_private;
+	innerstate = (MulticornPlanState *) innerrel->fdw_private;
+	/* Rows filtered locally before the join would make it wrong. */
+	if (!hasPlanningQualsOnly(outerstate) || !hasPlanningQualsOnly(innerstate))
+	{
+		return;
+	}
+	foreach(lc, extra->restrictlist)
+	{
+		RestrictInfo *rinfo = (RestrictInfo *) lfirst(lc);
+		List	   *clause;
+
+		/* Filters applied after an outer join are not supported. */
+		if (rinfo->pseudoconstant ||
+			(IS_OUTER_JOIN(jointype) &&
+			 RINFO_IS_PUSHED_DOWN(rinfo, joinrel->relids)))
+		{
+			return;
+		}
+		clause = deparseJoinClause(rinfo->clause, outerrel, innerrel);
+		if (clause == NIL)
+		{
+			return;
+		}
+		join_clauses = lappend(join_clauses, clause);
+	}
+	if (join_clauses == NIL)
+	{
+		return;
+	}
+	foreach(lc, joinrel->reltarget->exprs)
+	{
+		Expr	   *expr = (Expr *) lfirst(lc);
+		char	   *attname;
+
+		if (isRelationColumn(expr, outerrel->relid))
+		{
+			if (tlist_member(expr, outer_tlist))
+			{
+				continue;
+			}
+			attname = outerstate->cinfos[((Var *) expr)->varattno - 1]->attrname;
+			outer_tlist = lappend(outer_tlist,
+								  makeTargetEntry(expr, 0, pstrdup(attname),
+												  false));
+			outer_columns = lappend(outer_columns, makeString(attname));
+		}
+		else if (isRelationColumn(expr, innerrel->relid))
+		{
+			if (tlist_member(expr, inner_tlist))
+			{
+				continue;
+			}
+			attname = innerstate->cinfos[((Var *) expr)->varattno - 1]->attrname;
+			inner_tlist = lappend(inner_tlist,
+								  makeTargetEntry(expr, 0, pstrdup(attname),
+												  false));
+			inner_columns = lappend(inner_columns, makeString(attname));
+		}
+		else
+		{
+			return;
+		}
+	}
+	if (!canJoin(outerstate, innerstate, join_type, join_clauses))
+	{
+		return;
+	}
+	joinstate = palloc(sizeof(MulticornPlanState));
+	memcpy(joinstate, outerstate, sizeof(MulticornPlanState));
+	joinstate->scan_relid = outerrel->relid;
+	joinstate->target_list = outer_columns;
+	joinstate->scan_tlist = list_concat(outer_tlist, inner_tlist);
+	i = 1;
+	foreach(lc, joinstate->scan_tlist)
+	{
+		((TargetEntry *) lfirst(lc))->resno = i++;
+	}
+	joinstate->base_clauses = extract_actual_clauses(outerrel->baserestrictinfo,
+													 false);
+	joinstate->join_type = join_type;
+	joinstate->join_clauses = join_clauses;
+	joinstate->inner_foreigntableid = innerstate->foreigntableid;
+	joinstate->inner_relid = innerrel->relid;
+	joinstate->inner_target_list = inner_columns;
+	joinstate->inner_clauses = extract_actual_clauses(innerrel->baserestrictinfo,
+													  false);
+	joinrel->fdw_private = joinstate;
+
+	/* Only the joined rows are transferred. */
+	joinpath = create_foreign_join_path(root, joinrel,
+										NULL,	/* default pathtarget */
+										joinrel->rows,
+										outerstate->startupCost,
+										outerstate->startupCost +
+										joinrel->rows * joinrel->reltarget->width,
+										NIL,	/* no pathkeys */
+										NULL,	/* no required_outer */
+										NULL,	/* no epq path */
+										NIL);
+	add_path(joinrel, (Path *) joinpath);
+}
+
+/*
+ * Get the value of a LIMIT or OFFSET clause, if it is a constant.
+ * A missing or NULL clause yields the default value.
+ */
+static bool
+getLimitValue(Node *node, int64 default_value, int64 *value)
+{
+	*value = default_value;
+	if (node == NULL)
+	{
+		return true;
+	}
+	if (!IsA(node, Const))
+	{
+		return false;
+	}
+	if (((Const *) node)->constisnull)
+	{
+		return true;
+	}
+	*value = DatumGetInt64(((Const *) node)->constvalue);
+	/* Let the executor complain about negative values. */
+	return *value >= 0;
+}
+
+/*
+ * multicornAddFinalPaths
+ *		Push the LIMIT and OFFSET clauses down to an unparameterized scan on
+ *		one of our tables, with the required ordering, if the python
+ *		implementation accepts them.
+ */
+static void
+multicornAddFinalPaths(PlannerInfo *root, RelOptInfo *input_rel,
+					   RelOptInfo *output_rel, FinalPathExtraData *extra)
+{
+	Query	   *parse = root->parse;
+	ForeignPath *scanpath = NULL;
+	ForeignPath *finalpath;
+	MulticornPlanState *planstate,
+			   *upperstate;
+	ListCell   *lc;
+	int64		limit,
+				offset;
+	double		rows;
+	Cost		total_cost;
+
+	if (parse->commandType != CMD_SELECT || !extra->limit_needed ||
+		parse->rowMarks || parse->hasTargetSRFs)
+	{
+		return;
+	}
+#if PG_VERSION_NUM >= 130000
+	/* The rows tied with the last one must be compared locally. */
+	if (parse->limitOption == LIMIT_OPTION_WITH_TIES)
+	{
+		return;
+	}
+#endif
+	if (!getLimitValue(parse->limitCount, -1, &limit) ||
+		!getLimitValue(parse->limitOffset, 0, &offset))
+	{
+		return;
+	}
+	foreach(lc, input_rel->pathlist)
+	{
+		Path	   *path = (Path *) lfirst(lc);
+
+		while (IsA(path, ProjectionPath))
+		{
+			path = ((ProjectionPath *) path)->subpath;
+		}
+		if (IsA(path, ForeignPath) &&
+			path->param_info == NULL &&
+			path->parent->reloptkind == RELOPT_BASEREL &&
+			path->parent->fdwroutine != NULL &&
+			path->parent->fdwroutine->GetForeignUpperPaths == multicornGetForeignUpperPaths &&
+			pathkeys_contained_in(root->sort_pathkeys, path->pathkeys))
+		{
+			scanpath = (ForeignPath *) path;
+			break;
+		}
+	}
+	if (scanpath == NULL)
+	{
+		return;
+	}
+	planstate = (MulticornPlanState *) scanpath->path.parent->fdw_private;
+	/* Every row filtered locally would make the remote limit wrong. */
+	if (!planstate->quals_supported)
+	{
+		return;
+	}
+	if (!canLimit(planstate, limit, offset))
+	{
+		return;
+	}
+	upperstate = palloc(sizeof(MulticornPlanState));
+	memcpy(upperstate, planstate, sizeof(MulticornPlanState));
+	upperstate->scan_relid = scanpath->path.parent->relid;
+	upperstate->limit = limit;
+	upperstate->offset = offset;
+	output_rel->fdw_private = upperstate;
+
+	rows = clamp_row_est(scanpath->path.rows - offset);
+	if (limit >= 0 && limit < rows)
+	{
+		rows = clamp_row_est(limit);
+	}
+	/*
+	 * Only the requested rows are fetched, while a local Limit also fetches
+	 * the skipped ones. Without an offset both cost the same, and the local
+	 * Limit is kept.
+	 */
+	total_cost = scanpath->path.startup_cost +
+		(scanpath->path.total_cost - scanpath->path.startup_cost) *
+		(rows / clamp_row_est(scanpath->path.rows));
+	finalpath = create_foreign_upper_path(root, output_rel,
+										  root->upper_targets[UPPERREL_FINAL],
+										  rows,
+										  scanpath->path.startup_cost,
+										  total_cost,
+										  scanpath->path.pathkeys,
+										  NULL,
+										  scanpath->fdw_private);
+	add_path(output_rel, (Path *) finalpath);
+}
+#endif
+
+static void
+explainScanTime(const char *label, instr_time time, ExplainState *es)
+{
+#if PG_VERSION_NUM >= 110000
+	ExplainPropertyFloat(label, "ms", INSTR_TIME_GET_MILLISEC(time), 3, es);
+#else
+	ExplainPropertyFloat(label, INSTR_TIME_GET_MILLISEC(time), 3, es);
+#endif
+}
+
+static void
+explainScanCounter(const char *label, int64 value, ExplainState *es)
+{
+#if PG_VERSION_NUM >= 110000
+	ExplainPropertyInteger(label, NULL, value, es);
+#else
+	ExplainPropertyLong(label, (long) value, es);
+#endif
+}
+
+/*
+ * Report where the time of a scan was spent: calling execute, fetching rows
+ * from the python iterator, or converting them. Parallel workers keep their
+ * own statistics, which are not included.
+ */
+static void
+explainScanStats(MulticornScanStats * stats, ExplainState *es)
+{
+	if (es->timing)
+	{
+		explainScanTime("Python Execute Time", stats->execute_time, es);
+		explainScanTime("Python Fetch Time", stats->fetch_time, es);
+		explainScanTime("Conversion Time", stats->convert_time, es);
+	}
+	explainScanCounter("Converted Rows", stats->rows, es);
+	explainScanCounter("Converted Values", stats->cells, es);
+	explainScanCounter("Text Conversion Bytes", stats->text_bytes, es);
+}
+
+/*
+ * Report the counters returned by the scan_stats method of the python
+ * implementation, sorted by name. The numeric counters of every execution of
+ * the scan are summed, and the last value of the other ones is shown.
+ */
+static void
+explainWrapperStats(PyObject *p_scan_stats, ExplainState *es)
+{
+	PyObject   *p_totals = PyDict_New(),
+			   *p_items;
+	Py_ssize_t	i,
+				j;
+
+	for (i = 0; i < PyList_Size(p_scan_stats); i++)
+	{
+		PyObject   *p_view = PyMapping_Items(PyList_GetItem(p_scan_stats, i)),
+				   *p_counters;
+
+		errorCheck();
+		p_counters = PySequence_List(p_view);
+		Py_DECREF(p_view);
+		errorCheck();
+		for (j = 0; j < PyList_Size(p_counters); j++)
+		{
+			PyObject   *p_item = PyList_GetItem(p_counters, j),
+					   *p_key = PyTuple_GetItem(p_item, 0),
+					   *p_value = PyTuple_GetItem(p_item, 1),
+					   *p_total = PyDict_GetItem(p_totals, p_key);
+
+			if (p_total != NULL && PyNumber_Check(p_total) &&
+				PyNumber_Check(p_value))
+			{
+				PyObject   *p_sum = PyNumber_Add(p_total, p_value);
+
+				errorCheck();
+				PyDict_SetItem(p_totals, p_key, p_sum);
+				Py_DECREF(p_sum);
+			}
+			else
+			{
+				PyDict_SetItem(p_totals, p_key, p_value);
+			}
+		}
+		Py_DECREF(p_counters);
+	}
+	p_items = PyDict_Items(p_totals);
+	Py_DECREF(p_totals);
+	PyList_Sort(p_items);
+	errorCheck();
+	for (i = 0; i < PyList_Size(p_items); i++)
+	{
+		PyObject   *p_item = PyList_GetItem(p_items, i),
+				   *p_key = PyObject_Str(PyTuple_GetItem(p_item, 0)),
+				   *p_value = PyTuple_GetItem(p_item, 1);
+		char	   *label;
+
+		errorCheck();
+		label = pstrdup(PyString_AsString(p_key));
+		Py_DECREF(p_key);
+		if (PyIntegral_Check(p_value))
+		{
+			explainScanCounter(label, PyLong_AsLongLong(p_value), es);
+		}
+		else if (PyFloat_Check(p_value))
+		{
+#if PG_VERSION_NUM >= 110000
+			ExplainPropertyFloat(label, NULL, PyFloat_AsDouble(p_value), 3, es);
+#else
+			ExplainPropertyFloat(label, PyFloat_AsDouble(p_value), 3, es);
+#endif
+		}
+		else
+		{
+			PyObject   *p_str = PyObject_Str(p_value);
+
+			errorCheck();
+			ExplainPropertyText(label, PyString_AsString(p_str), es);
+			Py_DECREF(p_str);
+		}
+		errorCheck();
+	}
+	Py_DECREF(p_items);
+}
+
+/*
+ * multicornExplainForeignScan
+ *		Placeholder for additional "EXPLAIN" information.
+ *		This should (at least) output the python class name, as well
+ *		as information that was taken into account for the choice of a path.
+ */
+static void
+multicornExplainForeignScan(ForeignScanState *node, ExplainState *es)
+{
+	MulticornExecState *state = node->fdw_state;
+	PyObject *p_iterable = execute(node, es),
+			 *p_item,
+			 *p_str;
+	Py_INCREF(p_iterable);
+	while((p_item = PyIter_Next(p_iterable))){
+		p_str = PyObject_Str(p_item);
+		ExplainPropertyText("Multicorn", PyString_AsString(p_str), es);
+		Py_DECREF(p_str);
+	}
+	Py_DECREF(p_iterable);
+	errorCheck();
+	if (es->analyze && state->track_stats)
+	{
+		explainScanStats(&state->stats, es);
+	}
+	if (es->analyze && state->p_scan_stats != NULL)
+	{
+		explainWrapperStats(state->p_scan_stats, es);
+	}
+}
+
+#if PG_VERSION_NUM >= 120000
+/*
+ * Extract the quals of a relation scanned by a pushed down aggregation or
+ * join from its restriction clauses, and return the conversion info needed
+ * to build their python representation.
+ */
+static ConversionInfo **
+initRelationQuals(Oid foreigntableid, Index relid, List *clauses,
+				  List **quals)
+{
+	Relation	rel = table_open(foreigntableid, AccessShareLock);
+	TupleDesc	reldesc = RelationGetDescr(rel);
+	ConversionInfo **cinfos = palloc0(sizeof(ConversionInfo *) *
+									  reldesc->natts);
+	ListCell   *lc;
+
+	foreach(lc, clauses)
+	{
+		extractRestrictions(bms_make_singleton(relid), ((Expr *) lfirst(lc)),
+							quals);
+	}
+	initConversioninfo(cinfos, TupleDescGetAttInMetadata(reldesc));
+	table_close(rel, NoLock);
+	return cinfos;
+}
+#endif
+
+/*
+ * Build the array of the attributes referenced by the plan of a base
+ * relation scan, so that the other values of the rows are not converted.
+ * Every attribute is needed if the plan references the whole row.
+ */
+static void
+initNeededAttnums(MulticornExecState * execstate, ForeignScan *fscan,
+				  TupleDesc tupdesc)
+{
+	List	   *exprs = list_concat(list_copy(fscan->scan.plan.targetlist),
+									list_copy(fscan->scan.plan.qual));
+	Bitmapset  *attrs = NULL;
+	ListCell   *lc;
+	int			i;
+
+#if PG_VERSION_NUM >= 90500
+	exprs = list_concat(exprs, list_copy(fscan->fdw_recheck_quals));
+#endif
+	foreach(lc, extractColumns(exprs, NIL))
+	{
+		Var		   *var = (Var *) lfirst(lc);
+
+		if (var->varno != fscan->scan.scanrelid || var->varattno < 0)
+		{
+			continue;
+		}
+		if (var->varattno == 0)
+		{
+			/* A whole-row reference */
+			return;
+		}
+		attrs = bms_add_member(attrs, var->varattno - 1);
+	}
+	execstate->needed_attnums = palloc(sizeof(AttrNumber) * tupdesc->natts);
+	execstate->needed_count = 0;
+	for (i = 0; i < tupdesc->natts; i++)
+	{
+		if (execstate->cinfos[i] != NULL && bms_is_member(i, attrs))
+		{
+			execstate->needed_attnums[execstate->needed_count++] = i;
+		}
+	}
+}
+
+/*
+ *	multicornBeginForeignScan
+ *		Initialize the foreign scan.
+ *		This (primarily) involves :
+ *			- retrieving cached info from the plan phase
+ *			- initializing various buffers
+ */
+static void
+multicornBeginForeignScan(ForeignScanState *node, int eflags)
+{
+	ForeignScan *fscan = (ForeignScan *) node->ss.ps.plan;
+	MulticornExecState *execstate;
+	TupleDesc	tupdesc;
+	ListCell   *lc;
+
+	execstate = initializeExecState(fscan->fdw_private);
+#if PG_VERSION_NUM >= 140000
+	execstate->async_mode = fscan->scan.plan.async_capable;
+#endif
+	/*
+	 * Statistics are reported by EXPLAIN ANALYZE, and added to the
+	 * cumulative statistics of the foreign table. Those only time the calls
+	 * to execute and the fetching of batches, so that the clock is not read
+	 * for every row of every scan.
+	 */
+	execstate->log_duration = multicorn_log_min_duration >= 0 &&
+		!(eflags & EXEC_FLAG_EXPLAIN_ONLY);
+	execstate->time_rows = (node->ss.ps.instrument != NULL &&
+							node->ss.ps.instrument->need_timer) ||
+		execstate->log_duration;
+	execstate->track_stats = node->ss.ps.instrument != NULL ||
+		tableStatsEnabled() || execstate->log_duration;
+	if (node->ss.ps.instrument != NULL)
+	{
+		execstate->p_scan_stats = PyList_New(0);
+	}
+	if (fscan->scan.scanrelid > 0)
+	{
+		tupdesc = RelationGetDescr(node->ss.ss_currentRelation);
+	}
+	else
+	{
+		/* An aggregation pushed down: the scan returns the grouped rows. */
+		tupdesc = node->ss.ss_ScanTupleSlot->tts_tupleDescriptor;
+	}
+	execstate->values = palloc(sizeof(Datum) * tupdesc->natts);
+	execstate->nulls = palloc(sizeof(bool) * tupdesc->natts);
+	execstate->qual_list = NULL;
+	foreach(lc, fscan->fdw_exprs)
+	{
+		extractRestrictions(bms_make_singleton(fscan->scan.scanrelid),
+							((Expr *) lfirst(lc)),
+							&execstate->qual_list);
+	}
+	initConversioninfo(execstate->cinfos, TupleDescGetAttInMetadata(tupdesc));
+	execstate->qual_cinfos = execstate->cinfos;
+	if (fscan->scan.scanrelid > 0)
+	{
+		initNeededAttnums(execstate, fscan, tupdesc);
+		if (wantsBoolQuals(execstate->fdw_instance))
+		{
+			foreach(lc, fscan->fdw_exprs)
+			{
+				MulticornBaseQual *qual = extractBoolQual(bms_make_singleton(fscan->scan.scanrelid),
+														  (Expr *) lfirst(lc));
+
+				if (qual != NULL)
+				{
+					execstate->bool_qual_list = lappend(execstate->bool_qual_list,
+														qual);
+				}
+			}
+		}
+		/* The cache key does not account for the trees of quals. */
+		if (!execstate->async_mode && execstate->bool_qual_list == NIL)
+		{
+			initParamCache(execstate);
+		}
+	}
+	execstate->cache_ttl = getIntegerOption(execstate->foreigntableid,
+											"cache_ttl", 0);
+	execstate->cache_size = getIntegerOption(execstate->foreigntableid,
+											 "cache_size", 10240);
+#if PG_VERSION_NUM >= 120000
+	if (fscan->scan.scanrelid == 0)
+	{
+		/*
+		 * The quals apply to the scanned relations, not to the grouped or
+		 * joined rows.
+		 */
+		execstate->qual_cinfos = initRelationQuals(execstate->foreigntableid,
+												   execstate->scan_relid,
+												   execstate->base_clauses,
+												   &execstate->qual_list);
+		if (execstate->join_type != NULL)
+		{
+			execstate->inner_qual_cinfos =
+				initRelationQuals(execstate->inner_foreigntableid,
+								  execstate->inner_relid,
+								  execstate->inner_clauses,
+								  &execstate->inner_qual_list);
+			execstate->p_inner_instance =
+				getInstance(execstate->inner_foreigntableid);
+		}
+	}
+#endif
+	node->fdw_state = execstate;
+}
+
+
+#if PG_VERSION_NUM >= 140000
+/*
+ * Store the next row of an asynchronous scan in the slot, without waiting
+ * for the python implementation. Return false if no row is available yet.
+ * An empty slot means the scan is over.
+ */
+static bool
+fetchAsyncTuple(ForeignScanState *node, TupleTableSlot *slot)
+{
+	MulticornExecState *execstate = node->fdw_state;
+	PyObject   *p_rows;
+
+	ExecClearTuple(slot);
+	for (;;)
+	{
+		instr_time	start;
+
+		if (execstate->time_rows)
+		{
+			INSTR_TIME_SET_CURRENT(start);
+		}
+		if (execstate->p_iterator != NULL)
+		{
+			PyObject   *p_value = PyIter_Next(execstate->p_iterator);
+
+			if (execstate->time_rows)
+			{
+				accumScanTime(&execstate->stats.fetch_time, start);
+			}
+			errorCheck();
+			if (p_value != NULL)
+			{
+				slot->tts_values = execstate->values;
+				slot->tts_isnull = execstate->nulls;
+				pythonResultToScanTuple(p_value, slot, execstate);
+				ExecStoreVirtualTuple(slot);
+				Py_DECREF(p_value);
+				return true;
+			}
+			Py_DECREF(execstate->p_iterator);
+			execstate->p_iterator = NULL;
+		}
+		if (execstate->p_async_result == NULL)
+		{
+			execute(node, NULL);
+		}
+		if (execstate->p_async_result == Py_None)
+		{
+			return true;
+		}
+		if (execstate->track_stats)
+		{
+			INSTR_TIME_SET_CURRENT(start);
+		}
+		p_rows = PyObject_CallMethod(execstate->p_async_result, "fetch", "()");
+		if (execstate->track_stats)
+		{
+			accumScanTime(&execstate->stats.fetch_time, start);
+		}
+		errorCheck();
+		if (p_rows == Py_None)
+		{
+			/* The scan is over: do not fetch any more rows. */
+			Py_DECREF(execstate->p_async_result);
+			execstate->p_async_result = p_rows;
+			return true;
+		}
+		if (PyObject_Length(p_rows) == 0)
+		{
+			Py_DECREF(p_rows);
+			errorCheck();
+			return false;
+		}
+		execstate->p_iterator = PyObject_GetIter(p_rows);
+		Py_DECREF(p_rows);
+		errorCheck();
+	}
+}
+
+/*
+ * Return the next row of an asynchronous scan. When no row is available
+ * yet, an empty slot is returned while processing an asynchronous request,
+ * and the backend waits for the result file descriptor otherwise.
+ */
+static TupleTableSlot *
+iterateAsyncScan(ForeignScanState *node)
+{
+	TupleTableSlot *slot = node->ss.ss_ScanTupleSlot;
+	MulticornExecState *execstate = node->fdw_state;
+
+	while (!fetchAsyncTuple(node, slot))
+	{
+		if (execstate->in_async_request)
+		{
+			execstate->async_pending = true;
+			break;
+		}
+		(void) WaitLatchOrSocket(MyLatch,
+								 WL_LATCH_SET | WL_SOCKET_READABLE |
+								 WL_EXIT_ON_PM_DEATH,
+								 asyncResultFileno(execstate), -1L,
+								 PG_WAIT_EXTENSION);
+		ResetLatch(MyLatch);
+		CHECK_FOR_INTERRUPTS();
+	}
+	return slot;
+}
+#endif
+
+/*
+ * multicornIterateForeignScan
+ *		Retrieve next row from the result set, or clear tuple slot to indicate
+ *		EOF.
+ *
+ *		This is done by iterating over the result from the "execute" python
+ *		method.
+ */
+static TupleTableSlot *
+multicornIterateForeignScan(ForeignScanState *node)
+{
+	TupleTableSlot *slot = node->ss.ss_ScanTupleSlot;
+	MulticornExecState *execstate = node->fdw_state;
+	PyObject   *p_value;
+
+#if PG_VERSION_NUM >= 140000
+	if (execstate->async_mode)
+	{
+		return iterateAsyncScan(node);
+	}
+#endif
+	ExecClearTuple(slot);
+	for (;;)
+	{
+		if (execstate->p_iterator == NULL)
+		{
+#if PG_VERSION_NUM >= 90600
+			/* Each participant of a parallel scan claims its own partition. */
+			if (execstate->pstate != NULL && !claimScanPartition(execstate))
+			{
+				return slot;
+			}
+#endif
+			execute(node, NULL);
+		}
+		if (execstate->p_iterator == Py_None)
+		{
+			/* No iterator returned from get_iterator */
+		}
+		else if (execstate->batch_mode)
+		{
+			slot->tts_values = execstate->values;
+			slot->tts_isnull = execstate->nulls;
+			if (nextBatchedTuple(execstate, slot))
+			{
+				ExecStoreVirtualTuple(slot);
+				return slot;
+			}
+		}
+		else
+		{
+			instr_time	start;
+
+			if (execstate->time_rows)
+			{
+				INSTR_TIME_SET_CURRENT(start);
+			}
+			p_value = PyIter_Next(execstate->p_iterator);
+			if (execstate->time_rows)
+			{
+				accumScanTime(&execstate->stats.fetch_time, start);
+			}
+			errorCheck();
+			/* A none value results in an empty slot. */
+			if (p_value != NULL && p_value != Py_None)
+			{
+				slot->tts_values = execstate->values;
+				slot->tts_isnull = execstate->nulls;
+				pythonResultToScanTuple(p_value, slot, execstate);
+				ExecStoreVirtualTuple(slot);
+				Py_DECREF(p_value);
+				return slot;
+			}
+			Py_XDECREF(p_value);
+		}
+#if PG_VERSION_NUM >= 90600
+		if (execstate->pstate != NULL)
+		{
+			/* This partition is exhausted: move on to the next one. */
+			Py_DECREF(execstate->p_iterator);
+			execstate->p_iterator = NULL;
+			releaseBatch(execstate);
+			continue;
+		}
+#endif
+		return slot;
+	}
+}
+
+/*
+ * multicornReScanForeignScan
+ *		Restart the scan
+ */
+static void
+multicornReScanForeignScan(ForeignScanState *node)
+{
+	MulticornExecState *state = node->fdw_state;
+
+	if (state->p_iterator)
+	{
+		Py_DECREF(state->p_iterator);
+		state->p_iterator = NULL;
+	}
+	releaseBatch(state);
+	Py_XDECREF(state->p_partition);
+	state->p_partition = NULL;
+	Py_XDECREF(state->p_async_result);
+	state->p_async_result = NULL;
+}
+
+/*
+ * Returns the module and name of the class of a python instance.
+ */
+static char *
+wrapperClassName(PyObject *fdw_instance)
+{
+	PyObject   *p_class = PyObject_GetAttrString(fdw_instance, "__class__"),
+			   *p_module,
+			   *p_name;
+	char	   *result;
+
+	errorCheck();
+	p_module = PyObject_GetAttrString(p_class, "__module__");
+	p_name = PyObject_GetAttrString(p_class, "__name__");
+	Py_DECREF(p_class);
+	errorCheck();
+	result = psprintf("%s.%s", PyString_AsString(p_module),
+					  PyString_AsString(p_name));
+	Py_DECREF(p_module);
+	Py_DECREF(p_name);
+	return result;
+}
+
+static char *
+qualifiedTableName(Oid foreigntableid)
+{
+	return quote_qualified_identifier(get_namespace_name(get_rel_namespace(foreigntableid)),
+									  get_rel_name(foreigntableid));
+}
+
+static char *
+pythonRepr(PyObject *object)
+{
+	PyObject   *p_repr = PyObject_Repr(object);
+	char	   *result;
+
+	errorCheck();
+	result = pstrdup(PyString_AsString(p_repr));
+	Py_DECREF(p_repr);
+	return result;
+}
+
+/*
+ * Log a scan which spent more than multicorn.log_min_duration in python and
+ * converting its rows, with what was asked to the python implementation.
+ */
+static void
+logScanDuration(MulticornExecState * state)
+{
+	MulticornScanStats *stats = &state->stats;
+	instr_time	python_time = stats->execute_time;
+	double		duration;
+
+	INSTR_TIME_ADD(python_time, stats->fetch_time);
+	duration = INSTR_TIME_GET_MILLISEC(python_time) +
+		INSTR_TIME_GET_MILLISEC(stats->convert_time);
+	if (state->p_log_context == NULL || duration < multicorn_log_min_duration)
+	{
+		return;
+	}
+	ereport(LOG,
+			(errmsg("multicorn scan of %s: duration %.3f ms",
+					qualifiedTableName(state->foreigntableid), duration),
+			 errdetail("Wrapper: %s\nQuals: %s\nColumns: %s\nSort keys: %s\n"
+					   "Rows: " INT64_FORMAT "\n"
+					   "Python time: %.3f ms\nConversion time: %.3f ms",
+					   wrapperClassName(state->fdw_instance),
+					   pythonRepr(PyTuple_GET_ITEM(state->p_log_context, 0)),
+					   pythonRepr(PyTuple_GET_ITEM(state->p_log_context, 1)),
+					   pythonRepr(PyTuple_GET_ITEM(state->p_log_context, 2)),
+					   stats->rows,
+					   INSTR_TIME_GET_MILLISEC(python_time),
+					   INSTR_TIME_GET_MILLISEC(stats->convert_time)),
+			 errhidestmt(true)));
+}
+
+/*
+ *	multicornEndForeignScan
+ *		Finish scanning foreign table and dispose objects used for this scan.
+ */
+static void
+multicornEndForeignScan(ForeignScanState *node)
+{
+	MulticornExecState *state = node->fdw_state;
+	PyObject   *result = PyObject_CallMethod(state->fdw_instance, "end_scan", "()");
+
+	errorCheck();
+	Py_DECREF(result);
+	if (state->track_stats)
+	{
+		reportScanStats(state->foreigntableid, &state->stats);
+	}
+	if (state->log_duration)
+	{
+		logScanDuration(state);
+	}
+	Py_DECREF(state->fdw_instance);
+	Py_XDECREF(state->p_iterator);
+	state->p_iterator = NULL;
+	releaseBatch(state);
+	Py_XDECREF(state->p_partition);
+	state->p_partition = NULL;
+	Py_XDECREF(state->p_partitions);
+	state->p_partitions = NULL;
+	Py_XDECREF(state->p_inner_instance);
+	state->p_inner_instance = NULL;
+	Py_XDECREF(state->p_async_result);
+	state->p_async_result = NULL;
+	Py_XDECREF(state->p_param_cache);
+	state->p_param_cache = NULL;
+	Py_XDECREF(state->p_scan_stats);
+	state->p_scan_stats = NULL;
+	Py_XDECREF(state->p_log_context);
+	state->p_log_context = NULL;
+}
+
+#if PG_VERSION_NUM >= 90600
+/*
+ * multicornIsForeignScanParallelSafe
+ *		Let the python implementation decide if its scans can be run in
+ *		parallel workers.
+ */
+static bool
+multicornIsForeignScanParallelSafe(PlannerInfo *root, RelOptInfo *rel,
+								   RangeTblEntry *rte)
+{
+	return isParallelSafe(getInstance(rte->relid));
+}
+
+/*
+ * multicornEstimateDSMForeignScan
+ *		Ask the python implementation how to split the scan, and reserve
+ *		enough shared memory for the pickled partitions.
+ */
+static Size
+multicornEstimateDSMForeignScan(ForeignScanState *node, ParallelContext *pcxt)
+{
+	MulticornExecState *state = node->fdw_state;
+
+	getScanPartitions(node);
+	return add_size(offsetof(MulticornParallelState, data),
+					state->partitions_size);
+}
+
+/*
+ * multicornInitializeDSMForeignScan
+ *		Copy the partitions to the shared memory segment.
+ */
+static void
+multicornInitializeDSMForeignScan(ForeignScanState *node, ParallelContext *pcxt,
+								  void *coordinate)
+{
+	MulticornExecState *state = node->fdw_state;
+	MulticornParallelState *pstate = (MulticornParallelState *) coordinate;
+
+	pg_atomic_init_u32(&pstate->next_partition, 0);
+	pstate->partitions_count = state->partitions_count;
+	pstate->size = state->partitions_size;
+	if (state->partitions_size > 0)
+	{
+		memcpy(pstate->data, state->partitions_data, state->partitions_size);
+	}
+	state->pstate = pstate;
+}
+
+/*
+ * multicornInitializeWorkerForeignScan
+ *		Attach a worker to the shared state of the scan.
+ */
+static void
+multicornInitializeWorkerForeignScan(ForeignScanState *node, shm_toc *toc,
+									 void *coordinate)
+{
+	MulticornExecState *state = node->fdw_state;
+
+	state->pstate = (MulticornParallelState *) coordinate;
+}
+#endif
+
+#if PG_VERSION_NUM >= 100000
+/*
+ * multicornReInitializeDSMForeignScan
+ *		Make every partition available again before a rescan.
+ */
+static void
+multicornReInitializeDSMForeignScan(ForeignScanState *node,
+									ParallelContext *pcxt, void *coordinate)
+{
+	MulticornParallelState *pstate = (MulticornParallelState *) coordinate;
+
+	pg_atomic_write_u32(&pstate->next_partition, 0);
+}
+#endif
+
+
+
+#if PG_VERSION_NUM >= 90300
+/*
+ * multicornAddForeigUpdateTargets
+ *		Add resjunk columns needed for update/delete.
+ */
+static void
+multicornAddForeignUpdateTargets(Query *parsetree,
+								 RangeTblEntry *target_rte,
+								 Relation target_relation)
+{
+	Var		   *var = NULL;
+	TargetEntry *tle,
+			   *returningTle;
+	PyObject   *instance = getInstance(target_relation->rd_id);
+	const char *attrname = getRowIdColumn(instance);
+	TupleDesc	desc = target_relation->rd_att;
+	int			i;
+	ListCell   *cell;
+
+	foreach(cell, parsetree->returningList)
+	{
+		returningTle = lfirst(cell);
+		tle = copyObject(returningTle);
+		tle->resjunk = true;
+		parsetree->targetList = lappend(parsetree->targetList, tle);
+	}
+
+
+	for (i = 0; i < desc->natts; i++)
+	{
+		Form_pg_attribute att = TupleDescAttr(desc, i);
+
+		if (!att->attisdropped)
+		{
+			if (strcmp(NameStr(att->attname), attrname) == 0)
+			{
+				var = makeVar(parsetree->resultRelation,
+							  att->attnum,
+							  att->atttypid,
+							  att->atttypmod,
+							  att->attcollation,
+							  0);
+				break;
+			}
+		}
+	}
+	if (var == NULL)
+	{
+		ereport(ERROR, (errmsg("%s", "The rowid attribute does not exist")));
+	}
 	tle = makeTargetEntry((Expr *) var,
 						  list_length(parsetree->targetList) + 1,
 						  strdup(attrname),
@@ -652,185 +2274,747 @@ multicornAddForeignUpdateTargets(Query *parsetree,
 
 
 /*
- * multicornPlanForeignModify
- *		Plan a foreign write operation.
- *		This is done by checking the "supported operations" attribute
- *		on the python class.
+ * multicornPlanForeignModify
+ *		Plan a foreign write operation.
+ *		This is done by checking the "supported operations" attribute
+ *		on the python class.
+ */
+static List *
+multicornPlanForeignModify(PlannerInfo *root,
+						   ModifyTable *plan,
+						   Index resultRelation,
+						   int subplan_index)
+{
+	return NULL;
+}
+
+
+/*
+ * Get an integer option, such as "batch_size", of the foreign table or of
+ * its server. Their values are checked by the validator.
+ */
+static int
+getIntegerOption(Oid foreigntableid, const char *name, int default_value)
+{
+	ForeignTable *table = GetForeignTable(foreigntableid);
+	ForeignServer *server = GetForeignServer(table->serverid);
+	List	   *options = list_concat(list_copy(server->options),
+									  table->options);
+	ListCell   *lc;
+	int			value = default_value;
+
+	/* The table option, coming last, overrides the server one. */
+	foreach(lc, options)
+	{
+		DefElem    *def = (DefElem *) lfirst(lc);
+
+		if (strcmp(def->defname, name) == 0)
+		{
+			value = (int) strtol(defGetString(def), NULL, 10);
+		}
+	}
+	return value;
+}
+
+/*
+ * Drop the results of a foreign table from the result cache shared by the
+ * backends, once it has been written to.
+ */
+static void
+invalidateResultCache(Oid foreigntableid)
+{
+	PyObject   *p_invalidate,
+			   *p_result;
+
+	if (getIntegerOption(foreigntableid, "cache_ttl", 0) <= 0)
+	{
+		return;
+	}
+	p_invalidate = getClassString("multicorn.resultcache.invalidate");
+	errorCheck();
+	p_result = PyObject_CallFunction(p_invalidate, "(II)", MyDatabaseId,
+									 foreigntableid);
+	Py_DECREF(p_invalidate);
+	errorCheck();
+	Py_DECREF(p_result);
+}
+
+/*
+ * Check if inserted rows can be buffered: this is only the case if the values
+ * returned by the insert are not needed, for a RETURNING clause, a row trigger
+ * or a check option.
+ */
+static bool
+canBufferInserts(ModifyTableState *mtstate, ResultRelInfo *resultRelInfo)
+{
+	TriggerDesc *trigdesc = resultRelInfo->ri_TrigDesc;
+
+	if (trigdesc != NULL &&
+		(trigdesc->trig_insert_before_row || trigdesc->trig_insert_after_row))
+	{
+		return false;
+	}
+	if (mtstate != NULL)
+	{
+		/* COPY FROM has no plan, nor any RETURNING clause or check option. */
+		ModifyTable *plan = (ModifyTable *) mtstate->ps.plan;
+
+		if (mtstate->operation != CMD_INSERT ||
+			(plan != NULL && (plan->returningLists != NIL ||
+							  plan->withCheckOptionLists != NIL)))
+		{
+			return false;
+		}
+	}
+	return true;
+}
+
+/*
+ * Initialize the state common to all foreign write operations.
+ */
+static MulticornModifyState *
+initModifyState(ModifyTableState *mtstate, ResultRelInfo *resultRelInfo)
+{
+	MulticornModifyState *modstate = palloc0(sizeof(MulticornModifyState));
+	Relation	rel = resultRelInfo->ri_RelationDesc;
+	TupleDesc	desc = RelationGetDescr(rel);
+
+	modstate->cinfos = palloc0(sizeof(ConversionInfo *) *
+							   desc->natts);
+	modstate->buffer = makeStringInfo();
+	modstate->fdw_instance = getInstance(rel->rd_id);
+	modstate->foreigntableid = rel->rd_id;
+	modstate->log_duration = multicorn_log_min_duration >= 0;
+	initConversioninfo(modstate->cinfos, TupleDescGetAttInMetadata(desc));
+	modstate->batch_size = 1;
+	if (canBufferInserts(mtstate, resultRelInfo))
+	{
+		modstate->batch_size = getIntegerOption(rel->rd_id, "batch_size", 1);
+	}
+	return modstate;
+}
+
+/*
+ * Send the buffered rows to the python bulk_insert method.
+ */
+static void
+flushInsertBatch(MulticornModifyState * modstate)
+{
+	PyObject   *p_batch = modstate->p_insert_batch,
+			   *p_result;
+	instr_time	start;
+
+	if (p_batch == NULL)
+	{
+		return;
+	}
+	modstate->p_insert_batch = NULL;
+	countTableStat(modstate->foreigntableid, insert_calls);
+	if (modstate->log_duration)
+	{
+		INSTR_TIME_SET_CURRENT(start);
+	}
+	p_result = PyObject_CallMethod(modstate->fdw_instance, "bulk_insert",
+								   "(O)", p_batch);
+	if (modstate->log_duration)
+	{
+		accumScanTime(&modstate->stats.execute_time, start);
+	}
+	Py_DECREF(p_batch);
+	errorCheck();
+	Py_XDECREF(p_result);
+}
+
+/*
+ * multicornBeginForeignModify
+ *		Initialize a foreign write operation.
+ */
+static void
+multicornBeginForeignModify(ModifyTableState *mtstate,
+							ResultRelInfo *resultRelInfo,
+							List *fdw_private,
+							int subplan_index,
+							int eflags)
+{
+	MulticornModifyState *modstate = initModifyState(mtstate, resultRelInfo);
+	Relation	rel = resultRelInfo->ri_RelationDesc;
+	TupleDesc	desc = RelationGetDescr(rel);
+#if PG_VERSION_NUM >= 140000
+	PlanState  *ps = outerPlanState(mtstate);
+#else
+	PlanState  *ps = mtstate->mt_plans[subplan_index];
+#endif
+	Plan	   *subplan = ps->plan;
+	int			i;
+
+	modstate->rowidAttrName = getRowIdColumn(modstate->fdw_instance);
+	if (ps->ps_ResultTupleSlot)
+	{
+		TupleDesc	resultTupleDesc = ps->ps_ResultTupleSlot->tts_tupleDescriptor;
+
+		modstate->resultCinfos = palloc0(sizeof(ConversionInfo *) *
+										 resultTupleDesc->natts);
+		initConversioninfo(modstate->resultCinfos, TupleDescGetAttInMetadata(resultTupleDesc));
+	}
+	for (i = 0; i < desc->natts; i++)
+	{
+		Form_pg_attribute att = TupleDescAttr(desc, i);
+
+		if (!att->attisdropped)
+		{
+			if (strcmp(NameStr(att->attname), modstate->rowidAttrName) == 0)
+			{
+				modstate->rowidCinfo = modstate->cinfos[i];
+				break;
+			}
+		}
+	}
+	modstate->rowidAttno = ExecFindJunkAttributeInTlist(subplan->targetlist, modstate->rowidAttrName);
+	resultRelInfo->ri_FdwState = modstate;
+}
+
+/*
+ * multicornExecForeignInsert
+ *		Execute a foreign insert operation
+ *		This is done by calling the python "insert" method.
  */
-static List *
-multicornPlanForeignModify(PlannerInfo *root,
-						   ModifyTable *plan,
-						   Index resultRelation,
-						   int subplan_index)
+static TupleTableSlot *
+multicornExecForeignInsert(EState *estate, ResultRelInfo *resultRelInfo,
+						   TupleTableSlot *slot, TupleTableSlot *planSlot)
 {
-	return NULL;
+	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
+	PyObject   *fdw_instance = modstate->fdw_instance;
+	PyObject   *values = tupleTableSlotToPyObject(slot, modstate->cinfos);
+	PyObject   *p_new_value;
+	instr_time	start;
+
+	modstate->stats.rows++;
+	if (modstate->batch_size > 1)
+	{
+		/* The row is sent later, with the whole batch. */
+		if (modstate->p_insert_batch == NULL)
+		{
+			modstate->p_insert_batch = PyList_New(0);
+		}
+		PyList_Append(modstate->p_insert_batch, values);
+		Py_DECREF(values);
+		if (PyList_Size(modstate->p_insert_batch) >= modstate->batch_size)
+		{
+			flushInsertBatch(modstate);
+		}
+		return slot;
+	}
+	countTableStat(modstate->foreigntableid, insert_calls);
+	if (modstate->log_duration)
+	{
+		INSTR_TIME_SET_CURRENT(start);
+	}
+	p_new_value = PyObject_CallMethod(fdw_instance, "insert", "(O)", values);
+	if (modstate->log_duration)
+	{
+		accumScanTime(&modstate->stats.execute_time, start);
+	}
+	errorCheck();
+	if (p_new_value && p_new_value != Py_None)
+	{
+		ExecClearTuple(slot);
+		pythonResultToTuple(p_new_value, slot, modstate->cinfos, modstate->buffer);
+		ExecStoreVirtualTuple(slot);
+	}
+	Py_XDECREF(p_new_value);
+	Py_DECREF(values);
+	errorCheck();
+	return slot;
+}
+
+/*
+ * multicornExecForeignDelete
+ *		Execute a foreign delete operation
+ *		This is done by calling the python "delete" method, with the opaque
+ *		rowid that was supplied.
+ */
+static TupleTableSlot *
+multicornExecForeignDelete(EState *estate, ResultRelInfo *resultRelInfo,
+						   TupleTableSlot *slot, TupleTableSlot *planSlot)
+{
+	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
+	PyObject   *fdw_instance = modstate->fdw_instance,
+			   *p_row_id,
+			   *p_new_value;
+	bool		is_null;
+	ConversionInfo *cinfo = modstate->rowidCinfo;
+	Datum		value = ExecGetJunkAttribute(planSlot, modstate->rowidAttno, &is_null);
+	instr_time	start;
+
+	p_row_id = datumToPython(value, cinfo->atttypoid, cinfo);
+	countTableStat(modstate->foreigntableid, delete_calls);
+	modstate->stats.rows++;
+	if (modstate->log_duration)
+	{
+		INSTR_TIME_SET_CURRENT(start);
+	}
+	p_new_value = PyObject_CallMethod(fdw_instance, "delete", "(O)", p_row_id);
+	if (modstate->log_duration)
+	{
+		accumScanTime(&modstate->stats.execute_time, start);
+	}
+	errorCheck();
+	if (p_new_value == NULL || p_new_value == Py_None)
+	{
+		Py_XDECREF(p_new_value);
+		p_new_value = tupleTableSlotToPyObject(planSlot, modstate->resultCinfos);
+	}
+	ExecClearTuple(slot);
+	pythonResultToTuple(p_new_value, slot, modstate->cinfos, modstate->buffer);
+	ExecStoreVirtualTuple(slot);
+	Py_DECREF(p_new_value);
+	Py_DECREF(p_row_id);
+	errorCheck();
+	return slot;
+}
+
+/*
+ * multicornExecForeignUpdate
+ *		Execute a foreign update operation
+ *		This is done by calling the python "update" method, with the opaque
+ *		rowid that was supplied.
+ */
+static TupleTableSlot *
+multicornExecForeignUpdate(EState *estate, ResultRelInfo *resultRelInfo,
+						   TupleTableSlot *slot, TupleTableSlot *planSlot)
+{
+	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
+	PyObject   *fdw_instance = modstate->fdw_instance,
+			   *p_row_id,
+			   *p_new_value,
+			   *p_value = tupleTableSlotToPyObject(slot, modstate->cinfos);
+	bool		is_null;
+	ConversionInfo *cinfo = modstate->rowidCinfo;
+	Datum		value = ExecGetJunkAttribute(planSlot, modstate->rowidAttno, &is_null);
+	instr_time	start;
+
+	p_row_id = datumToPython(value, cinfo->atttypoid, cinfo);
+	countTableStat(modstate->foreigntableid, update_calls);
+	modstate->stats.rows++;
+	if (modstate->log_duration)
+	{
+		INSTR_TIME_SET_CURRENT(start);
+	}
+	p_new_value = PyObject_CallMethod(fdw_instance, "update", "(O,O)", p_row_id,
+									  p_value);
+	if (modstate->log_duration)
+	{
+		accumScanTime(&modstate->stats.execute_time, start);
+	}
+	errorCheck();
+	if (p_new_value != NULL && p_new_value != Py_None)
+	{
+		ExecClearTuple(slot);
+		pythonResultToTuple(p_new_value, slot, modstate->cinfos, modstate->buffer);
+		ExecStoreVirtualTuple(slot);
+	}
+	Py_XDECREF(p_new_value);
+	Py_DECREF(p_row_id);
+	errorCheck();
+	return slot;
+}
+
+/*
+ * multicornEndForeignModify
+ *		Clean internal state after a modify operation.
+ */
+static void
+multicornEndForeignModify(EState *estate, ResultRelInfo *resultRelInfo)
+
+{
+	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
+	PyObject   *result;
+
+	flushInsertBatch(modstate);
+	result = PyObject_CallMethod(modstate->fdw_instance, "end_modify", "()");
+	errorCheck();
+	if (modstate->log_duration &&
+		INSTR_TIME_GET_MILLISEC(modstate->stats.execute_time) >= multicorn_log_min_duration)
+	{
+		ereport(LOG,
+				(errmsg("multicorn modification of %s: duration %.3f ms",
+						qualifiedTableName(modstate->foreigntableid),
+						INSTR_TIME_GET_MILLISEC(modstate->stats.execute_time)),
+				 errdetail("Wrapper: %s\nRows: " INT64_FORMAT,
+						   wrapperClassName(modstate->fdw_instance),
+						   modstate->stats.rows),
+				 errhidestmt(true)));
+	}
+	Py_DECREF(modstate->fdw_instance);
+	Py_DECREF(result);
+	invalidateResultCache(RelationGetRelid(resultRelInfo->ri_RelationDesc));
+}
+
+#if PG_VERSION_NUM >= 110000
+/*
+ * multicornBeginForeignInsert
+ *		Initialize an insert into a foreign table which is not the target of
+ *		a ModifyTable plan: a COPY FROM, or a row routed to a partition.
+ */
+static void
+multicornBeginForeignInsert(ModifyTableState *mtstate,
+							ResultRelInfo *resultRelInfo)
+{
+	resultRelInfo->ri_FdwState = initModifyState(mtstate, resultRelInfo);
+}
+
+/*
+ * multicornEndForeignInsert
+ *		Send the remaining buffered rows, and clean the insert state.
+ */
+static void
+multicornEndForeignInsert(EState *estate, ResultRelInfo *resultRelInfo)
+{
+	multicornEndForeignModify(estate, resultRelInfo);
+}
+#endif
+
+#if PG_VERSION_NUM >= 140000
+/*
+ * multicornGetForeignModifyBatchSize
+ *		Let the executor batch the inserted rows, according to the
+ *		batch_size option.
+ */
+static int
+multicornGetForeignModifyBatchSize(ResultRelInfo *resultRelInfo)
+{
+	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
+
+	if (resultRelInfo->ri_projectReturning != NULL ||
+		resultRelInfo->ri_WithCheckOptions != NIL)
+	{
+		return 1;
+	}
+	if (modstate != NULL)
+	{
+		return modstate->batch_size;
+	}
+	if (!canBufferInserts(NULL, resultRelInfo))
+	{
+		return 1;
+	}
+	return getIntegerOption(RelationGetRelid(resultRelInfo->ri_RelationDesc),
+							"batch_size", 1);
+}
+
+/*
+ * multicornExecForeignBatchInsert
+ *		Insert the rows batched by the executor, by calling the python
+ *		"bulk_insert" method.
+ */
+static TupleTableSlot **
+multicornExecForeignBatchInsert(EState *estate, ResultRelInfo *resultRelInfo,
+								TupleTableSlot **slots,
+								TupleTableSlot **planSlots, int *numSlots)
+{
+	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
+	int			i;
+
+	modstate->stats.rows += *numSlots;
+	for (i = 0; i < *numSlots; i++)
+	{
+		PyObject   *values = tupleTableSlotToPyObject(slots[i],
+													  modstate->cinfos);
+
+		if (modstate->p_insert_batch == NULL)
+		{
+			modstate->p_insert_batch = PyList_New(0);
+		}
+		PyList_Append(modstate->p_insert_batch, values);
+		Py_DECREF(values);
+	}
+	flushInsertBatch(modstate);
+	return slots;
+}
+#endif
+
+#if PG_VERSION_NUM >= 120000
+/*
+ * multicornPlanDirectModify
+ *		Check if an UPDATE or DELETE can be applied by the python
+ *		implementation without fetching the rows, and replace the foreign
+ *		scan accordingly.
+ *
+ *		This is only possible if every restriction was converted to a qual
+ *		known while planning, and if the new values are constants.
+ */
+static bool
+multicornPlanDirectModify(PlannerInfo *root,
+						  ModifyTable *plan,
+						  Index resultRelation,
+						  int subplan_index)
+{
+	CmdType		operation = plan->operation;
+	ForeignScan *fscan;
+	MulticornPlanState *planstate;
+	List	   *assignments = NIL;
+	ListCell   *lc;
+
+	if (operation != CMD_UPDATE && operation != CMD_DELETE)
+	{
+		return false;
+	}
+#if PG_VERSION_NUM >= 140000
+	fscan = (ForeignScan *) outerPlan(plan);
+#else
+	fscan = (ForeignScan *) list_nth(plan->plans, subplan_index);
+#endif
+	/* The rows must come from a plain scan of the modified table. */
+	if (!IsA(fscan, ForeignScan) || fscan->scan.scanrelid != resultRelation)
+	{
+		return false;
+	}
+	if (plan->returningLists != NIL)
+	{
+		return false;
+	}
+	planstate = (MulticornPlanState *) find_base_rel(root,
+												resultRelation)->fdw_private;
+	if (!hasPlanningQualsOnly(planstate))
+	{
+		return false;
+	}
+	if (operation == CMD_UPDATE)
+	{
+		List	   *tlist = NIL;
+		List	   *attnums = NIL;
+		ListCell   *lc2;
+#if PG_VERSION_NUM >= 140000
+		get_translated_update_targetlist(root, resultRelation, &tlist,
+										 &attnums);
+#else
+		RangeTblEntry *rte = planner_rt_fetch(resultRelation, root);
+		Bitmapset  *updated = bms_union(rte->updatedCols,
+										rte->extraUpdatedCols);
+		int			col = -1;
+
+		while ((col = bms_next_member(updated, col)) >= 0)
+		{
+			AttrNumber	attnum = col + FirstLowInvalidHeapAttributeNumber;
+
+			attnums = lappend_int(attnums, attnum);
+			tlist = lappend(tlist,
+							get_tle_by_resno(fscan->scan.plan.targetlist,
+											 attnum));
+		}
+#endif
+		forboth(lc, tlist, lc2, attnums)
+		{
+			TargetEntry *tle = (TargetEntry *) lfirst(lc);
+			AttrNumber	attnum = lfirst_int(lc2);
+
+			if (attnum <= InvalidAttrNumber || tle == NULL ||
+				!IsA(tle->expr, Const))
+			{
+				return false;
+			}
+			assignments = lappend(assignments,
+								  list_make2(makeInteger(attnum), tle->expr));
+		}
+	}
+	if (!canModifyDirectly(planstate, operation, assignments))
+	{
+		return false;
+	}
+	fscan->operation = operation;
+#if PG_VERSION_NUM >= 140000
+	fscan->resultRelation = resultRelation;
+#endif
+	/* No row is fetched: the restrictions are only enforced remotely. */
+	fscan->scan.plan.qual = NIL;
+	/* The restrictions are still extracted from fdw_exprs. */
+	fscan->fdw_private = list_make3(makeInteger(operation), assignments,
+									makeInteger(plan->canSetTag));
+	return true;
 }
 
-
 /*
- * multicornBeginForeignModify
- *		Initialize a foreign write operation.
+ * multicornBeginDirectModify
+ *		Initialize a direct modification of the foreign table.
  */
 static void
-multicornBeginForeignModify(ModifyTableState *mtstate,
-							ResultRelInfo *resultRelInfo,
-							List *fdw_private,
-							int subplan_index,
-							int eflags)
+multicornBeginDirectModify(ForeignScanState *node, int eflags)
 {
-	MulticornModifyState *modstate = palloc0(sizeof(MulticornModifyState));
-	Relation	rel = resultRelInfo->ri_RelationDesc;
+	ForeignScan *fscan = (ForeignScan *) node->ss.ps.plan;
+	Relation	rel = node->ss.ss_currentRelation;
 	TupleDesc	desc = RelationGetDescr(rel);
-	PlanState  *ps = mtstate->mt_plans[subplan_index];
-	Plan	   *subplan = ps->plan;
-	MemoryContext oldcontext;
-	int			i;
+	MulticornDirectModifyState *dmstate;
+	ListCell   *lc;
 
-	modstate->cinfos = palloc0(sizeof(ConversionInfo *) *
-							   desc->natts);
-	modstate->buffer = makeStringInfo();
-	modstate->fdw_instance = getInstance(rel->rd_id);
-	modstate->rowidAttrName = getRowIdColumn(modstate->fdw_instance);
-	initConversioninfo(modstate->cinfos, TupleDescGetAttInMetadata(desc));
-	oldcontext = MemoryContextSwitchTo(TopMemoryContext);
-	MemoryContextSwitchTo(oldcontext);
-	if (ps->ps_ResultTupleSlot)
+	if (eflags & EXEC_FLAG_EXPLAIN_ONLY)
 	{
-		TupleDesc	resultTupleDesc = ps->ps_ResultTupleSlot->tts_tupleDescriptor;
-
-		modstate->resultCinfos = palloc0(sizeof(ConversionInfo *) *
-										 resultTupleDesc->natts);
-		initConversioninfo(modstate->resultCinfos, TupleDescGetAttInMetadata(resultTupleDesc));
+		return;
 	}
-	for (i = 0; i < desc->natts; i++)
+	dmstate = palloc0(sizeof(MulticornDirectModifyState));
+	dmstate->cinfos = palloc0(sizeof(ConversionInfo *) * desc->natts);
+	initConversioninfo(dmstate->cinfos, TupleDescGetAttInMetadata(desc));
+	dmstate->fdw_instance = getInstance(RelationGetRelid(rel));
+	dmstate->operation = (CmdType) intVal(linitial(fscan->fdw_private));
+	dmstate->assignments = (List *) lsecond(fscan->fdw_private);
+	dmstate->set_processed = intVal(lthird(fscan->fdw_private));
+	foreach(lc, fscan->fdw_exprs)
 	{
-		Form_pg_attribute att = TupleDescAttr(desc, i);
-
-		if (!att->attisdropped)
-		{
-			if (strcmp(NameStr(att->attname), modstate->rowidAttrName) == 0)
-			{
-				modstate->rowidCinfo = modstate->cinfos[i];
-				break;
-			}
-		}
+		extractRestrictions(bms_make_singleton(fscan->scan.scanrelid),
+							((Expr *) lfirst(lc)),
+							&dmstate->qual_list);
 	}
-	modstate->rowidAttno = ExecFindJunkAttributeInTlist(subplan->targetlist, modstate->rowidAttrName);
-	resultRelInfo->ri_FdwState = modstate;
+	node->fdw_state = dmstate;
 }
 
 /*
- * multicornExecForeignInsert
- *		Execute a foreign insert operation
- *		This is done by calling the python "insert" method.
+ * multicornIterateDirectModify
+ *		Apply the modification, on the first call. No row is ever returned,
+ *		since RETURNING clauses are not supported.
  */
 static TupleTableSlot *
-multicornExecForeignInsert(EState *estate, ResultRelInfo *resultRelInfo,
-						   TupleTableSlot *slot, TupleTableSlot *planSlot)
+multicornIterateDirectModify(ForeignScanState *node)
 {
-	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
-	PyObject   *fdw_instance = modstate->fdw_instance;
-	PyObject   *values = tupleTableSlotToPyObject(slot, modstate->cinfos);
-	PyObject   *p_new_value = PyObject_CallMethod(fdw_instance, "insert", "(O)", values);
+	MulticornDirectModifyState *dmstate = node->fdw_state;
+	EState	   *estate = node->ss.ps.state;
 
-	errorCheck();
-	if (p_new_value && p_new_value != Py_None)
+	if (!dmstate->done)
 	{
-		ExecClearTuple(slot);
-		pythonResultToTuple(p_new_value, slot, modstate->cinfos, modstate->buffer);
-		ExecStoreVirtualTuple(slot);
+		Oid			foreigntableid = RelationGetRelid(node->ss.ss_currentRelation);
+		int64		processed;
+		instr_time	start,
+					duration;
+
+		if (dmstate->operation == CMD_UPDATE)
+		{
+			countTableStat(foreigntableid, update_calls);
+		}
+		else
+		{
+			countTableStat(foreigntableid, delete_calls);
+		}
+		INSTR_TIME_SET_CURRENT(start);
+		processed = modifyDirectly(dmstate);
+		INSTR_TIME_SET_CURRENT(duration);
+		INSTR_TIME_SUBTRACT(duration, start);
+		if (multicorn_log_min_duration >= 0 &&
+			INSTR_TIME_GET_MILLISEC(duration) >= multicorn_log_min_duration)
+		{
+			ereport(LOG,
+					(errmsg("multicorn modification of %s: duration %.3f ms",
+							qualifiedTableName(foreigntableid),
+							INSTR_TIME_GET_MILLISEC(duration)),
+					 errdetail("Wrapper: %s\nRows: " INT64_FORMAT,
+							   wrapperClassName(dmstate->fdw_instance),
+							   processed),
+					 errhidestmt(true)));
+		}
+
+		dmstate->done = true;
+		if (dmstate->set_processed)
+		{
+			estate->es_processed += processed;
+		}
 	}
-	Py_XDECREF(p_new_value);
-	Py_DECREF(values);
-	errorCheck();
-	return slot;
+	return ExecClearTuple(node->ss.ss_ScanTupleSlot);
 }
 
 /*
- * multicornExecForeignDelete
- *		Execute a foreign delete operation
- *		This is done by calling the python "delete" method, with the opaque
- *		rowid that was supplied.
+ * multicornEndDirectModify
+ *		Release the python instance.
  */
-static TupleTableSlot *
-multicornExecForeignDelete(EState *estate, ResultRelInfo *resultRelInfo,
-						   TupleTableSlot *slot, TupleTableSlot *planSlot)
+static void
+multicornEndDirectModify(ForeignScanState *node)
 {
-	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
-	PyObject   *fdw_instance = modstate->fdw_instance,
-			   *p_row_id,
-			   *p_new_value;
-	bool		is_null;
-	ConversionInfo *cinfo = modstate->rowidCinfo;
-	Datum		value = ExecGetJunkAttribute(planSlot, modstate->rowidAttno, &is_null);
+	MulticornDirectModifyState *dmstate = node->fdw_state;
 
-	p_row_id = datumToPython(value, cinfo->atttypoid, cinfo);
-	p_new_value = PyObject_CallMethod(fdw_instance, "delete", "(O)", p_row_id);
-	errorCheck();
-	if (p_new_value == NULL || p_new_value == Py_None)
+	if (dmstate == NULL)
 	{
-		Py_XDECREF(p_new_value);
-		p_new_value = tupleTableSlotToPyObject(planSlot, modstate->resultCinfos);
+		return;
 	}
-	ExecClearTuple(slot);
-	pythonResultToTuple(p_new_value, slot, modstate->cinfos, modstate->buffer);
-	ExecStoreVirtualTuple(slot);
-	Py_DECREF(p_new_value);
-	Py_DECREF(p_row_id);
-	errorCheck();
-	return slot;
+	Py_DECREF(dmstate->fdw_instance);
+	invalidateResultCache(RelationGetRelid(node->ss.ss_currentRelation));
 }
+#endif
 
+#if PG_VERSION_NUM >= 140000
 /*
- * multicornExecForeignUpdate
- *		Execute a foreign update operation
- *		This is done by calling the python "update" method, with the opaque
- *		rowid that was supplied.
+ * multicornIsForeignPathAsyncCapable
+ *		Check if a scan can be run asynchronously, as a child of an Append.
+ *		Pushed down joins and aggregations are always run synchronously.
  */
-static TupleTableSlot *
-multicornExecForeignUpdate(EState *estate, ResultRelInfo *resultRelInfo,
-						   TupleTableSlot *slot, TupleTableSlot *planSlot)
+static bool
+multicornIsForeignPathAsyncCapable(ForeignPath *path)
 {
-	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
-	PyObject   *fdw_instance = modstate->fdw_instance,
-			   *p_row_id,
-			   *p_new_value,
-			   *p_value = tupleTableSlotToPyObject(slot, modstate->cinfos);
-	bool		is_null;
-	ConversionInfo *cinfo = modstate->rowidCinfo;
-	Datum		value = ExecGetJunkAttribute(planSlot, modstate->rowidAttno, &is_null);
+	RelOptInfo *rel = path->path.parent;
+	MulticornPlanState *planstate = (MulticornPlanState *) rel->fdw_private;
 
-	p_row_id = datumToPython(value, cinfo->atttypoid, cinfo);
-	p_new_value = PyObject_CallMethod(fdw_instance, "update", "(O,O)", p_row_id,
-									  p_value);
-	errorCheck();
-	if (p_new_value != NULL && p_new_value != Py_None)
+	return IS_SIMPLE_REL(rel) && isAsyncCapable(planstate->fdw_instance);
+}
+
+/*
+ * Try to produce the next row of an asynchronous scan, and complete the
+ * request with it, or mark it as pending until the python result file
+ * descriptor becomes readable.
+ */
+static void
+produceAsyncTuple(AsyncRequest *areq)
+{
+	ForeignScanState *node = (ForeignScanState *) areq->requestee;
+	MulticornExecState *execstate = node->fdw_state;
+	TupleTableSlot *result;
+
+	execstate->in_async_request = true;
+	execstate->async_pending = false;
+	/*
+	 * Go through ExecScan, which checks the quals and projects the row, and
+	 * through the instrumentation of the node, like postgres_fdw does.
+	 */
+	result = ExecProcNode(areq->requestee);
+	execstate->in_async_request = false;
+	if (TupIsNull(result) && execstate->async_pending)
 	{
-		ExecClearTuple(slot);
-		pythonResultToTuple(p_new_value, slot, modstate->cinfos, modstate->buffer);
-		ExecStoreVirtualTuple(slot);
+		ExecAsyncRequestPending(areq);
+	}
+	else
+	{
+		ExecAsyncRequestDone(areq, result);
 	}
-	Py_XDECREF(p_new_value);
-	Py_DECREF(p_row_id);
-	errorCheck();
-	return slot;
 }
 
 /*
- * multicornEndForeignModify
- *		Clean internal state after a modify operation.
+ * multicornForeignAsyncRequest
+ *		Asynchronously request the next row of the scan.
  */
 static void
-multicornEndForeignModify(EState *estate, ResultRelInfo *resultRelInfo)
+multicornForeignAsyncRequest(AsyncRequest *areq)
+{
+	produceAsyncTuple(areq);
+}
 
+/*
+ * multicornForeignAsyncConfigureWait
+ *		Wait for the python result file descriptor to become readable.
+ */
+static void
+multicornForeignAsyncConfigureWait(AsyncRequest *areq)
 {
-	MulticornModifyState *modstate = resultRelInfo->ri_FdwState;
-	PyObject   *result = PyObject_CallMethod(modstate->fdw_instance, "end_modify", "()");
+	ForeignScanState *node = (ForeignScanState *) areq->requestee;
+	AppendState *requestor = (AppendState *) areq->requestor;
 
-	errorCheck();
-	Py_DECREF(modstate->fdw_instance);
-	Py_DECREF(result);
+	AddWaitEventToSet(requestor->as_eventset, WL_SOCKET_READABLE,
+					  asyncResultFileno(node->fdw_state), NULL, areq);
+}
+
+/*
+ * multicornForeignAsyncNotify
+ *		Rows are available from the python result: produce the next one.
+ */
+static void
+multicornForeignAsyncNotify(AsyncRequest *areq)
+{
+	produceAsyncTuple(areq);
 }
+#endif
 
 /*
  * Callback used to propagate a subtransaction end.
@@ -858,6 +3042,7 @@ multicorn_subxact_callback(SubXactEvent event, SubTransactionId mySubid,
 			continue;
 
 		instance = entry->value;
+		countTableStat(entry->hashkey, xact_calls);
 		if (event == SUBXACT_EVENT_PRE_COMMIT_SUB)
 		{
 			PyObject_CallMethod(instance, "sub_commit", "(i)", curlevel);
@@ -872,6 +3057,51 @@ multicorn_subxact_callback(SubXactEvent event, SubTransactionId mySubid,
 }
 #endif
 
+/*
+ * Callback marking the instance of a foreign table as needing a check of its
+ * options and columns, when its relcache entry is invalidated: after an
+ * ALTER FOREIGN TABLE, for example.
+ */
+static void
+multicorn_relcache_callback(Datum arg, Oid relid)
+{
+	HASH_SEQ_STATUS status;
+	CacheEntry *entry;
+
+	if (relid != InvalidOid)
+	{
+		entry = hash_search(InstancesHash, &relid, HASH_FIND, NULL);
+		if (entry != NULL)
+		{
+			entry->valid = false;
+		}
+		return;
+	}
+	hash_seq_init(&status, InstancesHash);
+	while ((entry = (CacheEntry *) hash_seq_search(&status)) != NULL)
+	{
+		entry->valid = false;
+	}
+}
+
+/*
+ * Callback marking every instance as needing a check of its options, when a
+ * foreign table, server or user mapping is changed. Those changes are rare
+ * enough not to bother finding the affected instances.
+ */
+static void
+multicorn_syscache_callback(Datum arg, int cacheid, uint32 hashvalue)
+{
+	HASH_SEQ_STATUS status;
+	CacheEntry *entry;
+
+	hash_seq_init(&status, InstancesHash);
+	while ((entry = (CacheEntry *) hash_seq_search(&status)) != NULL)
+	{
+		entry->valid = false;
+	}
+}
+
 /*
  * Callback used to propagate pre-commit / commit / rollback.
  */
@@ -893,14 +3123,17 @@ multicorn_xact_callback(XactEvent event, void *arg)
 		{
 #if PG_VERSION_NUM >= 90300
 			case XACT_EVENT_PRE_COMMIT:
+				countTableStat(entry->hashkey, xact_calls);
 				PyObject_CallMethod(instance, "pre_commit", "()");
 				break;
 #endif
 			case XACT_EVENT_COMMIT:
+				countTableStat(entry->hashkey, xact_calls);
 				PyObject_CallMethod(instance, "commit", "()");
 				entry->xact_depth = 0;
 				break;
 			case XACT_EVENT_ABORT:
+				countTableStat(entry->hashkey, xact_calls);
 				PyObject_CallMethod(instance, "rollback", "()");
 				entry->xact_depth = 0;
 				break;
@@ -909,6 +3142,20 @@ multicorn_xact_callback(XactEvent event, void *arg)
 		}
 		errorCheck();
 	}
+	switch (event)
+	{
+		case XACT_EVENT_COMMIT:
+		case XACT_EVENT_ABORT:
+		case XACT_EVENT_PREPARE:
+#if PG_VERSION_NUM >= 90500
+		case XACT_EVENT_PARALLEL_COMMIT:
+		case XACT_EVENT_PARALLEL_ABORT:
+#endif
+			flushTableStats();
+			break;
+		default:
+			break;
+	}
 }
 
 #if PG_VERSION_NUM >= 90500
@@ -1014,6 +3261,142 @@ multicornImportForeignSchema(ImportForeignSchemaStmt * stmt,
 	Py_DECREF(p_tables);
 	return cmds;
 }
+
+/*
+ * multicornAnalyzeForeignTable
+ *		Gather the statistics of a foreign table from a sample of its rows.
+ */
+static bool
+multicornAnalyzeForeignTable(Relation relation,
+							 AcquireSampleRowsFunc *func,
+							 BlockNumber *totalpages)
+{
+	*func = multicornAcquireSampleRows;
+	/* There are no pages, but this marks the table as analyzed. */
+	*totalpages = 1;
+	return true;
+}
+
+/*
+ * multicornAcquireSampleRows
+ *		Sample the rows returned by the python analyze method, or by the
+ *		execute method if it is not implemented.
+ *
+ *		The rows are sampled with Vitter's reservoir algorithm, as in
+ *		file_fdw.
+ */
+static int
+multicornAcquireSampleRows(Relation relation, int elevel,
+						   HeapTuple *rows, int targrows,
+						   double *totalrows,
+						   double *totaldeadrows)
+{
+	TupleDesc	desc = RelationGetDescr(relation);
+	MulticornExecState *execstate = palloc0(sizeof(MulticornExecState));
+	TupleTableSlot *slot;
+	MemoryContext tupcontext,
+				oldcontext;
+	ReservoirStateData rstate;
+	double		rowstoskip = -1;
+	double		seenrows = 0;
+	double		knownrows;
+	int			numrows = 0;
+
+	execstate->fdw_instance = getInstance(RelationGetRelid(relation));
+	execstate->cinfos = palloc0(sizeof(ConversionInfo *) * desc->natts);
+	initConversioninfo(execstate->cinfos, TupleDescGetAttInMetadata(desc));
+	execstate->buffer = makeStringInfo();
+	execstate->numattrs = desc->natts;
+	execstate->p_iterator = getAnalyzeIterator(execstate, desc, targrows,
+											   &knownrows);
+#if PG_VERSION_NUM >= 120000
+	slot = MakeSingleTupleTableSlot(desc, &TTSOpsVirtual);
+#else
+	slot = MakeSingleTupleTableSlot(desc);
+#endif
+	tupcontext = AllocSetContextCreate(CurrentMemoryContext,
+									   "multicorn analyze",
+									   ALLOCSET_DEFAULT_MINSIZE,
+									   ALLOCSET_DEFAULT_INITSIZE,
+									   ALLOCSET_DEFAULT_MAXSIZE);
+	reservoir_init_selection_state(&rstate, targrows);
+	for (;;)
+	{
+		bool		found;
+		HeapTuple	tuple;
+
+		vacuum_delay_point();
+		MemoryContextReset(tupcontext);
+		oldcontext = MemoryContextSwitchTo(tupcontext);
+		ExecClearTuple(slot);
+		if (execstate->batch_mode)
+		{
+			found = nextBatchedTuple(execstate, slot);
+		}
+		else
+		{
+			PyObject   *p_value = PyIter_Next(execstate->p_iterator);
+
+			errorCheck();
+			found = p_value != NULL && p_value != Py_None;
+			if (found)
+			{
+				pythonResultToTuple(p_value, slot, execstate->cinfos,
+									execstate->buffer);
+			}
+			Py_XDECREF(p_value);
+		}
+		MemoryContextSwitchTo(oldcontext);
+		if (!found)
+		{
+			break;
+		}
+		tuple = heap_form_tuple(desc, slot->tts_values, slot->tts_isnull);
+		if (numrows < targrows)
+		{
+			rows[numrows++] = tuple;
+		}
+		else
+		{
+			/*
+			 * Once the reservoir is full, each new row replaces a random one
+			 * with a decreasing probability.
+			 */
+			if (rowstoskip < 0)
+			{
+				rowstoskip = reservoir_get_next_S(&rstate, seenrows, targrows);
+			}
+			if (rowstoskip <= 0)
+			{
+#if PG_VERSION_NUM >= 150000
+				int			k = (int) (targrows * sampler_random_fract(&rstate.randstate));
+#else
+				int			k = (int) (targrows * sampler_random_fract(rstate.randstate));
+#endif
+
+				heap_freetuple(rows[k]);
+				rows[k] = tuple;
+			}
+			else
+			{
+				heap_freetuple(tuple);
+			}
+			rowstoskip -= 1;
+		}
+		seenrows += 1;
+	}
+	releaseBatch(execstate);
+	Py_DECREF(execstate->p_iterator);
+	Py_DECREF(execstate->fdw_instance);
+	ExecDropSingleTupleTableSlot(slot);
+	MemoryContextDelete(tupcontext);
+	*totalrows = knownrows >= 0 ? knownrows : seenrows;
+	*totaldeadrows = 0;
+	ereport(elevel,
+			(errmsg("\"%s\": collected %d sample rows out of %.0f total rows",
+					RelationGetRelationName(relation), numrows, *totalrows)));
+	return numrows;
+}
 #endif
 
 
@@ -1033,6 +3416,30 @@ serializePlanState(MulticornPlanState * state)
 	result = lappend(result, state->target_list);
 
 	result = lappend(result, serializeDeparsedSortGroup(state->pathkeys));
+	result = lappend(result, makeConst(INT8OID,
+					-1, InvalidOid, 8, Int64GetDatum(state->limit), false, FLOAT8PASSBYVAL));
+	result = lappend(result, makeConst(INT8OID,
+					-1, InvalidOid, 8, Int64GetDatum(state->offset), false, FLOAT8PASSBYVAL));
+	result = lappend(result, state->group_by);
+	result = lappend(result, state->aggregates);
+	result = lappend(result, state->base_clauses);
+	result = lappend(result, makeConst(INT4OID,
+					-1, InvalidOid, 4, Int32GetDatum(state->scan_relid), false, true));
+	if (state->join_type != NULL)
+	{
+		result = lappend(result, makeString(state->join_type));
+	}
+	else
+	{
+		result = lappend(result, NULL);
+	}
+	result = lappend(result, state->join_clauses);
+	result = lappend(result, state->inner_target_list);
+	result = lappend(result, state->inner_clauses);
+	result = lappend(result, makeConst(INT4OID,
+					-1, InvalidOid, 4, Int32GetDatum(state->inner_relid), false, true));
+	result = lappend(result, makeConst(INT4OID,
+					-1, InvalidOid, 4, Int32GetDatum(state->inner_foreigntableid), false, true));
 
 	return result;
 }
@@ -1055,9 +3462,26 @@ initializeExecState(void *internalstate)
 	execstate->target_list = copyObject(lthird(values));
 	pathkeys = lfourth(values);
 	execstate->pathkeys = deserializeDeparsedSortGroup(pathkeys);
+	execstate->limit = DatumGetInt64(((Const *) list_nth(values, 4))->constvalue);
+	execstate->offset = DatumGetInt64(((Const *) list_nth(values, 5))->constvalue);
+	execstate->group_by = copyObject(list_nth(values, 6));
+	execstate->aggregates = copyObject(list_nth(values, 7));
+	execstate->base_clauses = copyObject(list_nth(values, 8));
+	execstate->scan_relid = DatumGetInt32(((Const *) list_nth(values, 9))->constvalue);
+	execstate->foreigntableid = foreigntableid;
+	if (list_nth(values, 10) != NULL)
+	{
+		execstate->join_type = pstrdup(strVal(list_nth(values, 10)));
+	}
+	execstate->join_clauses = copyObject(list_nth(values, 11));
+	execstate->inner_target_list = copyObject(list_nth(values, 12));
+	execstate->inner_clauses = copyObject(list_nth(values, 13));
+	execstate->inner_relid = DatumGetInt32(((Const *) list_nth(values, 14))->constvalue);
+	execstate->inner_foreigntableid = DatumGetObjectId(((Const *) list_nth(values, 15))->constvalue);
 	execstate->fdw_instance = getInstance(foreigntableid);
 	execstate->buffer = makeStringInfo();
 	execstate->cinfos = palloc0(sizeof(ConversionInfo *) * attnum);
+	execstate->numattrs = attnum;
 	execstate->values = palloc(attnum * sizeof(Datum));
 	execstate->nulls = palloc(attnum * sizeof(bool));
 	return execstate;
@@ -13,6 +13,10 @@
 #include "nodes/bitmapset.h"
 #include "nodes/makefuncs.h"
 #include "nodes/pg_list.h"
+#include "portability/instr_time.h"
+#if PG_VERSION_NUM >= 90600
+#include "port/atomics.h"
+#endif
 
 #if PG_VERSION_NUM < 120000
 #include "nodes/relation.h"
@@ -25,6 +29,17 @@
 
 /* Data structures */
 
+/*
+ * Python int check which does not accept booleans, since their textual
+ * representation ("True", "False") is not a valid integer.
+ */
+#if PY_MAJOR_VERSION >= 3
+#define PyIntegral_Check(o) (PyLong_Check(o) && !PyBool_Check(o))
+#else
+#define PyIntegral_Check(o) ((PyInt_Check(o) || PyLong_Check(o)) && \
+							 !PyBool_Check(o))
+#endif
+
 #define C_LOG(...) do { \
 	errstart(NOTICE, __FILE__, __LINE__, PG_FUNCNAME_MACRO, TEXTDOMAIN); \
 	errmsg(__VA_ARGS__); \
@@ -39,6 +54,14 @@ typedef struct CacheEntry
 	List	   *options;
 	List	   *columns;
 	int			xact_depth;
+	/*
+	 * False if the catalogs changed since the options and columns were last
+	 * checked, and the user they were checked for.
+	 */
+	bool		valid;
+	Oid			userid;
+	/* Cached answers of the planner methods, see cachedPlannerCall */
+	PyObject   *planner_cache;
 	/* Keep the "options" and "columns" in a specific context to avoid leaks. */
 	MemoryContext cacheContext;
 }	CacheEntry;
@@ -56,6 +79,16 @@ typedef struct ConversionInfo
 	bool		is_array;
 	int			attndims;
 	bool		need_quote;
+	/* Interned python string of the column name, see internedColumnName */
+	PyObject   *attrkey;
+	/*
+	 * Converters specialised for the column type, resolved once by
+	 * initConverters. to_datum is NULL if values have to go through their
+	 * text representation.
+	 */
+	bool		(*to_datum) (PyObject *object, struct ConversionInfo *cinfo,
+							 Datum *value);
+	PyObject   *(*to_python) (Datum datum, struct ConversionInfo *cinfo);
 }	ConversionInfo;
 
 
@@ -78,24 +111,218 @@ typedef struct MulticornPlanState
 	 * getRelSize to GetForeignPlan.
 	 */
 	int width;
+
+	/* True if every restriction clause could be converted to a qual */
+	bool		quals_supported;
+
+	/*
+	 * For a path pushing down a limit on top of our scan: the scanned base
+	 * relation, and the limit and offset (-1 and 0 if none).
+	 */
+	Index		scan_relid;
+	int64		limit;
+	int64		offset;
+
+	/*
+	 * For a path pushing down an aggregation: the grouping columns names,
+	 * the deparsed aggregates, the target list of the grouped rows and the
+	 * restriction clauses of the scanned relation.
+	 */
+	List	   *group_by;
+	List	   *aggregates;
+	List	   *scan_tlist;
+	List	   *base_clauses;
+
+	/*
+	 * For a path pushing down a join, in which this state describes the
+	 * outer relation: the join type, the deparsed join clauses, and the
+	 * inner relation with its needed columns and restriction clauses.
+	 */
+	char	   *join_type;
+	List	   *join_clauses;
+	Oid			inner_foreigntableid;
+	Index		inner_relid;
+	List	   *inner_target_list;
+	List	   *inner_clauses;
 }	MulticornPlanState;
 
+/*
+ * A column from a column-oriented batch. If the python object exposes a
+ * one-dimensional buffer of a supported format, values are read directly
+ * from it.
+ */
+typedef struct MulticornBatchColumn
+{
+	PyObject   *p_column;
+	Py_buffer	view;
+	bool		has_view;
+	char		format;
+}	MulticornBatchColumn;
+
+#if PG_VERSION_NUM >= 90600
+/*
+ * Shared state of a parallel scan: the partitions are claimed in turn by
+ * each participant, using the atomic counter.
+ */
+typedef struct MulticornParallelState
+{
+	pg_atomic_uint32 next_partition;
+	/* -1 if the scan is not split */
+	int32		partitions_count;
+	/* Pickled list of partition descriptors */
+	Size		size;
+	char		data[FLEXIBLE_ARRAY_MEMBER];
+}	MulticornParallelState;
+#endif
+
+/*
+ * Time spent by a scan in python and converting its rows, and the amount of
+ * data converted.
+ */
+typedef struct MulticornScanStats
+{
+	/* Calls to execute */
+	instr_time	execute_time;
+	/* Fetching rows or batches from the iterator */
+	instr_time	fetch_time;
+	/* Converting python values to datums */
+	instr_time	convert_time;
+	int64		rows;
+	/* Non null values */
+	int64		cells;
+	/* Bytes of the values converted through their text representation */
+	int64		text_bytes;
+}	MulticornScanStats;
+
+/*
+ * Cumulative statistics of a foreign table, see stats.c.
+ */
+typedef struct MulticornTableStats
+{
+	int64		scans;
+	int64		rows;
+	/* Milliseconds spent in execute and fetching rows */
+	double		total_python_time;
+	/* Longest single scan */
+	double		max_python_time;
+	int64		planner_calls;
+	int64		insert_calls;
+	int64		update_calls;
+	int64		delete_calls;
+	/* begin, commit, rollback and their subtransaction variants */
+	int64		xact_calls;
+}	MulticornTableStats;
+
+/*
+ * Increment a counter of the statistics of a foreign table, if they are
+ * collected.
+ */
+#define countTableStat(foreigntableid, counter) do { \
+	MulticornTableStats *table_stats_ = pendingTableStats(foreigntableid); \
+	if (table_stats_ != NULL) \
+		table_stats_->counter++; \
+} while (0)
+
 typedef struct MulticornExecState
 {
 	/* instance and iterator */
 	PyObject   *fdw_instance;
 	PyObject   *p_iterator;
+	/* Current chunk of rows when the fdw yields batches */
+	bool		batch_mode;
+	PyObject   *p_batch;
+	Py_ssize_t	batch_pos;
+	Py_ssize_t	batch_size;
+	/* Per attribute columns, if the current batch is column-oriented */
+	MulticornBatchColumn *batch_columns;
+	AttrNumber	numattrs;
+	/* Partitions of the scan, and the one currently scanned */
+	PyObject   *p_partitions;
+	PyObject   *p_partition;
+#if PG_VERSION_NUM >= 90600
+	MulticornParallelState *pstate;
+	int32		partitions_count;
+	char	   *partitions_data;
+	Size		partitions_size;
+#endif
 	/* Information carried from the plan phase. */
 	List	   *target_list;
 	List	   *qual_list;
 	Datum	   *values;
 	bool	   *nulls;
 	ConversionInfo **cinfos;
+	/*
+	 * Indexes of the attributes the plan needs from the scanned rows, or NULL
+	 * if every attribute is needed.
+	 */
+	AttrNumber *needed_attnums;
+	int			needed_count;
 	/* Common buffer to avoid repeated allocations */
 	StringInfo	buffer;
 	AttrNumber	rowidAttno;
 	char	   *rowidAttrName;
 	List	   *pathkeys; /* list of MulticornDeparsedSortGroup) */
+	/* Limit and offset pushed down to the scan (-1 and 0 if none) */
+	int64		limit;
+	int64		offset;
+	/* Aggregation pushed down to the scan, if any */
+	List	   *group_by;
+	List	   *aggregates;
+	/* Scanned relation, and conversion info for its quals */
+	Oid			foreigntableid;
+	Index		scan_relid;
+	List	   *base_clauses;
+	ConversionInfo **qual_cinfos;
+	/* Join pushed down to the scan, if any */
+	char	   *join_type;
+	List	   *join_clauses;
+	PyObject   *p_inner_instance;
+	Oid			inner_foreigntableid;
+	Index		inner_relid;
+	List	   *inner_target_list;
+	List	   *inner_clauses;
+	List	   *inner_qual_list;
+	ConversionInfo **inner_qual_cinfos;
+	/*
+	 * Asynchronous scan: the result of execute_async, and whether no row was
+	 * available when processing the current asynchronous request.
+	 */
+	bool		async_mode;
+	bool		in_async_request;
+	bool		async_pending;
+	PyObject   *p_async_result;
+	/*
+	 * Results of a scan depending on parameters, by quals, and the number of
+	 * rows which can still be added to it.
+	 */
+	PyObject   *p_param_cache;
+	Py_ssize_t	param_cache_rows;
+	/*
+	 * Lifetime in seconds of the results in the result cache shared by the
+	 * backends (0 if not cached), and size of the cache in kilobytes.
+	 */
+	int			cache_ttl;
+	int			cache_size;
+	/*
+	 * Statistics of the scan, only gathered if track_stats is set. The rows
+	 * are only timed one by one if time_rows is set too.
+	 */
+	bool		track_stats;
+	bool		time_rows;
+	MulticornScanStats stats;
+	/*
+	 * Counters returned by the scan_stats method after each execution of the
+	 * scan, only gathered for EXPLAIN ANALYZE.
+	 */
+	PyObject   *p_scan_stats;
+	/*
+	 * Quals, columns and sort keys of the last execute, kept if the scan
+	 * may be logged by multicorn.log_min_duration.
+	 */
+	bool		log_duration;
+	PyObject   *p_log_context;
+	/* AND / OR / NOT trees of quals, if the python class asks for them */
+	List	   *bool_qual_list;
 }	MulticornExecState;
 
 typedef struct MulticornModifyState
@@ -103,12 +330,30 @@ typedef struct MulticornModifyState
 	ConversionInfo **cinfos;
 	ConversionInfo **resultCinfos;
 	PyObject   *fdw_instance;
+	Oid			foreigntableid;
 	StringInfo	buffer;
 	AttrNumber	rowidAttno;
 	char	   *rowidAttrName;
 	ConversionInfo *rowidCinfo;
+	/* Inserted rows waiting to be sent to bulk_insert, if batching */
+	int			batch_size;
+	PyObject   *p_insert_batch;
+	/* Rows modified and time spent in python, for multicorn.log_min_duration */
+	bool		log_duration;
+	MulticornScanStats stats;
 }	MulticornModifyState;
 
+typedef struct MulticornDirectModifyState
+{
+	PyObject   *fdw_instance;
+	ConversionInfo **cinfos;
+	CmdType		operation;
+	List	   *assignments;
+	List	   *qual_list;
+	bool		set_processed;
+	bool		done;
+}	MulticornDirectModifyState;
+
 
 typedef struct MulticornBaseQual
 {
@@ -139,6 +384,17 @@ typedef struct MulticornParamQual
 	Expr	   *expr;
 }	MulticornParamQual;
 
+/*
+ * An AND, OR or NOT combination of quals, whose right_type is T_BoolExpr.
+ * Its args are quals of any kind, including other combinations.
+ */
+typedef struct MulticornBoolQual
+{
+	MulticornBaseQual base;
+	BoolExprType boolop;
+	List	   *args;
+}	MulticornBoolQual;
+
 typedef struct MulticornDeparsedSortGroup
 {
 	Name 			attname;
@@ -160,16 +416,35 @@ PyObject   *getInstance(Oid foreigntableid);
 PyObject   *qualToPyObject(Expr *expr, PlannerInfo *root);
 PyObject   *getClassString(const char *className);
 PyObject   *execute(ForeignScanState *state, ExplainState *es);
+PyObject   *execQualsToPyList(ForeignScanState *node);
+#if PG_VERSION_NUM >= 90600
+void		getScanPartitions(ForeignScanState *node);
+bool		claimScanPartition(MulticornExecState * state);
+#endif
+bool		isParallelSafe(PyObject *fdw_instance);
+bool		isAsyncCapable(PyObject *fdw_instance);
+bool		wantsBoolQuals(PyObject *fdw_instance);
+void		initParamCache(MulticornExecState * state);
+PyObject *getAnalyzeIterator(MulticornExecState * state, TupleDesc desc,
+				   int targrows, double *totalrows);
+int			asyncResultFileno(MulticornExecState * state);
+bool		nextBatchedTuple(MulticornExecState * state, TupleTableSlot *slot);
+void		releaseBatch(MulticornExecState * state);
+void		accumScanTime(instr_time *counter, instr_time start);
 void pythonResultToTuple(PyObject *p_value,
 					TupleTableSlot *slot,
 					ConversionInfo ** cinfos,
 					StringInfo buffer);
+void pythonResultToScanTuple(PyObject *p_value,
+						TupleTableSlot *slot,
+						MulticornExecState * state);
+PyObject   *internedColumnName(const char *attrname);
 PyObject   *tupleTableSlotToPyObject(TupleTableSlot *slot, ConversionInfo ** cinfos);
 char	   *getRowIdColumn(PyObject *fdw_instance);
 PyObject   *optionsListToPyDict(List *options);
 const char *getPythonEncodingName(void);
 
-void getRelSize(MulticornPlanState * state,
+bool getRelSize(MulticornPlanState * state,
 		PlannerInfo *root,
 		double *rows,
 		int *width);
@@ -178,6 +453,22 @@ List	   *pathKeys(MulticornPlanState * state);
 
 List	   *canSort(MulticornPlanState * state, List *deparsed);
 
+bool		canLimit(MulticornPlanState * state, int64 limit, int64 offset);
+
+List	   *exactClauses(MulticornPlanState * state, Relids base_relids,
+						 List *clauses);
+
+bool		canAggregate(MulticornPlanState * state, List *group_by,
+			 List *aggregates);
+
+bool canJoin(MulticornPlanState * outerstate, MulticornPlanState * innerstate,
+		char *join_type, List *join_clauses);
+
+bool canModifyDirectly(MulticornPlanState * state, CmdType operation,
+				  List *assignments);
+
+int64		modifyDirectly(MulticornDirectModifyState * dmstate);
+
 CacheEntry *getCacheEntry(Oid foreigntableid);
 UserMapping *multicorn_GetUserMapping(Oid userid, Oid serverid);
 
@@ -190,6 +481,7 @@ extern PGDLLIMPORT HTAB *InstancesHash;
 void extractRestrictions(Relids base_relids,
 					Expr *node,
 					List **quals);
+MulticornBaseQual *extractBoolQual(Relids base_relids, Expr *node);
 List	   *extractColumns(List *reltargetlist, List *restrictinfolist);
 void initConversioninfo(ConversionInfo ** cinfo,
 		AttInMetadata *attinmeta);
@@ -209,10 +501,18 @@ List	*findPaths(PlannerInfo *root, RelOptInfo *baserel, List *possiblePaths,
 List        *deparse_sortgroup(PlannerInfo *root, Oid foreigntableid, RelOptInfo *rel);
 
 PyObject   *datumToPython(Datum node, Oid typeoid, ConversionInfo * cinfo);
+void		initConverters(ConversionInfo * cinfo);
 
 List	*serializeDeparsedSortGroup(List *pathkeys);
 List	*deserializeDeparsedSortGroup(List *items);
 
+/* stats.c */
+void		initTableStats(void);
+bool		tableStatsEnabled(void);
+MulticornTableStats *pendingTableStats(Oid foreigntableid);
+void		reportScanStats(Oid foreigntableid, MulticornScanStats * scanstats);
+void		flushTableStats(void);
+
 #endif   /* PG_MULTICORN_H */
 
 char	   *PyUnicode_AsPgString(PyObject *p_unicode);
@@ -1,13 +1,23 @@
 #include <Python.h>
-#include "datetime.h"
 #include "postgres.h"
 #include "multicorn.h"
 #include "catalog/pg_user_mapping.h"
 #include "access/reloptions.h"
 #include "miscadmin.h"
+#include <math.h>
+#include <time.h>
+#include "pgtime.h"
 #include "utils/numeric.h"
 #include "utils/date.h"
+#include "utils/datetime.h"
+/* The datetime.h header of python uses the same include guard. */
+#undef DATETIME_H
+#include "datetime.h"
 #include "utils/timestamp.h"
+#include "utils/uuid.h"
+#if PG_VERSION_NUM >= 90400
+#include "utils/jsonb.h"
+#endif
 #include "utils/array.h"
 #include "utils/catcache.h"
 #include "utils/memutils.h"
@@ -29,6 +39,11 @@ bool		compareColumns(List *columns1, List *columns2);
 
 PyObject   *getClass(PyObject *className);
 PyObject   *valuesToPySet(List *targetlist);
+PyObject   *valuesToPyList(List *values);
+PyObject   *aggregatesToPyList(List *aggregates);
+PyObject   *joinClausesToPyList(List *join_clauses);
+static PyObject *qualListToPyList(ForeignScanState *node, List *qual_list,
+				 ConversionInfo ** cinfos);
 PyObject   *qualDefsToPyList(List *quallist, ConversionInfo ** cinfo);
 PyObject *pythonQual(char *operatorname, PyObject *value,
 		   ConversionInfo * cinfo,
@@ -42,6 +57,19 @@ MulticornDeparsedSortGroup *getDeparsedSortGroup(PyObject *key);
 
 Datum pyobjectToDatum(PyObject *object, StringInfo buffer,
 				ConversionInfo * cinfo);
+
+/* Python to datum functions, bypassing the type input function */
+bool		pyintToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value);
+bool		pyfloatToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value);
+bool		pyboolToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value);
+bool		pyintToNumericDatum(PyObject *object, ConversionInfo * cinfo,
+					Datum *value);
+bool		pydateToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value);
+bool		pydatetimeToDatum(PyObject *object, ConversionInfo * cinfo,
+				  Datum *value);
+bool		pyuuidToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value);
+bool		pytimedeltaToDatum(PyObject *object, ConversionInfo * cinfo,
+				   Datum *value);
 PyObject   *qualdefToPython(MulticornConstQual * qualdef, ConversionInfo ** cinfo);
 PyObject *paramDefToPython(List *paramdef, ConversionInfo ** cinfos,
 				 Oid typeoid,
@@ -57,6 +85,18 @@ PyObject   *datumIntToPython(Datum datum, ConversionInfo * cinfo);
 PyObject   *datumArrayToPython(Datum datum, Oid type, ConversionInfo * cinfo);
 PyObject   *datumByteaToPython(Datum datum, ConversionInfo * cinfo);
 PyObject   *datumUnknownToPython(Datum datum, ConversionInfo * cinfo, Oid type);
+PyObject   *datumInt2ToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumInt8ToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumFloat4ToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumFloat8ToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumBoolToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumUuidToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumTimestamptzToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumIntervalToPython(Datum datum, ConversionInfo * cinfo);
+PyObject   *datumJsonToPython(Datum datum, ConversionInfo * cinfo);
+#if PG_VERSION_NUM >= 90400
+PyObject   *datumJsonbToPython(Datum datum, ConversionInfo * cinfo);
+#endif
 
 
 void pythonDictToTuple(PyObject *p_value,
@@ -96,6 +136,77 @@ void appendBinaryStringInfoQuote(StringInfo buffer,
 
 
 static void begin_remote_xact(CacheEntry * entry);
+static void importDateTimeApi(void);
+static PyObject *getUuidClass(void);
+static void accumScanTuple(MulticornExecState * state, TupleTableSlot *slot,
+			   int64 text_bytes);
+
+/* Those are only defined starting with 9.5 */
+#ifndef PG_INT16_MIN
+#define PG_INT16_MIN	(-0x7FFF-1)
+#define PG_INT16_MAX	(0x7FFF)
+#define PG_INT32_MIN	(-0x7FFFFFFF-1)
+#define PG_INT32_MAX	(0x7FFFFFFF)
+#define PG_INT64_MAX	INT64CONST(0x7FFFFFFFFFFFFFFF)
+#endif
+
+/* Native timestamp and interval conversions require integer datetimes. */
+#if PG_VERSION_NUM >= 100000 || defined(HAVE_INT64_TIMESTAMP)
+#define MULTICORN_INT64_TIMESTAMP
+#endif
+
+/* The uuid.UUID class, imported on first use. */
+static PyObject *uuidClass = NULL;
+
+/* The json.loads function, imported on first use. */
+static PyObject *jsonLoads = NULL;
+
+/* Bytes converted through the text representation, for scan statistics */
+static int64 textConversionBytes = 0;
+
+/*
+ * Array types for which we know the element type without a catalog lookup.
+ * Older releases do not define all of them.
+ */
+#ifndef BOOLARRAYOID
+#define BOOLARRAYOID 1000
+#endif
+#ifndef INT2ARRAYOID
+#define INT2ARRAYOID 1005
+#endif
+#ifndef INT4ARRAYOID
+#define INT4ARRAYOID 1007
+#endif
+#ifndef INT8ARRAYOID
+#define INT8ARRAYOID 1016
+#endif
+#ifndef TEXTARRAYOID
+#define TEXTARRAYOID 1009
+#endif
+#ifndef VARCHARARRAYOID
+#define VARCHARARRAYOID 1015
+#endif
+#ifndef FLOAT4ARRAYOID
+#define FLOAT4ARRAYOID 1021
+#endif
+#ifndef FLOAT8ARRAYOID
+#define FLOAT8ARRAYOID 1022
+#endif
+#ifndef NUMERICARRAYOID
+#define NUMERICARRAYOID 1231
+#endif
+#ifndef DATEARRAYOID
+#define DATEARRAYOID 1182
+#endif
+#ifndef TIMESTAMPARRAYOID
+#define TIMESTAMPARRAYOID 1115
+#endif
+#ifndef TIMESTAMPTZARRAYOID
+#define TIMESTAMPTZARRAYOID 1185
+#endif
+#ifndef UUIDARRAYOID
+#define UUIDARRAYOID 2951
+#endif
 
 /*
  * Get a (python) encoding name for an attribute.
@@ -269,6 +380,96 @@ valuesToPySet(List *targetlist)
 	return result;
 }
 
+/*
+ * Convert a list of Value nodes containing strings to a pylist of python
+ * unicode strings, keeping their order.
+ */
+PyObject *
+valuesToPyList(List *values)
+{
+	PyObject   *result = PyList_New(0);
+	ListCell   *lc;
+
+	foreach(lc, values)
+	{
+		PyObject   *pyString = PyString_FromString(strVal(lfirst(lc)));
+
+		PyList_Append(result, pyString);
+		Py_DECREF(pyString);
+	}
+	return result;
+}
+
+/*
+ * Convert a list of deparsed aggregates to a pylist of multicorn.Aggregate
+ * instances. Each deparsed aggregate is a list of two strings: the function
+ * name, and the column name (empty for count(*)).
+ */
+PyObject *
+aggregatesToPyList(List *aggregates)
+{
+	PyObject   *p_class = getClassString("multicorn.Aggregate"),
+			   *result = PyList_New(0);
+	ListCell   *lc;
+
+	foreach(lc, aggregates)
+	{
+		List	   *aggregate = (List *) lfirst(lc);
+		char	   *attname = strVal(lsecond(aggregate));
+		PyObject   *p_function = PyString_FromString(strVal(linitial(aggregate))),
+				   *p_attname,
+				   *p_aggregate;
+
+		if (*attname == '\0')
+		{
+			p_attname = Py_None;
+			Py_INCREF(p_attname);
+		}
+		else
+		{
+			p_attname = PyString_FromString(attname);
+		}
+		p_aggregate = PyObject_CallFunction(p_class, "(O,O)", p_function,
+											p_attname);
+		errorCheck();
+		PyList_Append(result, p_aggregate);
+		Py_DECREF(p_aggregate);
+		Py_DECREF(p_function);
+		Py_DECREF(p_attname);
+	}
+	Py_DECREF(p_class);
+	return result;
+}
+
+/*
+ * Convert a list of deparsed join clauses to a pylist of
+ * multicorn.JoinClause instances. Each deparsed clause is a list of three
+ * strings: the outer column name, the operator name and the inner column
+ * name.
+ */
+PyObject *
+joinClausesToPyList(List *join_clauses)
+{
+	PyObject   *p_class = getClassString("multicorn.JoinClause"),
+			   *result = PyList_New(0);
+	ListCell   *lc;
+
+	foreach(lc, join_clauses)
+	{
+		List	   *clause = (List *) lfirst(lc);
+		PyObject   *p_clause = PyObject_CallFunction(p_class, "(s,s,s)",
+													 strVal(linitial(clause)),
+													 strVal(lsecond(clause)),
+													 strVal(lthird(clause)));
+
+		errorCheck();
+		PyList_Append(result, p_clause);
+		Py_DECREF(p_clause);
+	}
+	Py_DECREF(p_class);
+	return result;
+}
+
 PyObject *
 qualDefsToPyList(List *qual_list, ConversionInfo ** cinfos)
 {
@@ -550,8 +751,12 @@ compareColumns(List *columns1, List *columns2)
 }
 
 
-CacheEntry *
-getCacheEntry(Oid foreigntableid)
+/*
+ * Build the python instance of a foreign table, or check that its options
+ * and columns did not change since it was built.
+ */
+static CacheEntry *
+checkCacheEntry(Oid foreigntableid)
 {
 	/*
 	 * create a temporary context. If we have to (re)create the python
@@ -583,6 +788,8 @@ getCacheEntry(Oid foreigntableid)
 		entry->columns = NULL;
 		entry->cacheContext = NULL;
 		entry->xact_depth = 0;
+		entry->planner_cache = NULL;
+		entry->valid = false;
 		needInitialization = true;
 	}
 	else
@@ -617,6 +824,9 @@ getCacheEntry(Oid foreigntableid)
 				   *p_instance;
 
 		entry->value = NULL;
+		/* The planner answers of the previous instance are obsolete. */
+		Py_XDECREF(entry->planner_cache);
+		entry->planner_cache = NULL;
 		getColumnsFromTable(desc, &p_columns, &columns);
 		PyDict_DelItemString(p_options, "wrapper");
 		p_instance = PyObject_CallFunction(p_class, "(O,O)", p_options,
@@ -647,6 +857,30 @@ getCacheEntry(Oid foreigntableid)
 		MemoryContextDelete(tempContext);
 	}
 	RelationClose(rel);
+	entry->valid = true;
+	entry->userid = GetUserId();
+	return entry;
+}
+
+/*
+ * Returns the cache entry of a foreign table, with a new reference to its
+ * python instance.
+ *
+ * The options and columns are only compared to the ones the instance was
+ * built with if the catalogs changed since then (see the invalidation
+ * callbacks in multicorn.c), or if the user changed.
+ */
+CacheEntry *
+getCacheEntry(Oid foreigntableid)
+{
+	CacheEntry *entry = hash_search(InstancesHash, &foreigntableid,
+									HASH_FIND, NULL);
+
+	if (entry == NULL || entry->value == NULL || !entry->valid ||
+		entry->userid != GetUserId())
+	{
+		entry = checkCacheEntry(foreigntableid);
+	}
 	Py_INCREF(entry->value);
 
 	/*
@@ -678,6 +912,7 @@ begin_remote_xact(CacheEntry * entry)
 	/* Start main transaction if we haven't yet */
 	if (entry->xact_depth <= 0)
 	{
+		countTableStat(entry->hashkey, xact_calls);
 		rv = PyObject_CallMethod(entry->value, "begin", "(i)", IsolationIsSerializable());
 		Py_XDECREF(rv);
 		errorCheck();
@@ -687,6 +922,7 @@ begin_remote_xact(CacheEntry * entry)
 	while (entry->xact_depth < curlevel)
 	{
 		entry->xact_depth++;
+		countTableStat(entry->hashkey, xact_calls);
 		rv = PyObject_CallMethod(entry->value, "sub_begin", "(i)", entry->xact_depth);
 		Py_XDECREF(rv);
 		errorCheck();
@@ -695,12 +931,173 @@ begin_remote_xact(CacheEntry * entry)
 
 
 
+/*
+ * Call a planner method of the python implementation, reusing its answer for
+ * the same key if it was cached less than _planner_cache_ttl seconds ago.
+ *
+ * The answers are kept in the instance cache entry, and dropped with the
+ * instance. A new reference is returned.
+ */
+static PyObject *
+cachedPlannerCall(MulticornPlanState * state, PyObject *p_key,
+				  const char *method, PyObject *p_args)
+{
+	PyObject   *p_ttl = PyObject_GetAttrString(state->fdw_instance,
+											   "_planner_cache_ttl"),
+			   *p_method,
+			   *p_result;
+	CacheEntry *entry = NULL;
+	double		now = (double) time(NULL);
+	double		ttl = 0;
+
+	errorCheck();
+	if (p_ttl != Py_None)
+	{
+		ttl = PyFloat_AsDouble(p_ttl);
+		errorCheck();
+	}
+	Py_DECREF(p_ttl);
+	if (ttl > 0)
+	{
+		entry = hash_search(InstancesHash, &state->foreigntableid, HASH_FIND,
+							NULL);
+	}
+	if (entry != NULL && entry->planner_cache != NULL)
+	{
+		PyObject   *p_cached = PyDict_GetItem(entry->planner_cache, p_key);
+
+		if (p_cached != NULL &&
+			PyFloat_AsDouble(PyTuple_GET_ITEM(p_cached, 0)) > now)
+		{
+			p_result = PyTuple_GET_ITEM(p_cached, 1);
+			Py_INCREF(p_result);
+			return p_result;
+		}
+	}
+	countTableStat(state->foreigntableid, planner_calls);
+	p_method = PyObject_GetAttrString(state->fdw_instance, method);
+	errorCheck();
+	p_result = PyObject_Call(p_method, p_args, NULL);
+	Py_DECREF(p_method);
+	errorCheck();
+	if (entry != NULL)
+	{
+		PyObject   *p_cached = Py_BuildValue("(dO)", now + ttl, p_result);
+
+		if (entry->planner_cache == NULL)
+		{
+			entry->planner_cache = PyDict_New();
+		}
+		PyDict_SetItem(entry->planner_cache, p_key, p_cached);
+		Py_DECREF(p_cached);
+		errorCheck();
+	}
+	return p_result;
+}
+
+/*
+ * Returns the clauses enforced by the python implementation, according to
+ * its exact_quals method. Only the clauses converted to a single qual whose
+ * value is known while planning are submitted.
+ */
+List *
+exactClauses(MulticornPlanState * state, Relids base_relids, List *clauses)
+{
+	List	   *candidates = NIL,
+			   *result = NIL;
+	PyObject   *p_quals = PyList_New(0),
+			   *p_exact,
+			   *p_iterator,
+			   *p_item;
+	ListCell   *lc;
+
+	foreach(lc, clauses)
+	{
+		Expr	   *clause = (Expr *) lfirst(lc);
+		List	   *quals = NIL;
+		PyObject   *p_clause_quals;
+
+		extractRestrictions(base_relids, clause, &quals);
+		if (list_length(quals) != 1)
+		{
+			continue;
+		}
+		p_clause_quals = qualDefsToPyList(quals, state->cinfos);
+		if (PyList_Size(p_clause_quals) == 1)
+		{
+			PyList_Append(p_quals, PyList_GET_ITEM(p_clause_quals, 0));
+			candidates = lappend(candidates, clause);
+		}
+		Py_DECREF(p_clause_quals);
+	}
+	if (candidates == NIL)
+	{
+		Py_DECREF(p_quals);
+		return NIL;
+	}
+	countTableStat(state->foreigntableid, planner_calls);
+	p_exact = PyObject_CallMethod(state->fdw_instance, "exact_quals", "(O)",
+								  p_quals);
+	errorCheck();
+	if (p_exact != Py_None)
+	{
+		p_iterator = PyObject_GetIter(p_exact);
+		errorCheck();
+		while ((p_item = PyIter_Next(p_iterator)) != NULL)
+		{
+			Py_ssize_t	i;
+
+			/* The quals are matched by identity, not by value. */
+			for (i = 0; i < PyList_Size(p_quals); i++)
+			{
+				if (PyList_GET_ITEM(p_quals, i) == p_item)
+				{
+					result = list_append_unique_ptr(result,
+													list_nth(candidates, i));
+					break;
+				}
+			}
+			Py_DECREF(p_item);
+		}
+		Py_DECREF(p_iterator);
+	}
+	Py_DECREF(p_exact);
+	Py_DECREF(p_quals);
+	errorCheck();
+	return result;
+}
+
+/*
+ * Build the shape of a list of quals, used as a planner cache key: the
+ * column and operator of each qual, but not its value.
+ */
+static PyObject *
+qualsShape(PyObject *p_quals)
+{
+	Py_ssize_t	size = PyList_Size(p_quals),
+				i;
+	PyObject   *result = PyTuple_New(size);
+
+	for (i = 0; i < size; i++)
+	{
+		PyObject   *p_qual = PyList_GetItem(p_quals, i),
+				   *p_field_name = PyObject_GetAttrString(p_qual, "field_name"),
+				   *p_operator = PyObject_GetAttrString(p_qual, "operator");
+
+		errorCheck();
+		PyTuple_SET_ITEM(result, i, PyTuple_Pack(2, p_field_name, p_operator));
+		Py_DECREF(p_field_name);
+		Py_DECREF(p_operator);
+	}
+	return result;
+}
+
 /*
  * Returns the relation estimated size, in term of number of rows and width.
  * This is done by calling the getRelSize python method.
- *
+ * False is returned if the python method does not estimate it.
  */
-void
+bool
 getRelSize(MulticornPlanState * state,
 		   PlannerInfo *root,
 		   double *rows,
@@ -715,26 +1112,192 @@ getRelSize(MulticornPlanState * state,
 
 	p_targets_set = valuesToPySet(state->target_list);
 	p_quals = qualDefsToPyList(state->qual_list, state->cinfos);
-	p_rows_and_width = PyObject_CallMethod(state->fdw_instance, "get_rel_size",
-										   "(O,O)", p_quals, p_targets_set);
-	errorCheck();
+	{
+		PyObject   *p_shape = qualsShape(p_quals),
+				   *p_columns = PyFrozenSet_New(p_targets_set),
+				   *p_key = Py_BuildValue("(sOO)", "get_rel_size", p_shape,
+										  p_columns),
+				   *p_args = PyTuple_Pack(2, p_quals, p_targets_set);
+
+		p_rows_and_width = cachedPlannerCall(state, p_key, "get_rel_size",
+											 p_args);
+		Py_DECREF(p_shape);
+		Py_DECREF(p_columns);
+		Py_DECREF(p_key);
+		Py_DECREF(p_args);
+	}
 	Py_DECREF(p_targets_set);
 	Py_DECREF(p_quals);
-	if ((p_rows_and_width == Py_None) || PyTuple_Size(p_rows_and_width) != 2)
+	p_startup_cost = PyNumber_Long(
+			   PyObject_GetAttrString(state->fdw_instance, "_startup_cost"));
+	state->startupCost = (int) PyLong_AsLong(p_startup_cost);
+	Py_DECREF(p_startup_cost);
+	if (p_rows_and_width == Py_None)
+	{
+		/* Let PostgreSQL estimate the size from the table statistics. */
+		Py_DECREF(p_rows_and_width);
+		return false;
+	}
+	if (PyTuple_Size(p_rows_and_width) != 2)
 	{
 		Py_DECREF(p_rows_and_width);
 		elog(ERROR, "The get_rel_size python method should return a tuple of length 2");
 	}
 	p_rows = PyNumber_Long(PyTuple_GetItem(p_rows_and_width, 0));
 	p_width = PyNumber_Long(PyTuple_GetItem(p_rows_and_width, 1));
-	p_startup_cost = PyNumber_Long(
-			   PyObject_GetAttrString(state->fdw_instance, "_startup_cost"));
 	*rows = PyLong_AsDouble(p_rows);
 	*width = (int) PyLong_AsLong(p_width);
-	state->startupCost = (int) PyLong_AsLong(p_startup_cost);
 	Py_DECREF(p_rows);
 	Py_DECREF(p_width);
 	Py_DECREF(p_rows_and_width);
+	return true;
+}
+
+/*
+ * Get an iterator over the rows to sample for ANALYZE, from the python
+ * analyze method, which also returns the total number of rows. If it returns
+ * None, every row returned by the execute method is sampled instead, and
+ * totalrows is set to -1.
+ */
+PyObject *
+getAnalyzeIterator(MulticornExecState * state, TupleDesc desc, int targrows,
+				   double *totalrows)
+{
+	PyObject   *p_result = PyObject_CallMethod(state->fdw_instance, "analyze",
+											   "(i)", targrows),
+			   *p_iterator;
+
+	errorCheck();
+	if (p_result == Py_None)
+	{
+		PyObject   *p_quals = PyList_New(0),
+				   *p_columns = PySet_New(0),
+				   *p_batch_results;
+		int			i;
+
+		for (i = 0; i < desc->natts; i++)
+		{
+			Form_pg_attribute attr = TupleDescAttr(desc, i);
+			PyObject   *p_column;
+
+			if (attr->attisdropped)
+			{
+				continue;
+			}
+			p_column = PyString_FromString(NameStr(attr->attname));
+			PySet_Add(p_columns, p_column);
+			Py_DECREF(p_column);
+		}
+		Py_DECREF(p_result);
+		p_result = PyObject_CallMethod(state->fdw_instance, "execute", "(O,O)",
+									   p_quals, p_columns);
+		Py_DECREF(p_quals);
+		Py_DECREF(p_columns);
+		errorCheck();
+		p_batch_results = PyObject_GetAttrString(state->fdw_instance,
+												 "_batch_results");
+		errorCheck();
+		state->batch_mode = PyObject_IsTrue(p_batch_results);
+		Py_DECREF(p_batch_results);
+		*totalrows = -1;
+	}
+	else
+	{
+		PyObject   *p_totalrows;
+
+		if (!PyTuple_Check(p_result) || PyTuple_Size(p_result) != 2)
+		{
+			Py_DECREF(p_result);
+			elog(ERROR, "The analyze python method should return a tuple of length 2");
+		}
+		p_totalrows = PyNumber_Float(PyTuple_GetItem(p_result, 0));
+		errorCheck();
+		*totalrows = PyFloat_AsDouble(p_totalrows);
+		Py_DECREF(p_totalrows);
+		p_iterator = PyTuple_GetItem(p_result, 1);
+		Py_INCREF(p_iterator);
+		Py_DECREF(p_result);
+		p_result = p_iterator;
+	}
+	if (p_result == Py_None)
+	{
+		/* No rows at all. */
+		Py_DECREF(p_result);
+		p_result = PyList_New(0);
+	}
+	p_iterator = PyObject_GetIter(p_result);
+	Py_DECREF(p_result);
+	errorCheck();
+	return p_iterator;
+}
+
+/*
+ * Check whether the python implementation allows its scans to be run by
+ * parallel workers.
+ */
+bool
+isParallelSafe(PyObject *fdw_instance)
+{
+	PyObject   *p_parallel_safe = PyObject_GetAttrString(fdw_instance,
+														 "_parallel_safe");
+	bool		result;
+
+	errorCheck();
+	result = PyObject_IsTrue(p_parallel_safe);
+	Py_DECREF(p_parallel_safe);
+	return result;
+}
+
+/*
+ * Check the "_async_capable" attribute of the python class, which tells
+ * whether scans can be run asynchronously with execute_async.
+ */
+bool
+isAsyncCapable(PyObject *fdw_instance)
+{
+	PyObject   *p_async_capable = PyObject_GetAttrString(fdw_instance,
+														 "_async_capable");
+	bool		result;
+
+	errorCheck();
+	result = PyObject_IsTrue(p_async_capable);
+	Py_DECREF(p_async_capable);
+	return result;
+}
+
+/*
+ * Check the "_bool_quals" attribute of the python class, which tells whether
+ * the AND / OR / NOT trees of quals are passed to execute.
+ */
+bool
+wantsBoolQuals(PyObject *fdw_instance)
+{
+	PyObject   *p_bool_quals = PyObject_GetAttrString(fdw_instance,
+													  "_bool_quals");
+	bool		result;
+
+	errorCheck();
+	result = PyObject_IsTrue(p_bool_quals);
+	Py_DECREF(p_bool_quals);
+	return result;
+}
+
+/*
+ * Get the file descriptor signaling that rows are available from the result
+ * of execute_async.
+ */
+int
+asyncResultFileno(MulticornExecState * state)
+{
+	PyObject   *p_fileno = PyObject_CallMethod(state->p_async_result,
+											   "fileno", "()");
+	int			result;
+
+	errorCheck();
+	result = (int) PyLong_AsLong(p_fileno);
+	Py_DECREF(p_fileno);
+	errorCheck();
+	return result;
 }
 
 PyObject *
@@ -894,22 +1457,26 @@ getDeparsedSortGroup(PyObject *sortKey)
 
 
 /*
- * Execute the query in the python fdw, and returns an iterator.
+ * Build the list of python quals for a scan, evaluating the parameters from
+ * the current execution context.
  */
 PyObject *
-execute(ForeignScanState *node, ExplainState *es)
+execQualsToPyList(ForeignScanState *node)
 {
 	MulticornExecState *state = node->fdw_state;
-	PyObject   *p_targets_set,
-			   *p_quals = PyList_New(0),
-			   *p_pathkeys = PyList_New(0),
-			   *p_iterable,
-			   *p_method;
-	ListCell   *lc;
 
-	ExprContext *econtext = node->ss.ps.ps_ExprContext;
+	return qualListToPyList(node, state->qual_list, state->qual_cinfos);
+}
 
-	foreach(lc, state->qual_list)
+static PyObject *
+qualListToPyList(ForeignScanState *node, List *qual_list,
+				 ConversionInfo ** cinfos)
+{
+	PyObject   *p_quals = PyList_New(0);
+	ListCell   *lc;
+	ExprContext *econtext = node->ss.ps.ps_ExprContext;
+
+	foreach(lc, qual_list)
 	{
 		MulticornBaseQual *qual = lfirst(lc);
 		MulticornConstQual *newqual = NULL;
@@ -944,7 +1511,7 @@ execute(ForeignScanState *node, ExplainState *es)
 		}
 		if (newqual != NULL)
 		{
-			PyObject   *python_qual = qualdefToPython((MulticornConstQual *) newqual, state->cinfos);
+			PyObject   *python_qual = qualdefToPython((MulticornConstQual *) newqual, cinfos);
 
 			if (python_qual != NULL)
 			{
@@ -953,6 +1520,286 @@ execute(ForeignScanState *node, ExplainState *es)
 			}
 		}
 	}
+	return p_quals;
+}
+
+/*
+ * Convert a qual, or a tree of quals, to python. Returns NULL if one of the
+ * quals has no python representation, such as a comparison with a column of
+ * another relation.
+ */
+static PyObject *
+boolQualToPython(ForeignScanState *node, MulticornBaseQual * qual,
+				 ConversionInfo ** cinfos)
+{
+	PyObject   *result = NULL;
+
+	if (qual->right_type == T_BoolExpr)
+	{
+		MulticornBoolQual *boolqual = (MulticornBoolQual *) qual;
+		PyObject   *p_args = PyList_New(0),
+				   *p_class;
+		ListCell   *lc;
+		char	   *opname;
+
+		foreach(lc, boolqual->args)
+		{
+			PyObject   *p_arg = boolQualToPython(node, lfirst(lc), cinfos);
+
+			if (p_arg == NULL)
+			{
+				Py_DECREF(p_args);
+				return NULL;
+			}
+			PyList_Append(p_args, p_arg);
+			Py_DECREF(p_arg);
+		}
+		switch (boolqual->boolop)
+		{
+			case AND_EXPR:
+				opname = "and";
+				break;
+			case OR_EXPR:
+				opname = "or";
+				break;
+			default:
+				opname = "not";
+				break;
+		}
+		p_class = getClassString("multicorn.BoolQual");
+		errorCheck();
+		result = PyObject_CallFunction(p_class, "(s,O)", opname, p_args);
+		Py_DECREF(p_class);
+		Py_DECREF(p_args);
+		errorCheck();
+	}
+	else
+	{
+		PyObject   *p_quals = qualListToPyList(node, list_make1(qual), cinfos);
+
+		if (PyList_Size(p_quals) == 1)
+		{
+			result = PyList_GET_ITEM(p_quals, 0);
+			Py_INCREF(result);
+		}
+		Py_DECREF(p_quals);
+	}
+	return result;
+}
+
+/*
+ * Build the list of the python trees of quals for a scan.
+ */
+static PyObject *
+boolQualsToPyList(ForeignScanState *node)
+{
+	MulticornExecState *state = node->fdw_state;
+	PyObject   *p_bool_quals = PyList_New(0);
+	ListCell   *lc;
+
+	foreach(lc, state->bool_qual_list)
+	{
+		PyObject   *p_bool_qual = boolQualToPython(node, lfirst(lc),
+												   state->qual_cinfos);
+
+		if (p_bool_qual != NULL)
+		{
+			PyList_Append(p_bool_quals, p_bool_qual);
+			Py_DECREF(p_bool_qual);
+		}
+	}
+	return p_bool_quals;
+}
+
+/*
+ * Set up the cache of the results of a scan depending on parameters, such as
+ * the inner side of a nested loop, according to the "_param_cache_rows"
+ * attribute of the python class.
+ */
+void
+initParamCache(MulticornExecState * state)
+{
+	ListCell   *lc;
+	PyObject   *p_cache_rows;
+
+	foreach(lc, state->qual_list)
+	{
+		if (((MulticornBaseQual *) lfirst(lc))->right_type == T_Param)
+		{
+			break;
+		}
+	}
+	if (lc == NULL)
+	{
+		return;
+	}
+	p_cache_rows = PyObject_GetAttrString(state->fdw_instance,
+										  "_param_cache_rows");
+	errorCheck();
+	if (p_cache_rows != Py_None)
+	{
+		state->param_cache_rows = PyLong_AsSsize_t(p_cache_rows);
+		errorCheck();
+	}
+	Py_DECREF(p_cache_rows);
+	if (state->param_cache_rows > 0)
+	{
+		state->p_param_cache = PyDict_New();
+	}
+}
+
+/*
+ * Build the key of the results of a scan in the parameters cache: the
+ * column, operator and value of each qual. Returns NULL if the results of
+ * this scan are not cached, or if a value is not hashable.
+ */
+static PyObject *
+paramCacheKey(MulticornExecState * state, ExplainState *es, PyObject *p_quals)
+{
+	Py_ssize_t	size = PyList_Size(p_quals),
+				i;
+	PyObject   *result;
+
+	if (es != NULL || state->p_param_cache == NULL ||
+		state->p_partition != NULL)
+	{
+		return NULL;
+	}
+	result = PyTuple_New(size);
+	for (i = 0; i < size; i++)
+	{
+		PyObject   *p_qual = PyList_GetItem(p_quals, i),
+				   *p_field_name = PyObject_GetAttrString(p_qual, "field_name"),
+				   *p_operator = PyObject_GetAttrString(p_qual, "operator"),
+				   *p_value = PyObject_GetAttrString(p_qual, "value");
+
+		errorCheck();
+		PyTuple_SET_ITEM(result, i, PyTuple_Pack(3, p_field_name, p_operator,
+												 p_value));
+		Py_DECREF(p_field_name);
+		Py_DECREF(p_operator);
+		Py_DECREF(p_value);
+	}
+	if (PyObject_Hash(result) == -1)
+	{
+		PyErr_Clear();
+		Py_DECREF(result);
+		return NULL;
+	}
+	return result;
+}
+
+/*
+ * Store the results of a scan in the parameters cache, unless they are
+ * already there or would not fit. Rows are only read ahead until they
+ * exceed the room left in the cache: the other ones are streamed after them.
+ * Returns the results, stealing the reference to the given iterable.
+ */
+static PyObject *
+cacheParamResults(MulticornExecState * state, PyObject *p_key,
+				  PyObject *p_iterable)
+{
+	PyObject   *p_iterator,
+			   *p_rows,
+			   *p_row,
+			   *p_chain,
+			   *p_result;
+
+	if (p_iterable == Py_None || PyDict_Contains(state->p_param_cache, p_key))
+	{
+		return p_iterable;
+	}
+	p_iterator = PyObject_GetIter(p_iterable);
+	Py_DECREF(p_iterable);
+	errorCheck();
+	p_rows = PyList_New(0);
+	while (PyList_GET_SIZE(p_rows) <= state->param_cache_rows)
+	{
+		p_row = PyIter_Next(p_iterator);
+		if (p_row == NULL)
+		{
+			errorCheck();
+			/* Every row was read: they fit in the cache. */
+			Py_DECREF(p_iterator);
+			PyDict_SetItem(state->p_param_cache, p_key, p_rows);
+			state->param_cache_rows -= PyList_GET_SIZE(p_rows);
+			return p_rows;
+		}
+		PyList_Append(p_rows, p_row);
+		Py_DECREF(p_row);
+	}
+	p_chain = getClassString("itertools.chain");
+	p_result = PyObject_CallFunctionObjArgs(p_chain, p_rows, p_iterator, NULL);
+	Py_DECREF(p_chain);
+	Py_DECREF(p_rows);
+	Py_DECREF(p_iterator);
+	errorCheck();
+	return p_result;
+}
+
+/*
+ * Call the execute method of the python fdw. For EXPLAIN ANALYZE, keep the
+ * counters of this execution if it started new ones, which is not the case
+ * if its results were found in the result cache.
+ */
+static PyObject *
+callExecute(MulticornExecState * state, ExplainState *es, PyObject *p_method,
+			PyObject *args, PyObject *kwargs)
+{
+	PyObject   *p_stats = NULL,
+			   *p_iterable,
+			   *p_new_stats;
+
+	if (es == NULL && state->p_scan_stats != NULL)
+	{
+		p_stats = PyObject_CallMethod(state->fdw_instance, "scan_stats", "()");
+		errorCheck();
+	}
+	p_iterable = PyObject_Call(p_method, args, kwargs);
+	errorCheck();
+	if (p_stats != NULL)
+	{
+		p_new_stats = PyObject_CallMethod(state->fdw_instance, "scan_stats",
+										  "()");
+		errorCheck();
+		if (p_new_stats != Py_None && p_new_stats != p_stats)
+		{
+			PyList_Append(state->p_scan_stats, p_new_stats);
+		}
+		Py_DECREF(p_new_stats);
+		Py_DECREF(p_stats);
+	}
+	return p_iterable;
+}
+
+/*
+ * Execute the query in the python fdw, and returns an iterator.
+ */
+PyObject *
+execute(ForeignScanState *node, ExplainState *es)
+{
+	MulticornExecState *state = node->fdw_state;
+	PyObject   *p_targets_set,
+			   *p_quals,
+			   *p_pathkeys = PyList_New(0),
+			   *p_iterable = NULL,
+			   *p_cache_key,
+			   *p_method;
+	ListCell   *lc;
+	instr_time	start;
+
+	if (state->track_stats && es == NULL)
+	{
+		INSTR_TIME_SET_CURRENT(start);
+	}
+	p_quals = execQualsToPyList(node);
+	p_cache_key = paramCacheKey(state, es, p_quals);
+	if (p_cache_key != NULL)
+	{
+		/* The same parameters were already used by a previous rescan. */
+		p_iterable = PyDict_GetItem(state->p_param_cache, p_cache_key);
+		Py_XINCREF(p_iterable);
+	}
 	/* Transform every object to a suitable python representation */
 	p_targets_set = valuesToPySet(state->target_list);
 
@@ -963,13 +1810,82 @@ execute(ForeignScanState *node, ExplainState *es)
 		PyList_Append(p_pathkeys, python_sortkey);
 		Py_DECREF(python_sortkey);
 	}
+	if (p_iterable == NULL)
 	{
 		PyObject * args,
 				 * kwargs = PyDict_New();
 		if(PyList_Size(p_pathkeys) > 0){
 			PyDict_SetItemString(kwargs, "sortkeys", p_pathkeys);
 		}
-		if(es != NULL){
+		if (state->bool_qual_list != NIL)
+		{
+			PyObject   *p_bool_quals = boolQualsToPyList(node);
+
+			if (PyList_Size(p_bool_quals) > 0)
+			{
+				PyDict_SetItemString(kwargs, "bool_quals", p_bool_quals);
+			}
+			Py_DECREF(p_bool_quals);
+		}
+		if (state->p_partition != NULL && es == NULL)
+		{
+			PyDict_SetItemString(kwargs, "partition", state->p_partition);
+		}
+		if (state->limit >= 0)
+		{
+			PyObject   *p_limit = PyLong_FromLongLong(state->limit);
+
+			PyDict_SetItemString(kwargs, "limit", p_limit);
+			Py_DECREF(p_limit);
+		}
+		if (state->offset > 0)
+		{
+			PyObject   *p_offset = PyLong_FromLongLong(state->offset);
+
+			PyDict_SetItemString(kwargs, "offset", p_offset);
+			Py_DECREF(p_offset);
+		}
+		if (state->group_by != NIL || state->aggregates != NIL)
+		{
+			PyObject   *p_group_by = valuesToPyList(state->group_by),
+					   *p_aggregates = aggregatesToPyList(state->aggregates);
+
+			PyDict_SetItemString(kwargs, "group_by", p_group_by);
+			PyDict_SetItemString(kwargs, "aggregates", p_aggregates);
+			Py_DECREF(p_group_by);
+			Py_DECREF(p_aggregates);
+		}
+		if (state->join_type != NULL)
+		{
+			PyObject   *p_clauses = joinClausesToPyList(state->join_clauses),
+					   *p_inner_quals = qualListToPyList(node,
+														 state->inner_qual_list,
+														 state->inner_qual_cinfos),
+					   *p_outer_columns = valuesToPyList(state->target_list),
+					   *p_inner_columns = valuesToPyList(state->inner_target_list);
+
+			if (es != NULL)
+			{
+				p_method = PyObject_GetAttrString(state->fdw_instance,
+												  "explain_join");
+				PyDict_SetItemString(kwargs, "verbose",
+									 es->verbose ? Py_True : Py_False);
+			}
+			else
+			{
+				p_method = PyObject_GetAttrString(state->fdw_instance,
+												  "execute_join");
+			}
+			errorCheck();
+			args = Py_BuildValue("(O,s,O,O,O,O,O)", state->p_inner_instance,
+								 state->join_type, p_clauses, p_quals,
+								 p_inner_quals, p_outer_columns,
+								 p_inner_columns);
+			Py_DECREF(p_clauses);
+			Py_DECREF(p_inner_quals);
+			Py_DECREF(p_outer_columns);
+			Py_DECREF(p_inner_columns);
+		} else if(es != NULL){
 			PyObject * verbose;
 			if(es->verbose){
 				verbose = Py_True;
@@ -981,31 +1897,85 @@ execute(ForeignScanState *node, ExplainState *es)
 			PyDict_SetItemString(kwargs, "verbose", verbose);
 			errorCheck();
 		} else {
-			p_method = PyObject_GetAttrString(state->fdw_instance, "execute");
+			p_method = PyObject_GetAttrString(state->fdw_instance,
+											  state->async_mode ?
+											  "execute_async" : "execute");
 			errorCheck();
+			if (state->cache_ttl > 0 && !state->async_mode &&
+				state->p_partition == NULL)
+			{
+				/* Results are shared with the other backends. */
+				PyObject   *p_cached_class = getClassString("multicorn.resultcache.CachedExecute"),
+						   *p_cached;
+
+				errorCheck();
+				p_cached = PyObject_CallFunction(p_cached_class, "(OIIIii)",
+												 p_method,
+												 MyDatabaseId,
+												 state->foreigntableid,
+												 GetUserId(),
+												 state->cache_ttl,
+												 state->cache_size);
+				Py_DECREF(p_cached_class);
+				Py_DECREF(p_method);
+				errorCheck();
+				p_method = p_cached;
+			}
 			args = PyTuple_Pack(2, p_quals, p_targets_set);
 			errorCheck();
 		}
-		p_iterable = PyObject_Call(p_method, args, kwargs);
-		errorCheck();
+		p_iterable = callExecute(state, es, p_method, args, kwargs);
 		Py_DECREF(p_method);
 		Py_DECREF(args);
 		Py_DECREF(kwargs);
 	}
 
 	errorCheck();
-	if (p_iterable == Py_None){
+	if (p_cache_key != NULL)
+	{
+		p_iterable = cacheParamResults(state, p_cache_key, p_iterable);
+		Py_DECREF(p_cache_key);
+	}
+	if (state->async_mode && es == NULL)
+	{
+		/* Rows are fetched from the result as they become available. */
+		state->p_async_result = p_iterable;
+		Py_INCREF(p_iterable);
+	}
+	else if (p_iterable == Py_None){
 		state->p_iterator = p_iterable;
+		Py_INCREF(p_iterable);
 	}
 	else
 	{
 		state->p_iterator = PyObject_GetIter(p_iterable);
 	}
+	/* Explain output is always consumed line by line. */
+	state->batch_mode = false;
+	if (es == NULL && !state->async_mode)
+	{
+		PyObject   *p_batch_results = PyObject_GetAttrString(state->fdw_instance,
+															   "_batch_results");
+
+		errorCheck();
+		state->batch_mode = PyObject_IsTrue(p_batch_results);
+		Py_DECREF(p_batch_results);
+	}
+	if (state->log_duration && es == NULL)
+	{
+		Py_XDECREF(state->p_log_context);
+		state->p_log_context = PyTuple_Pack(3, p_quals, p_targets_set,
+											p_pathkeys);
+	}
 	Py_DECREF(p_quals);
 	Py_DECREF(p_targets_set);
 	Py_DECREF(p_pathkeys);
 	Py_DECREF(p_iterable);
 	errorCheck();
+	if (state->track_stats && es == NULL)
+	{
+		accumScanTime(&state->stats.execute_time, start);
+	}
 	return state->p_iterator;
 }
 
@@ -1167,7 +2137,7 @@ pyobjectToCString(PyObject *pyobject, StringInfo buffer,
 		pymappingToCString(pyobject, buffer, cinfo);
 		return;
 	}
-	PyDateTime_IMPORT;
+	importDateTimeApi();
 	if (PyDate_Check(pyobject))
 	{
 		pydateToCString(pyobject, buffer, cinfo);
@@ -1191,6 +2161,61 @@ pyunknownToCstring(PyObject *pyobject, StringInfo buffer,
 	return;
 }
 
+/*
+ * Return the interned python string for a column name, used to look the
+ * column up in the mappings returned by the python implementation.
+ *
+ * Every scan of the column shares the same object, so the reference is
+ * never released.
+ */
+PyObject *
+internedColumnName(const char *attrname)
+{
+	PyObject   *p_key = PyString_FromString(attrname);
+
+#if PY_MAJOR_VERSION >= 3
+	PyUnicode_InternInPlace(&p_key);
+#else
+	PyString_InternInPlace(&p_key);
+#endif
+	return p_key;
+}
+
+/*
+ * Store the value of a column found in a python mapping in the slot.
+ */
+static void
+pythonMappingValueToSlot(PyObject *p_value, TupleTableSlot *slot, int i,
+						 ConversionInfo * cinfo, StringInfo buffer)
+{
+	PyObject   *p_object;
+
+	/* Plain dicts are looked up without going through the mapping protocol. */
+	if (PyDict_CheckExact(p_value))
+	{
+		p_object = PyDict_GetItem(p_value, cinfo->attrkey);
+		Py_XINCREF(p_object);
+	}
+	else
+	{
+		p_object = PyObject_GetItem(p_value, cinfo->attrkey);
+	}
+	if (p_object != NULL && p_object != Py_None)
+	{
+		resetStringInfo(buffer);
+		slot->tts_values[i] = pyobjectToDatum(p_object, buffer, cinfo);
+		slot->tts_isnull[i] = buffer->data == NULL;
+	}
+	else
+	{
+		/* "KeyError", doesnt matter. */
+		PyErr_Clear();
+		slot->tts_values[i] = (Datum) NULL;
+		slot->tts_isnull[i] = true;
+	}
+	Py_XDECREF(p_object);
+}
+
 void
 pythonDictToTuple(PyObject *p_value,
 				  TupleTableSlot *slot,
@@ -1198,13 +2223,9 @@ pythonDictToTuple(PyObject *p_value,
 				  StringInfo buffer)
 {
 	int			i;
-	PyObject   *p_object;
-	Datum	   *values = slot->tts_values;
-	bool	   *nulls = slot->tts_isnull;
 
 	for (i = 0; i < slot->tts_tupleDescriptor->natts; i++)
 	{
-		char	   *key;
 		Form_pg_attribute attr = TupleDescAttr(slot->tts_tupleDescriptor,i);
 		AttrNumber	cinfo_idx = attr->attnum - 1;
 
@@ -1212,31 +2233,7 @@ pythonDictToTuple(PyObject *p_value,
 		{
 			continue;
 		}
-		key = cinfos[cinfo_idx]->attrname;
-		p_object = PyMapping_GetItemString(p_value, key);
-		if (p_object != NULL && p_object != Py_None)
-		{
-			resetStringInfo(buffer);
-			values[i] = pyobjectToDatum(p_object,
-										buffer,
-										cinfos[cinfo_idx]);
-			if (buffer->data == NULL)
-			{
-				nulls[i] = true;
-			}
-			else
-			{
-				nulls[i] = false;
-			}
-		}
-		else
-		{
-			/* "KeyError", doesnt matter. */
-			PyErr_Clear();
-			values[i] = (Datum) NULL;
-			nulls[i] = true;
-		}
-		Py_XDECREF(p_object);
+		pythonMappingValueToSlot(p_value, slot, i, cinfos[cinfo_idx], buffer);
 	}
 }
 
@@ -1289,29 +2286,929 @@ pythonSequenceToTuple(PyObject *p_value,
 /*
  * Convert a python result (a sequence or a dictionary) to a tupletableslot.
  */
+#if PG_VERSION_NUM >= 90600
+/*
+ * Call the get_scan_partitions method from the python implementation.
+ *
+ * If the scan can be split, the list of partition descriptors is pickled and
+ * stored in the exec state, so that it can be copied to the shared memory
+ * segment of a parallel scan. Otherwise, the partitions count is set to -1.
+ */
 void
-pythonResultToTuple(PyObject *p_value,
-					TupleTableSlot *slot,
-					ConversionInfo ** cinfos,
-					StringInfo buffer)
+getScanPartitions(ForeignScanState *node)
 {
-	if (PySequence_Check(p_value))
+	MulticornExecState *state = node->fdw_state;
+	PyObject   *p_quals = execQualsToPyList(node),
+			   *p_targets_set = valuesToPySet(state->target_list),
+			   *p_partitions,
+			   *p_dumps,
+			   *p_pickled;
+	char	   *data;
+	Py_ssize_t	size;
+
+	p_partitions = PyObject_CallMethod(state->fdw_instance,
+									   "get_scan_partitions", "(O,O)",
+									   p_quals, p_targets_set);
+	Py_DECREF(p_quals);
+	Py_DECREF(p_targets_set);
+	errorCheck();
+	state->partitions_count = -1;
+	state->partitions_data = NULL;
+	state->partitions_size = 0;
+	if (p_partitions == Py_None)
 	{
-		pythonSequenceToTuple(p_value, slot, cinfos, buffer);
+		Py_DECREF(p_partitions);
+		return;
 	}
-	else
-	{
+	state->p_partitions = PySequence_List(p_partitions);
+	Py_DECREF(p_partitions);
+	errorCheck();
+	p_dumps = getClassString("pickle.dumps");
+	errorCheck();
+	p_pickled = PyObject_CallFunction(p_dumps, "(O,i)", state->p_partitions,
+									  2);
+	Py_DECREF(p_dumps);
+	errorCheck();
+	PyBytes_AsStringAndSize(p_pickled, &data, &size);
+	state->partitions_count = PyList_Size(state->p_partitions);
+	state->partitions_size = size;
+	state->partitions_data = palloc(size);
+	memcpy(state->partitions_data, data, size);
+	Py_DECREF(p_pickled);
+}
 
-		if (PyMapping_Check(p_value))
-		{
+/*
+ * Claim the next partition of a parallel scan, and store its descriptor in
+ * the exec state. Returns false if there is nothing left to scan.
+ *
+ * If the fdw did not split the scan, the first participant to get here scans
+ * the whole table.
+ */
+bool
+claimScanPartition(MulticornExecState * state)
+{
+	MulticornParallelState *pstate = state->pstate;
+	uint32		index = pg_atomic_fetch_add_u32(&pstate->next_partition, 1);
+
+	Py_XDECREF(state->p_partition);
+	state->p_partition = NULL;
+	if (pstate->partitions_count < 0)
+	{
+		return index == 0;
+	}
+	if (index >= (uint32) pstate->partitions_count)
+	{
+		return false;
+	}
+	if (state->p_partitions == NULL)
+	{
+		/* Workers only know about the pickled descriptors. */
+		PyObject   *p_loads = getClassString("pickle.loads"),
+				   *p_pickled;
+
+		errorCheck();
+#if PY_MAJOR_VERSION >= 3
+		p_pickled = PyBytes_FromStringAndSize(pstate->data, pstate->size);
+#else
+		p_pickled = PyString_FromStringAndSize(pstate->data, pstate->size);
+#endif
+		state->p_partitions = PyObject_CallFunctionObjArgs(p_loads, p_pickled,
+														   NULL);
+		Py_DECREF(p_pickled);
+		Py_DECREF(p_loads);
+		errorCheck();
+	}
+	state->p_partition = PySequence_GetItem(state->p_partitions, index);
+	errorCheck();
+	return true;
+}
+#endif
+
+/*
+ * Release the current batch, and the buffers held for its columns.
+ */
+void
+releaseBatch(MulticornExecState * state)
+{
+	AttrNumber	i;
+
+	if (state->batch_columns != NULL)
+	{
+		for (i = 0; i < state->numattrs; i++)
+		{
+			MulticornBatchColumn *column = &state->batch_columns[i];
+
+			if (column->has_view)
+			{
+				PyBuffer_Release(&column->view);
+				column->has_view = false;
+			}
+			Py_XDECREF(column->p_column);
+			column->p_column = NULL;
+		}
+		pfree(state->batch_columns);
+		state->batch_columns = NULL;
+	}
+	Py_XDECREF(state->p_batch);
+	state->p_batch = NULL;
+	state->batch_pos = 0;
+	state->batch_size = 0;
+}
+
+/*
+ * Get hold of a column from a column-oriented batch, using its buffer if
+ * it exposes one in a format we know how to read.
+ *
+ * Returns the number of values in the column.
+ */
+static Py_ssize_t
+initBatchColumn(MulticornBatchColumn * column, PyObject *p_column)
+{
+	if (PyObject_CheckBuffer(p_column) && !PyBytes_Check(p_column) &&
+		PyObject_GetBuffer(p_column, &column->view,
+						   PyBUF_STRIDES | PyBUF_FORMAT) == 0)
+	{
+		const char *format = column->view.format;
+
+		/* Only native single values are read directly. */
+		if (format != NULL && format[0] == '@')
+		{
+			format++;
+		}
+		if (column->view.ndim == 1 && format != NULL && format[0] != '\0' &&
+			format[1] == '\0' && strchr("bBhHiIlLqQnNfd?", format[0]) != NULL)
+		{
+			column->has_view = true;
+			column->format = format[0];
+			column->p_column = p_column;
+			return column->view.shape[0];
+		}
+		PyBuffer_Release(&column->view);
+	}
+	PyErr_Clear();
+	column->p_column = PySequence_Fast(p_column,
+						 "columns of a batch must be buffers or sequences");
+	Py_DECREF(p_column);
+	errorCheck();
+	return PySequence_Fast_GET_SIZE(column->p_column);
+}
+
+/*
+ * Fetch the next batch from the python iterator.
+ *
+ * A batch is either a list or tuple of rows, or a column-oriented batch:
+ * a mapping of column names to buffers or sequences, or an Arrow record
+ * batch. Returns false when the iterator is exhausted.
+ */
+static bool
+fetchBatch(MulticornExecState * state)
+{
+	PyObject   *p_chunk,
+			   *p_columns,
+			   *p_as_columns;
+	AttrNumber	i;
+
+	releaseBatch(state);
+	p_chunk = PyIter_Next(state->p_iterator);
+	errorCheck();
+	if (p_chunk == NULL || p_chunk == Py_None)
+	{
+		Py_XDECREF(p_chunk);
+		return false;
+	}
+	if (PyList_Check(p_chunk) || PyTuple_Check(p_chunk))
+	{
+		state->p_batch = p_chunk;
+		state->batch_size = PySequence_Fast_GET_SIZE(p_chunk);
+		return true;
+	}
+	p_as_columns = getClassString("multicorn.columnar.as_columns");
+	p_columns = PyObject_CallFunctionObjArgs(p_as_columns, p_chunk, NULL);
+	Py_DECREF(p_as_columns);
+	errorCheck();
+	if (p_columns == Py_None)
+	{
+		Py_DECREF(p_columns);
+		state->p_batch = PySequence_Fast(p_chunk,
+									"batches of rows must be sequences");
+		Py_DECREF(p_chunk);
+		errorCheck();
+		state->batch_size = PySequence_Fast_GET_SIZE(state->p_batch);
+		return true;
+	}
+	Py_DECREF(p_chunk);
+	state->p_batch = p_columns;
+	state->batch_size = -1;
+	/*
+	 * Rows are fetched in a per-tuple memory context: the columns must live
+	 * as long as the scan state.
+	 */
+	state->batch_columns = MemoryContextAllocZero(GetMemoryChunkContext(state),
+												  sizeof(MulticornBatchColumn) *
+												  state->numattrs);
+	for (i = 0; i < state->numattrs; i++)
+	{
+		ConversionInfo *cinfo = state->cinfos[i];
+		PyObject   *p_column;
+		Py_ssize_t	size;
+
+		if (cinfo == NULL)
+		{
+			continue;
+		}
+		p_column = PyObject_GetItem(p_columns, cinfo->attrkey);
+		if (p_column == NULL || p_column == Py_None)
+		{
+			/* Missing columns are null. */
+			PyErr_Clear();
+			Py_XDECREF(p_column);
+			continue;
+		}
+		size = initBatchColumn(&state->batch_columns[i], p_column);
+		if (state->batch_size == -1)
+		{
+			state->batch_size = size;
+		}
+		else if (state->batch_size != size)
+		{
+			ereport(ERROR, (errmsg("%s", "Columns of a batch must have the same length")));
+		}
+	}
+	if (state->batch_size == -1)
+	{
+		state->batch_size = 0;
+	}
+	return true;
+}
+
+/*
+ * Convert a value read from a column buffer to a datum. Values matching the
+ * column type are converted directly, other ones go through a python
+ * object.
+ */
+static Datum
+bufferValueToDatum(MulticornBatchColumn * column, Py_ssize_t index,
+				   ConversionInfo * cinfo, StringInfo buffer)
+{
+	char	   *ptr = (char *) column->view.buf + index * column->view.strides[0];
+	PY_LONG_LONG ivalue = 0;
+	unsigned PY_LONG_LONG uvalue = 0;
+	double		dvalue = 0;
+	bool		is_signed = false,
+				is_unsigned = false,
+				is_bool = false;
+	PyObject   *p_object;
+	Datum		value;
+
+#define READ_BUFFER_VALUE(ctype, target, flag) \
+	do { \
+		ctype		tmp; \
+		memcpy(&tmp, ptr, sizeof(ctype)); \
+		target = tmp; \
+		flag = true; \
+	} while (0)
+
+	switch (column->format)
+	{
+		case 'b':
+			READ_BUFFER_VALUE(signed char, ivalue, is_signed);
+			break;
+		case 'B':
+			READ_BUFFER_VALUE(unsigned char, uvalue, is_unsigned);
+			break;
+		case 'h':
+			READ_BUFFER_VALUE(short, ivalue, is_signed);
+			break;
+		case 'H':
+			READ_BUFFER_VALUE(unsigned short, uvalue, is_unsigned);
+			break;
+		case 'i':
+			READ_BUFFER_VALUE(int, ivalue, is_signed);
+			break;
+		case 'I':
+			READ_BUFFER_VALUE(unsigned int, uvalue, is_unsigned);
+			break;
+		case 'l':
+			READ_BUFFER_VALUE(long, ivalue, is_signed);
+			break;
+		case 'L':
+			READ_BUFFER_VALUE(unsigned long, uvalue, is_unsigned);
+			break;
+		case 'q':
+			READ_BUFFER_VALUE(PY_LONG_LONG, ivalue, is_signed);
+			break;
+		case 'Q':
+			READ_BUFFER_VALUE(unsigned PY_LONG_LONG, uvalue, is_unsigned);
+			break;
+		case 'n':
+			READ_BUFFER_VALUE(Py_ssize_t, ivalue, is_signed);
+			break;
+		case 'N':
+			READ_BUFFER_VALUE(size_t, uvalue, is_unsigned);
+			break;
+		case 'f':
+			{
+				float		tmp;
+
+				memcpy(&tmp, ptr, sizeof(float));
+				dvalue = tmp;
+				break;
+			}
+		case 'd':
+			memcpy(&dvalue, ptr, sizeof(double));
+			break;
+		case '?':
+			READ_BUFFER_VALUE(unsigned char, uvalue, is_bool);
+			break;
+	}
+#undef READ_BUFFER_VALUE
+
+	if (is_unsigned && uvalue <= (unsigned PY_LONG_LONG) PG_INT64_MAX)
+	{
+		ivalue = (PY_LONG_LONG) uvalue;
+		is_signed = true;
+		is_unsigned = false;
+	}
+	if (is_signed)
+	{
+		dvalue = (double) ivalue;
+	}
+	switch (cinfo->atttypoid)
+	{
+		case INT2OID:
+			if (is_signed && ivalue >= PG_INT16_MIN && ivalue <= PG_INT16_MAX)
+			{
+				return Int16GetDatum((int16) ivalue);
+			}
+			break;
+		case INT4OID:
+			if (is_signed && ivalue >= PG_INT32_MIN && ivalue <= PG_INT32_MAX)
+			{
+				return Int32GetDatum((int32) ivalue);
+			}
+			break;
+		case INT8OID:
+			if (is_signed)
+			{
+				return Int64GetDatum((int64) ivalue);
+			}
+			break;
+		case FLOAT4OID:
+			if (!is_unsigned && !is_bool &&
+				!(isinf((float4) dvalue) && !isinf(dvalue)))
+			{
+				return Float4GetDatum((float4) dvalue);
+			}
+			break;
+		case FLOAT8OID:
+			if (!is_unsigned && !is_bool)
+			{
+				return Float8GetDatum(dvalue);
+			}
+			break;
+		case BOOLOID:
+			if (is_bool)
+			{
+				return BoolGetDatum(uvalue != 0);
+			}
+			break;
+		default:
+			break;
+	}
+	/* Let the generic conversion deal with it. */
+	if (is_bool)
+	{
+		p_object = PyBool_FromLong(uvalue != 0);
+	}
+	else if (is_unsigned)
+	{
+		p_object = PyLong_FromUnsignedLongLong(uvalue);
+	}
+	else if (is_signed)
+	{
+		p_object = PyLong_FromLongLong(ivalue);
+	}
+	else
+	{
+		p_object = PyFloat_FromDouble(dvalue);
+	}
+	resetStringInfo(buffer);
+	value = pyobjectToDatum(p_object, buffer, cinfo);
+	Py_DECREF(p_object);
+	return value;
+}
+
+/*
+ * Fill the slot with the row at the current position of a column-oriented
+ * batch.
+ */
+static void
+columnarBatchToTuple(MulticornExecState * state, TupleTableSlot *slot)
+{
+	TupleDesc	desc = slot->tts_tupleDescriptor;
+	Py_ssize_t	index = state->batch_pos;
+	int			i;
+
+	for (i = 0; i < desc->natts; i++)
+	{
+		Form_pg_attribute attr = TupleDescAttr(desc, i);
+		AttrNumber	cinfo_idx = attr->attnum - 1;
+		ConversionInfo *cinfo = state->cinfos[cinfo_idx];
+		MulticornBatchColumn *column = &state->batch_columns[cinfo_idx];
+
+		slot->tts_values[i] = (Datum) NULL;
+		slot->tts_isnull[i] = true;
+		if (cinfo == NULL || column->p_column == NULL)
+		{
+			continue;
+		}
+		if (column->has_view)
+		{
+			slot->tts_values[i] = bufferValueToDatum(column, index, cinfo,
+													 state->buffer);
+			slot->tts_isnull[i] = false;
+		}
+		else
+		{
+			PyObject   *p_object = PySequence_Fast_GET_ITEM(column->p_column,
+															  index);
+
+			if (p_object != Py_None)
+			{
+				resetStringInfo(state->buffer);
+				slot->tts_values[i] = pyobjectToDatum(p_object, state->buffer,
+													  cinfo);
+				slot->tts_isnull[i] = state->buffer->data == NULL;
+			}
+		}
+	}
+}
+
+/*
+ * Fill the slot with the next row from the batches yielded by the python
+ * iterator. Returns false if there are no rows left.
+ *
+ * The rows from the current batch are handed out without calling back into
+ * python.
+ */
+bool
+nextBatchedTuple(MulticornExecState * state, TupleTableSlot *slot)
+{
+	while (state->p_batch == NULL || state->batch_pos >= state->batch_size)
+	{
+		instr_time	start;
+		bool		fetched;
+
+		if (state->track_stats)
+		{
+			INSTR_TIME_SET_CURRENT(start);
+		}
+		fetched = fetchBatch(state);
+		if (state->track_stats)
+		{
+			accumScanTime(&state->stats.fetch_time, start);
+		}
+		if (!fetched)
+		{
+			return false;
+		}
+	}
+	if (state->batch_columns != NULL)
+	{
+		instr_time	start;
+		int64		text_bytes = textConversionBytes;
+
+		if (state->time_rows)
+		{
+			INSTR_TIME_SET_CURRENT(start);
+		}
+		columnarBatchToTuple(state, slot);
+		if (state->time_rows)
+		{
+			accumScanTime(&state->stats.convert_time, start);
+		}
+		if (state->track_stats)
+		{
+			accumScanTuple(state, slot, text_bytes);
+		}
+	}
+	else
+	{
+		PyObject   *p_row = PySequence_Fast_GET_ITEM(state->p_batch,
+													 state->batch_pos);
+
+		/* A none value ends the scan, as it does for plain iterators. */
+		if (p_row == Py_None)
+		{
+			return false;
+		}
+		pythonResultToScanTuple(p_row, slot, state);
+	}
+	state->batch_pos++;
+	return true;
+}
+
+/*
+ * Add the time elapsed since start to a counter of the scan statistics.
+ */
+void
+accumScanTime(instr_time *counter, instr_time start)
+{
+	instr_time	end;
+
+	INSTR_TIME_SET_CURRENT(end);
+	INSTR_TIME_ACCUM_DIFF(*counter, end, start);
+}
+
+/*
+ * Count a row converted by a scan, and its values.
+ */
+static void
+accumScanTuple(MulticornExecState * state, TupleTableSlot *slot,
+			   int64 text_bytes)
+{
+	int			i;
+
+	state->stats.rows++;
+	for (i = 0; i < slot->tts_tupleDescriptor->natts; i++)
+	{
+		if (!slot->tts_isnull[i])
+		{
+			state->stats.cells++;
+		}
+	}
+	state->stats.text_bytes += textConversionBytes - text_bytes;
+}
+
+/*
+ * Convert a row returned by a scan to a tupletableslot. Only the attributes
+ * needed by the plan are looked up in mappings, the other ones are null.
+ */
+void
+pythonResultToScanTuple(PyObject *p_value, TupleTableSlot *slot,
+						MulticornExecState * state)
+{
+	int			i;
+	instr_time	start;
+	int64		text_bytes = textConversionBytes;
+
+	if (state->time_rows)
+	{
+		INSTR_TIME_SET_CURRENT(start);
+	}
+	if (state->needed_attnums == NULL || PySequence_Check(p_value) ||
+		!PyMapping_Check(p_value))
+	{
+		pythonResultToTuple(p_value, slot, state->cinfos, state->buffer);
+	}
+	else
+	{
+		memset(slot->tts_isnull, true,
+			   sizeof(bool) * slot->tts_tupleDescriptor->natts);
+		for (i = 0; i < state->needed_count; i++)
+		{
+			AttrNumber	index = state->needed_attnums[i];
+
+			pythonMappingValueToSlot(p_value, slot, index,
+									 state->cinfos[index], state->buffer);
+		}
+	}
+	if (state->time_rows)
+	{
+		accumScanTime(&state->stats.convert_time, start);
+	}
+	if (state->track_stats)
+	{
+		accumScanTuple(state, slot, text_bytes);
+	}
+}
+
+void
+pythonResultToTuple(PyObject *p_value,
+					TupleTableSlot *slot,
+					ConversionInfo ** cinfos,
+					StringInfo buffer)
+{
+	if (PySequence_Check(p_value))
+	{
+		pythonSequenceToTuple(p_value, slot, cinfos, buffer);
+	}
+	else
+	{
+
+		if (PyMapping_Check(p_value))
+		{
 			pythonDictToTuple(p_value, slot, cinfos, buffer);
 		}
-		else
+		else
+		{
+			elog(ERROR, "Cannot transform anything else than mappings and"
+				 "sequences to rows");
+		}
+	}
+}
+
+/*
+ * Return a borrowed reference to the uuid.UUID class, importing it on first
+ * use.
+ */
+static PyObject *
+getUuidClass(void)
+{
+	if (uuidClass == NULL)
+	{
+		PyObject   *p_uuid_module = PyImport_ImportModule("uuid");
+
+		if (p_uuid_module == NULL)
+		{
+			return NULL;
+		}
+		uuidClass = PyObject_GetAttrString(p_uuid_module, "UUID");
+		Py_DECREF(p_uuid_module);
+	}
+	return uuidClass;
+}
+
+/*
+ * Import the datetime C API, once per backend.
+ */
+static void
+importDateTimeApi(void)
+{
+	if (PyDateTimeAPI == NULL)
+	{
+		PyDateTime_IMPORT;
+	}
+}
+
+bool
+pyintToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+	int			overflow;
+	PY_LONG_LONG longvalue;
+
+	if (!PyIntegral_Check(object))
+	{
+		return false;
+	}
+	longvalue = PyLong_AsLongLongAndOverflow(object, &overflow);
+	if (overflow != 0 || (longvalue == -1 && PyErr_Occurred()))
+	{
+		/* Let the input function report the out of range value. */
+		PyErr_Clear();
+		return false;
+	}
+	switch (cinfo->atttypoid)
+	{
+		case INT2OID:
+			if (longvalue < PG_INT16_MIN || longvalue > PG_INT16_MAX)
+			{
+				return false;
+			}
+			*value = Int16GetDatum((int16) longvalue);
+			break;
+		case INT4OID:
+			if (longvalue < PG_INT32_MIN || longvalue > PG_INT32_MAX)
+			{
+				return false;
+			}
+			*value = Int32GetDatum((int32) longvalue);
+			break;
+		default:
+			*value = Int64GetDatum((int64) longvalue);
+			break;
+	}
+	return true;
+}
+
+bool
+pyfloatToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+	double		doublevalue;
+
+	if (!PyFloat_Check(object) && !PyIntegral_Check(object))
+	{
+		return false;
+	}
+	doublevalue = PyFloat_AsDouble(object);
+	if (doublevalue == -1.0 && PyErr_Occurred())
+	{
+		PyErr_Clear();
+		return false;
+	}
+	if (cinfo->atttypoid == FLOAT4OID)
+	{
+		float4		floatvalue = (float4) doublevalue;
+
+		if (isinf(floatvalue) && !isinf(doublevalue))
+		{
+			return false;
+		}
+		*value = Float4GetDatum(floatvalue);
+	}
+	else
+	{
+		*value = Float8GetDatum(doublevalue);
+	}
+	return true;
+}
+
+bool
+pyboolToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+	if (!PyBool_Check(object))
+	{
+		return false;
+	}
+	*value = BoolGetDatum(object == Py_True);
+	return true;
+}
+
+bool
+pyintToNumericDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+	int			overflow;
+	PY_LONG_LONG longvalue;
+
+	/*
+	 * Floats and decimals keep going through their text representation,
+	 * which is the only way to preserve their exact digits.
+	 */
+	if (!PyIntegral_Check(object))
+	{
+		return false;
+	}
+	longvalue = PyLong_AsLongLongAndOverflow(object, &overflow);
+	if (overflow != 0 || (longvalue == -1 && PyErr_Occurred()))
+	{
+		PyErr_Clear();
+		return false;
+	}
+	*value = DirectFunctionCall1(int8_numeric, Int64GetDatum((int64) longvalue));
+	if (cinfo->atttypmod >= 0)
+	{
+		*value = DirectFunctionCall2(numeric, *value,
+									 Int32GetDatum(cinfo->atttypmod));
+	}
+	return true;
+}
+
+bool
+pydateToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+	if (!PyDate_Check(object))
+	{
+		return false;
+	}
+	*value = DateADTGetDatum(date2j(PyDateTime_GET_YEAR(object),
+									PyDateTime_GET_MONTH(object),
+									PyDateTime_GET_DAY(object)) -
+							 POSTGRES_EPOCH_JDATE);
+	return true;
+}
+
+bool
+pydatetimeToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+#ifdef MULTICORN_INT64_TIMESTAMP
+	struct pg_tm tm;
+	fsec_t		fsec = 0;
+	int			tz = 0;
+	bool		has_tz = false;
+	Timestamp	result;
+
+	if (!PyDate_Check(object))
+	{
+		return false;
+	}
+	memset(&tm, 0, sizeof(struct pg_tm));
+	tm.tm_year = PyDateTime_GET_YEAR(object);
+	tm.tm_mon = PyDateTime_GET_MONTH(object);
+	tm.tm_mday = PyDateTime_GET_DAY(object);
+	if (PyDateTime_Check(object))
+	{
+		tm.tm_hour = PyDateTime_DATE_GET_HOUR(object);
+		tm.tm_min = PyDateTime_DATE_GET_MINUTE(object);
+		tm.tm_sec = PyDateTime_DATE_GET_SECOND(object);
+		fsec = PyDateTime_DATE_GET_MICROSECOND(object);
+		if (cinfo->atttypoid == TIMESTAMPTZOID)
 		{
-			elog(ERROR, "Cannot transform anything else than mappings and"
-				 "sequences to rows");
+			/* utcoffset() returns None for naive datetimes. */
+			PyObject   *p_offset = PyObject_CallMethod(object, "utcoffset", "()");
+
+			if (p_offset == NULL)
+			{
+				PyErr_Clear();
+				return false;
+			}
+			if (PyDelta_Check(p_offset))
+			{
+				PyDateTime_Delta *delta = (PyDateTime_Delta *) p_offset;
+
+				tz = -(delta->days * SECS_PER_DAY + delta->seconds);
+				has_tz = true;
+			}
+			Py_DECREF(p_offset);
+		}
+	}
+	if (cinfo->atttypoid == TIMESTAMPOID)
+	{
+		/* The input function ignores the offset for a plain timestamp. */
+		if (tm2timestamp(&tm, fsec, NULL, &result) != 0)
+		{
+			return false;
+		}
+		*value = TimestampGetDatum(result);
+		if (cinfo->atttypmod >= 0)
+		{
+			*value = DirectFunctionCall2(timestamp_scale, *value,
+										 Int32GetDatum(cinfo->atttypmod));
+		}
+	}
+	else
+	{
+		/* A naive datetime is interpreted in the session timezone. */
+		if (!has_tz)
+		{
+			tz = DetermineTimeZoneOffset(&tm, session_timezone);
+		}
+		if (tm2timestamp(&tm, fsec, &tz, &result) != 0)
+		{
+			return false;
+		}
+		*value = TimestampTzGetDatum(result);
+		if (cinfo->atttypmod >= 0)
+		{
+			*value = DirectFunctionCall2(timestamptz_scale, *value,
+										 Int32GetDatum(cinfo->atttypmod));
 		}
 	}
+	return true;
+#else
+	return false;
+#endif
+}
+
+bool
+pyuuidToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+	PyObject   *p_bytes;
+	char	   *bytes;
+	Py_ssize_t	size;
+	pg_uuid_t  *uuid;
+
+	if (getUuidClass() == NULL)
+	{
+		PyErr_Clear();
+		return false;
+	}
+	if (PyObject_IsInstance(object, uuidClass) != 1)
+	{
+		PyErr_Clear();
+		return false;
+	}
+	p_bytes = PyObject_GetAttrString(object, "bytes");
+	if (p_bytes == NULL || PyBytes_AsStringAndSize(p_bytes, &bytes, &size) < 0 ||
+		size != UUID_LEN)
+	{
+		PyErr_Clear();
+		Py_XDECREF(p_bytes);
+		return false;
+	}
+	uuid = (pg_uuid_t *) palloc(sizeof(pg_uuid_t));
+	memcpy(uuid->data, bytes, UUID_LEN);
+	Py_DECREF(p_bytes);
+	*value = UUIDPGetDatum(uuid);
+	return true;
+}
+
+bool
+pytimedeltaToDatum(PyObject *object, ConversionInfo * cinfo, Datum *value)
+{
+#ifdef MULTICORN_INT64_TIMESTAMP
+	PyDateTime_Delta *delta;
+	Interval   *interval;
+
+	if (!PyDelta_Check(object))
+	{
+		return false;
+	}
+	delta = (PyDateTime_Delta *) object;
+	interval = (Interval *) palloc(sizeof(Interval));
+	interval->month = 0;
+	interval->day = delta->days;
+	interval->time = ((int64) delta->seconds) * USECS_PER_SEC +
+		delta->microseconds;
+	*value = IntervalPGetDatum(interval);
+	if (cinfo->atttypmod >= 0)
+	{
+		*value = DirectFunctionCall2(interval_scale, *value,
+									 Int32GetDatum(cinfo->atttypmod));
+	}
+	return true;
+#else
+	return false;
+#endif
 }
 
 Datum
@@ -1320,11 +3217,20 @@ pyobjectToDatum(PyObject *object, StringInfo buffer,
 {
 	Datum		value = 0;
 
+	/*
+	 * Build the datum straight from the python object if the column type
+	 * allows it, and fall back to the text representation otherwise.
+	 */
+	if (cinfo->to_datum != NULL && cinfo->to_datum(object, cinfo, &value))
+	{
+		return value;
+	}
 	pyobjectToCString(object, buffer,
 					  cinfo);
 
 	if (buffer->len >= 0)
 	{
+		textConversionBytes += buffer->len;
 
 		if (cinfo->atttypoid == BYTEAOID || cinfo->atttypoid == TEXTOID ||
 			cinfo->atttypoid == VARCHAROID)
@@ -1367,91 +3273,438 @@ datumUnknownToPython(Datum datum, ConversionInfo * cinfo, Oid type)
 	PyObject   *result;
 	Oid			outfuncoid;
 	bool		isvarlena;
-	FmgrInfo   *fmout = palloc0(sizeof(FmgrInfo));
+	FmgrInfo   *fmout;
+
+	if (cinfo != NULL && cinfo->atttypoid == type && cinfo->attoutfunc != NULL)
+	{
+		/* Reuse the output function looked up at plan time. */
+		temp = OutputFunctionCall(cinfo->attoutfunc, datum);
+	}
+	else
+	{
+		fmout = palloc0(sizeof(FmgrInfo));
+		getTypeOutputInfo(type, &outfuncoid, &isvarlena);
+		fmgr_info(outfuncoid, fmout);
+		temp = OutputFunctionCall(fmout, datum);
+		pfree(fmout);
+	}
+	size = strlen(temp);
+	result = PyUnicode_Decode(temp, size, getPythonEncodingName(), NULL);
+	return result;
+}
+
+PyObject *
+datumNumberToPython(Datum datum, ConversionInfo * cinfo)
+{
+	ssize_t		numvalue = (ssize_t) DatumGetNumeric(datum);
+	char	   *tempvalue = (char *) DirectFunctionCall1(numeric_out,
+														 numvalue);
+	PyObject   *buffer = PyString_FromString(tempvalue),
+#if PY_MAJOR_VERSION >= 3
+			   *value = PyFloat_FromString(buffer);
+#else
+			   *value = PyFloat_FromString(buffer, NULL);
+#endif
+	Py_DECREF(buffer);
+	return value;
+}
+
+PyObject *
+datumDateToPython(Datum datum, ConversionInfo * cinfo)
+{
+	struct pg_tm *pg_tm_value = palloc(sizeof(struct pg_tm));
+	PyObject   *result;
+	fsec_t		fsec;
+
+	importDateTimeApi();
+	datum = DirectFunctionCall1(date_timestamp, datum);
+	timestamp2tm(DatumGetTimestamp(datum), NULL, pg_tm_value, &fsec,
+				 NULL, NULL);
+	result = PyDate_FromDate(pg_tm_value->tm_year,
+							 pg_tm_value->tm_mon, pg_tm_value->tm_mday);
+	pfree(pg_tm_value);
+	return result;
+}
+
+PyObject *
+datumTimestampToPython(Datum datum, ConversionInfo * cinfo)
+{
+	struct pg_tm *pg_tm_value = palloc(sizeof(struct pg_tm));
+	PyObject   *result;
+	fsec_t		fsec;
+
+	importDateTimeApi();
+	timestamp2tm(DatumGetTimestamp(datum), NULL, pg_tm_value, &fsec,
+				 NULL, NULL);
+	result = PyDateTime_FromDateAndTime(pg_tm_value->tm_year,
+										pg_tm_value->tm_mon,
+										pg_tm_value->tm_mday,
+										pg_tm_value->tm_hour,
+										pg_tm_value->tm_min,
+										pg_tm_value->tm_sec,
+#ifdef MULTICORN_INT64_TIMESTAMP
+										fsec);
+#else
+										0);
+#endif
+	pfree(pg_tm_value);
+	return result;
+}
+
+PyObject *
+datumTimestamptzToPython(Datum datum, ConversionInfo * cinfo)
+{
+#if PY_VERSION_HEX >= 0x03070000
+	struct pg_tm pg_tm_value;
+	PyObject   *result,
+			   *p_delta,
+			   *p_tzinfo;
+	fsec_t		fsec;
+	int			tz;
+
+	if (TIMESTAMP_NOT_FINITE(DatumGetTimestampTz(datum)))
+	{
+		return NULL;
+	}
+	importDateTimeApi();
+	/* Render the value in the session timezone, as the output function does. */
+	if (timestamp2tm(DatumGetTimestampTz(datum), &tz, &pg_tm_value, &fsec,
+					 NULL, NULL) != 0)
+	{
+		return NULL;
+	}
+	p_delta = PyDelta_FromDSU(0, -tz, 0);
+	p_tzinfo = PyTimeZone_FromOffset(p_delta);
+	Py_DECREF(p_delta);
+	if (p_tzinfo == NULL)
+	{
+		return NULL;
+	}
+	result = PyDateTimeAPI->DateTime_FromDateAndTime(pg_tm_value.tm_year,
+													 pg_tm_value.tm_mon,
+													 pg_tm_value.tm_mday,
+													 pg_tm_value.tm_hour,
+													 pg_tm_value.tm_min,
+													 pg_tm_value.tm_sec,
+#ifdef MULTICORN_INT64_TIMESTAMP
+													 fsec,
+#else
+													 0,
+#endif
+													 p_tzinfo,
+											PyDateTimeAPI->DateTimeType);
+	Py_DECREF(p_tzinfo);
+	return result;
+#else
+	/* No cheap way to build an aware datetime: use the text representation */
+	return datumUnknownToPython(datum, cinfo, TIMESTAMPTZOID);
+#endif
+}
+
+PyObject *
+datumIntervalToPython(Datum datum, ConversionInfo * cinfo)
+{
+#ifdef MULTICORN_INT64_TIMESTAMP
+	Interval   *interval = DatumGetIntervalP(datum);
+
+	/* A timedelta cannot represent months, whose length varies. */
+	if (interval->month == 0)
+	{
+		PyObject   *result;
+
+		importDateTimeApi();
+		result = PyDelta_FromDSU(interval->day,
+								 interval->time / USECS_PER_SEC,
+								 interval->time % USECS_PER_SEC);
+		if (result != NULL)
+		{
+			return result;
+		}
+		/* Out of the range of timedelta: see datumToPython */
+		PyErr_Clear();
+	}
+#endif
+	return datumUnknownToPython(datum, cinfo, INTERVALOID);
+}
+
+PyObject *
+datumIntToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return PyLong_FromLong(DatumGetInt32(datum));
+}
+
+PyObject *
+datumInt2ToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return PyLong_FromLong(DatumGetInt16(datum));
+}
+
+PyObject *
+datumInt8ToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return PyLong_FromLongLong(DatumGetInt64(datum));
+}
+
+PyObject *
+datumFloat4ToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return PyFloat_FromDouble(DatumGetFloat4(datum));
+}
+
+PyObject *
+datumFloat8ToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return PyFloat_FromDouble(DatumGetFloat8(datum));
+}
 
-	getTypeOutputInfo(type, &outfuncoid, &isvarlena);
-	fmgr_info(outfuncoid, fmout);
-	temp = OutputFunctionCall(fmout, datum);
-	size = strlen(temp);
-	result = PyUnicode_Decode(temp, size, getPythonEncodingName(), NULL);
-	pfree(fmout);
-	return result;
+PyObject *
+datumBoolToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return PyBool_FromLong(DatumGetBool(datum));
 }
 
 PyObject *
-datumNumberToPython(Datum datum, ConversionInfo * cinfo)
+datumUuidToPython(Datum datum, ConversionInfo * cinfo)
 {
-	ssize_t		numvalue = (ssize_t) DatumGetNumeric(datum);
-	char	   *tempvalue = (char *) DirectFunctionCall1(numeric_out,
-														 numvalue);
-	PyObject   *buffer = PyString_FromString(tempvalue),
+	pg_uuid_t  *uuid = DatumGetUUIDP(datum);
+	PyObject   *p_bytes,
+			   *p_args,
+			   *p_kwargs,
+			   *result;
+
+	if (getUuidClass() == NULL)
+	{
+		return NULL;
+	}
 #if PY_MAJOR_VERSION >= 3
-			   *value = PyFloat_FromString(buffer);
+	p_bytes = PyBytes_FromStringAndSize((char *) uuid->data, UUID_LEN);
 #else
-			   *value = PyFloat_FromString(buffer, NULL);
+	p_bytes = PyString_FromStringAndSize((char *) uuid->data, UUID_LEN);
 #endif
-	Py_DECREF(buffer);
-	return value;
+	p_args = PyTuple_New(0);
+	p_kwargs = PyDict_New();
+	PyDict_SetItemString(p_kwargs, "bytes", p_bytes);
+	result = PyObject_Call(uuidClass, p_args, p_kwargs);
+	Py_DECREF(p_bytes);
+	Py_DECREF(p_args);
+	Py_DECREF(p_kwargs);
+	return result;
 }
 
 PyObject *
-datumDateToPython(Datum datum, ConversionInfo * cinfo)
+datumJsonToPython(Datum datum, ConversionInfo * cinfo)
 {
-	struct pg_tm *pg_tm_value = palloc(sizeof(struct pg_tm));
-	PyObject   *result;
-	fsec_t		fsec;
+	PyObject   *p_text,
+			   *result;
 
-	PyDateTime_IMPORT;
-	datum = DirectFunctionCall1(date_timestamp, datum);
-	timestamp2tm(DatumGetTimestamp(datum), NULL, pg_tm_value, &fsec,
-				 NULL, NULL);
-	result = PyDate_FromDate(pg_tm_value->tm_year,
-							 pg_tm_value->tm_mon, pg_tm_value->tm_mday);
-	pfree(pg_tm_value);
+	if (jsonLoads == NULL)
+	{
+		PyObject   *p_json_module = PyImport_ImportModule("json");
+
+		if (p_json_module == NULL)
+		{
+			return NULL;
+		}
+		jsonLoads = PyObject_GetAttrString(p_json_module, "loads");
+		Py_DECREF(p_json_module);
+		if (jsonLoads == NULL)
+		{
+			return NULL;
+		}
+	}
+	p_text = datumStringToPython(datum, cinfo);
+	if (p_text == NULL)
+	{
+		return NULL;
+	}
+	result = PyObject_CallFunctionObjArgs(jsonLoads, p_text, NULL);
+	Py_DECREF(p_text);
 	return result;
 }
 
-PyObject *
-datumTimestampToPython(Datum datum, ConversionInfo * cinfo)
+#if PG_VERSION_NUM >= 90400
+/*
+ * Convert a scalar jsonb value to its python equivalent.
+ */
+static PyObject *
+jsonbScalarToPython(JsonbValue *value)
 {
-	struct pg_tm *pg_tm_value = palloc(sizeof(struct pg_tm));
-	PyObject   *result;
-	fsec_t		fsec;
+	char	   *temp;
+	PyObject   *p_string,
+			   *result;
 
-	PyDateTime_IMPORT;
-	timestamp2tm(DatumGetTimestamp(datum), NULL, pg_tm_value, &fsec,
-				 NULL, NULL);
-	result = PyDateTime_FromDateAndTime(pg_tm_value->tm_year,
-										pg_tm_value->tm_mon,
-										pg_tm_value->tm_mday,
-										pg_tm_value->tm_hour,
-										pg_tm_value->tm_min,
-										pg_tm_value->tm_sec, 0);
-	pfree(pg_tm_value);
-	return result;
+	switch (value->type)
+	{
+		case jbvNull:
+			Py_INCREF(Py_None);
+			return Py_None;
+		case jbvBool:
+			return PyBool_FromLong(value->val.boolean);
+		case jbvString:
+			return PyUnicode_Decode(value->val.string.val,
+									value->val.string.len,
+									getPythonEncodingName(), NULL);
+		case jbvNumeric:
+			temp = DatumGetCString(DirectFunctionCall1(numeric_out,
+							   NumericGetDatum(value->val.numeric)));
+			p_string = PyString_FromString(temp);
+			/* Mimic json.loads: integral values become ints. */
+			if (strpbrk(temp, ".eEN") == NULL)
+			{
+				result = PyNumber_Long(p_string);
+			}
+			else
+			{
+#if PY_MAJOR_VERSION >= 3
+				result = PyFloat_FromString(p_string);
+#else
+				result = PyFloat_FromString(p_string, NULL);
+#endif
+			}
+			Py_DECREF(p_string);
+			return result;
+		default:
+			elog(ERROR, "unexpected jsonb value type: %d", value->type);
+			return NULL;
+	}
 }
 
+/*
+ * Walk the jsonb container and build the corresponding python dicts and
+ * lists, without going through the text representation.
+ */
 PyObject *
-datumIntToPython(Datum datum, ConversionInfo * cinfo)
+datumJsonbToPython(Datum datum, ConversionInfo * cinfo)
 {
-	return PyLong_FromLong(DatumGetInt32(datum));
+#if PG_VERSION_NUM >= 110000
+	Jsonb	   *jsonb = DatumGetJsonbP(datum);
+#else
+	Jsonb	   *jsonb = DatumGetJsonb(datum);
+#endif
+	JsonbIterator *it = JsonbIteratorInit(&jsonb->root);
+	JsonbIteratorToken token;
+	JsonbValue	value;
+	/* Containers being built, and the key under which each one goes. */
+	PyObject   *p_stack = PyList_New(0),
+			   *p_keys = PyList_New(0),
+			   *p_key = NULL,
+			   *p_item,
+			   *result = NULL;
+	bool		raw_scalar = false;
+
+	while ((token = JsonbIteratorNext(&it, &value, false)) != WJB_DONE)
+	{
+		Py_ssize_t	depth = PyList_Size(p_stack);
+
+		p_item = NULL;
+		switch (token)
+		{
+			case WJB_BEGIN_ARRAY:
+			case WJB_BEGIN_OBJECT:
+				if (depth == 0 && token == WJB_BEGIN_ARRAY)
+				{
+					raw_scalar = value.val.array.rawScalar;
+				}
+				p_item = token == WJB_BEGIN_ARRAY ? PyList_New(0) : PyDict_New();
+				PyList_Append(p_stack, p_item);
+				PyList_Append(p_keys, p_key == NULL ? Py_None : p_key);
+				Py_DECREF(p_item);
+				Py_XDECREF(p_key);
+				p_key = NULL;
+				continue;
+			case WJB_END_ARRAY:
+			case WJB_END_OBJECT:
+				p_item = PyList_GetItem(p_stack, depth - 1);
+				Py_INCREF(p_item);
+				p_key = PyList_GetItem(p_keys, depth - 1);
+				Py_INCREF(p_key);
+				PyList_SetSlice(p_stack, depth - 1, depth, NULL);
+				PyList_SetSlice(p_keys, depth - 1, depth, NULL);
+				if (p_key == Py_None)
+				{
+					Py_DECREF(p_key);
+					p_key = NULL;
+				}
+				depth--;
+				break;
+			case WJB_KEY:
+				p_key = jsonbScalarToPython(&value);
+				continue;
+			case WJB_VALUE:
+			case WJB_ELEM:
+				p_item = jsonbScalarToPython(&value);
+				break;
+			default:
+				elog(ERROR, "unexpected jsonb token: %d", token);
+		}
+		if (p_item == NULL)
+		{
+			Py_XDECREF(p_key);
+			break;
+		}
+		if (depth == 0)
+		{
+			result = p_item;
+			if (raw_scalar)
+			{
+				result = PyList_GetItem(p_item, 0);
+				Py_INCREF(result);
+				Py_DECREF(p_item);
+			}
+		}
+		else
+		{
+			PyObject   *p_parent = PyList_GetItem(p_stack, depth - 1);
+
+			if (p_key != NULL)
+			{
+				PyDict_SetItem(p_parent, p_key, p_item);
+				Py_DECREF(p_key);
+				p_key = NULL;
+			}
+			else
+			{
+				PyList_Append(p_parent, p_item);
+			}
+			Py_DECREF(p_item);
+		}
+	}
+	Py_DECREF(p_stack);
+	Py_DECREF(p_keys);
+	return result;
 }
+#endif
 
 PyObject *
 datumArrayToPython(Datum datum, Oid type, ConversionInfo * cinfo)
 {
+	ArrayType  *array = DatumGetArrayTypeP(datum);
 #if PG_VERSION_NUM >= 90500
-	ArrayIterator iterator = array_create_iterator(DatumGetArrayTypeP(datum),
-												   0, NULL);
+	ArrayIterator iterator = array_create_iterator(array, 0, NULL);
 # else
-	ArrayIterator iterator = array_create_iterator(DatumGetArrayTypeP(datum),
-												   0);
+	ArrayIterator iterator = array_create_iterator(array, 0);
 # endif
 
 	Datum		elem = (Datum) NULL;
 	bool		isnull;
 	PyObject   *result = PyList_New(0),
 			   *pyitem;
+	ConversionInfo elem_cinfo;
+
+	/*
+	 * The element type is stored in the array itself. Only resolve its output
+	 * function once, in case the elements have to go through their text
+	 * representation.
+	 */
+	memset(&elem_cinfo, 0, sizeof(ConversionInfo));
+	if (cinfo != NULL)
+	{
+		elem_cinfo = *cinfo;
+	}
+	elem_cinfo.atttypoid = ARR_ELEMTYPE(array);
+	elem_cinfo.is_array = false;
+	elem_cinfo.attoutfunc = NULL;
+	initConverters(&elem_cinfo);
 
 	while (array_iterate(iterator, &elem, &isnull))
 	{
@@ -1461,23 +3714,21 @@ datumArrayToPython(Datum datum, Oid type, ConversionInfo * cinfo)
 		}
 		else
 		{
-			HeapTuple	tuple;
-			Form_pg_type typeStruct;
-
-			tuple = SearchSysCache1(TYPEOID, ObjectIdGetDatum(type));
-			if (!HeapTupleIsValid(tuple))
+			pyitem = datumToPython(elem, elem_cinfo.atttypoid, &elem_cinfo);
+			if (pyitem == NULL)
 			{
-				elog(ERROR, "lookup failed for type %u",
-					 type);
+				Py_DECREF(result);
+				return NULL;
 			}
-			typeStruct = (Form_pg_type) GETSTRUCT(tuple);
-			pyitem = datumToPython(elem, typeStruct->typelem, cinfo);
-			ReleaseSysCache(tuple);
-
 			PyList_Append(result, pyitem);
 			Py_DECREF(pyitem);
 		}
 	}
+	array_free_iterator(iterator);
+	if (elem_cinfo.attoutfunc != NULL)
+	{
+		pfree(elem_cinfo.attoutfunc);
+	}
 	return result;
 }
 
@@ -1502,7 +3753,12 @@ datumToPython(Datum datum, Oid type, ConversionInfo * cinfo)
 {
 	HeapTuple	tuple;
 	Form_pg_type typeStruct;
+	PyObject   *result;
 
+	if (cinfo != NULL && cinfo->atttypoid == type && cinfo->to_python != NULL)
+	{
+		return cinfo->to_python(datum, cinfo);
+	}
 	switch (type)
 	{
 		case BYTEAOID:
@@ -1516,8 +3772,45 @@ datumToPython(Datum datum, Oid type, ConversionInfo * cinfo)
 			return datumDateToPython(datum, cinfo);
 		case TIMESTAMPOID:
 			return datumTimestampToPython(datum, cinfo);
+		case TIMESTAMPTZOID:
+			result = datumTimestamptzToPython(datum, cinfo);
+			break;
+		case INTERVALOID:
+			return datumIntervalToPython(datum, cinfo);
+		case INT2OID:
+			return datumInt2ToPython(datum, cinfo);
 		case INT4OID:
 			return datumIntToPython(datum, cinfo);
+		case INT8OID:
+			return datumInt8ToPython(datum, cinfo);
+		case FLOAT4OID:
+			return datumFloat4ToPython(datum, cinfo);
+		case FLOAT8OID:
+			return datumFloat8ToPython(datum, cinfo);
+		case BOOLOID:
+			return datumBoolToPython(datum, cinfo);
+		case UUIDOID:
+			return datumUuidToPython(datum, cinfo);
+		case JSONOID:
+			return datumJsonToPython(datum, cinfo);
+#if PG_VERSION_NUM >= 90400
+		case JSONBOID:
+			return datumJsonbToPython(datum, cinfo);
+#endif
+		case BOOLARRAYOID:
+		case INT2ARRAYOID:
+		case INT4ARRAYOID:
+		case INT8ARRAYOID:
+		case TEXTARRAYOID:
+		case VARCHARARRAYOID:
+		case FLOAT4ARRAYOID:
+		case FLOAT8ARRAYOID:
+		case NUMERICARRAYOID:
+		case DATEARRAYOID:
+		case TIMESTAMPARRAYOID:
+		case TIMESTAMPTZARRAYOID:
+		case UUIDARRAYOID:
+			return datumArrayToPython(datum, type, cinfo);
 		default:
 			/* Case for the array ? */
 			tuple = SearchSysCache1(TYPEOID, ObjectIdGetDatum(type));
@@ -1535,6 +3828,162 @@ datumToPython(Datum datum, Oid type, ConversionInfo * cinfo)
 			}
 			return datumUnknownToPython(datum, cinfo, type);
 	}
+	if (result == NULL)
+	{
+		/*
+		 * Values python cannot represent natively (infinite or out of range
+		 * timestamps) are passed as their text representation.
+		 */
+		PyErr_Clear();
+		result = datumUnknownToPython(datum, cinfo, type);
+	}
+	return result;
+}
+
+static PyObject *
+datumTimestamptzColumnToPython(Datum datum, ConversionInfo * cinfo)
+{
+	PyObject   *result = datumTimestamptzToPython(datum, cinfo);
+
+	if (result == NULL)
+	{
+		/* See datumToPython */
+		PyErr_Clear();
+		result = datumUnknownToPython(datum, cinfo, cinfo->atttypoid);
+	}
+	return result;
+}
+
+static PyObject *
+datumArrayColumnToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return datumArrayToPython(datum, cinfo->atttypoid, cinfo);
+}
+
+static PyObject *
+datumUnknownColumnToPython(Datum datum, ConversionInfo * cinfo)
+{
+	return datumUnknownToPython(datum, cinfo, cinfo->atttypoid);
+}
+
+/*
+ * Resolve the converters of a column from its type, so that converting each
+ * value does not have to dispatch on the type again.
+ *
+ * The python to datum converters build the datum straight from the python
+ * object for the most common scalar types, skipping the round trip through
+ * the type input function.
+ */
+void
+initConverters(ConversionInfo * cinfo)
+{
+	switch (cinfo->atttypoid)
+	{
+		case INT2OID:
+		case INT4OID:
+		case INT8OID:
+			cinfo->to_datum = pyintToDatum;
+			break;
+		case FLOAT4OID:
+		case FLOAT8OID:
+			cinfo->to_datum = pyfloatToDatum;
+			break;
+		case BOOLOID:
+			cinfo->to_datum = pyboolToDatum;
+			break;
+		case NUMERICOID:
+			cinfo->to_datum = pyintToNumericDatum;
+			break;
+		case DATEOID:
+			importDateTimeApi();
+			cinfo->to_datum = pydateToDatum;
+			break;
+		case TIMESTAMPOID:
+		case TIMESTAMPTZOID:
+			importDateTimeApi();
+			cinfo->to_datum = pydatetimeToDatum;
+			break;
+		case UUIDOID:
+			cinfo->to_datum = pyuuidToDatum;
+			break;
+		case INTERVALOID:
+			importDateTimeApi();
+			cinfo->to_datum = pytimedeltaToDatum;
+			break;
+		default:
+			cinfo->to_datum = NULL;
+	}
+	switch (cinfo->atttypoid)
+	{
+		case BYTEAOID:
+			cinfo->to_python = datumByteaToPython;
+			break;
+		case TEXTOID:
+		case VARCHAROID:
+			cinfo->to_python = datumStringToPython;
+			break;
+		case NUMERICOID:
+			cinfo->to_python = datumNumberToPython;
+			break;
+		case DATEOID:
+			cinfo->to_python = datumDateToPython;
+			break;
+		case TIMESTAMPOID:
+			cinfo->to_python = datumTimestampToPython;
+			break;
+		case TIMESTAMPTZOID:
+			cinfo->to_python = datumTimestamptzColumnToPython;
+			break;
+		case INTERVALOID:
+			cinfo->to_python = datumIntervalToPython;
+			break;
+		case INT2OID:
+			cinfo->to_python = datumInt2ToPython;
+			break;
+		case INT4OID:
+			cinfo->to_python = datumIntToPython;
+			break;
+		case INT8OID:
+			cinfo->to_python = datumInt8ToPython;
+			break;
+		case FLOAT4OID:
+			cinfo->to_python = datumFloat4ToPython;
+			break;
+		case FLOAT8OID:
+			cinfo->to_python = datumFloat8ToPython;
+			break;
+		case BOOLOID:
+			cinfo->to_python = datumBoolToPython;
+			break;
+		case UUIDOID:
+			cinfo->to_python = datumUuidToPython;
+			break;
+		case JSONOID:
+			cinfo->to_python = datumJsonToPython;
+			break;
+#if PG_VERSION_NUM >= 90400
+		case JSONBOID:
+			cinfo->to_python = datumJsonbToPython;
+			break;
+#endif
+		default:
+			if (cinfo->is_array)
+			{
+				cinfo->to_python = datumArrayColumnToPython;
+				break;
+			}
+			/* Values go through the output function of the type. */
+			if (cinfo->attoutfunc == NULL)
+			{
+				Oid			outfuncoid;
+				bool		isvarlena;
+
+				cinfo->attoutfunc = palloc0(sizeof(FmgrInfo));
+				getTypeOutputInfo(cinfo->atttypoid, &outfuncoid, &isvarlena);
+				fmgr_info(outfuncoid, cinfo->attoutfunc);
+			}
+			cinfo->to_python = datumUnknownColumnToPython;
+	}
 }
 
 /*
@@ -1548,11 +3997,13 @@ pathKeys(MulticornPlanState * state)
 {
 	List	   *result = NULL;
 	Py_ssize_t	i;
-	PyObject   *fdw_instance = state->fdw_instance,
+	PyObject   *p_key = Py_BuildValue("(s)", "get_path_keys"),
+			   *p_args = PyTuple_New(0),
 			   *p_pathkeys;
 
-	p_pathkeys = PyObject_CallMethod(fdw_instance, "get_path_keys", "()");
-	errorCheck();
+	p_pathkeys = cachedPlannerCall(state, p_key, "get_path_keys", p_args);
+	Py_DECREF(p_key);
+	Py_DECREF(p_args);
 	for (i = 0; i < PySequence_Length(p_pathkeys); i++)
 	{
 		PyObject   *p_item = PySequence_GetItem(p_pathkeys, i),
@@ -1616,8 +4067,9 @@ canSort(MulticornPlanState * state, List *deparsed)
 	List	   *result = NULL;
 	ListCell   *lc;
 	Py_ssize_t	i;
-	PyObject   *fdw_instance = state->fdw_instance,
-			   *p_pathkeys = PyList_New(0),
+	PyObject   *p_pathkeys = PyList_New(0),
+			   *p_key,
+			   *p_args,
 			   *p_sortable;
 
 	foreach(lc, deparsed)
@@ -1628,8 +4080,11 @@ canSort(MulticornPlanState * state, List *deparsed)
 		Py_DECREF(python_sortkey);
 	}
 
-	p_sortable = PyObject_CallMethod(fdw_instance, "can_sort", "(O)", p_pathkeys);
-	errorCheck();
+	p_key = Py_BuildValue("(sN)", "can_sort", PyList_AsTuple(p_pathkeys));
+	p_args = PyTuple_Pack(1, p_pathkeys);
+	p_sortable = cachedPlannerCall(state, p_key, "can_sort", p_args);
+	Py_DECREF(p_key);
+	Py_DECREF(p_args);
 	for (i = 0; i < PySequence_Length(p_sortable); i++)
 	{
 		PyObject   *p_key = PySequence_GetItem(p_sortable, i);
@@ -1642,6 +4097,203 @@ canSort(MulticornPlanState * state, List *deparsed)
 	return result;
 }
 
+/*
+ * Call the can_limit method from the python implementation, to check if the
+ * limit and offset can be enforced by the foreign data wrapper.
+ */
+bool
+canLimit(MulticornPlanState * state, int64 limit, int64 offset)
+{
+	PyObject   *p_quals = qualDefsToPyList(state->qual_list, state->cinfos),
+			   *p_limit,
+			   *p_offset,
+			   *p_result;
+	bool		result;
+
+	if (limit >= 0)
+	{
+		p_limit = PyLong_FromLongLong(limit);
+	}
+	else
+	{
+		p_limit = Py_None;
+		Py_INCREF(p_limit);
+	}
+	if (offset > 0)
+	{
+		p_offset = PyLong_FromLongLong(offset);
+	}
+	else
+	{
+		p_offset = Py_None;
+		Py_INCREF(p_offset);
+	}
+	countTableStat(state->foreigntableid, planner_calls);
+	p_result = PyObject_CallMethod(state->fdw_instance, "can_limit", "(O,O,O)",
+								   p_quals, p_limit, p_offset);
+	Py_DECREF(p_quals);
+	Py_DECREF(p_limit);
+	Py_DECREF(p_offset);
+	errorCheck();
+	result = PyObject_IsTrue(p_result);
+	Py_DECREF(p_result);
+	return result;
+}
+
+/*
+ * Call the can_aggregate method from the python implementation, to check if
+ * the grouping and aggregates can be computed by the foreign data wrapper.
+ */
+bool
+canAggregate(MulticornPlanState * state, List *group_by, List *aggregates)
+{
+	PyObject   *p_group_by = valuesToPyList(group_by),
+			   *p_aggregates = aggregatesToPyList(aggregates),
+			   *p_quals = qualDefsToPyList(state->qual_list, state->cinfos),
+			   *p_result;
+	bool		result;
+
+	countTableStat(state->foreigntableid, planner_calls);
+	p_result = PyObject_CallMethod(state->fdw_instance, "can_aggregate",
+								   "(O,O,O)", p_group_by, p_aggregates,
+								   p_quals);
+	Py_DECREF(p_group_by);
+	Py_DECREF(p_aggregates);
+	Py_DECREF(p_quals);
+	errorCheck();
+	result = PyObject_IsTrue(p_result);
+	Py_DECREF(p_result);
+	return result;
+}
+
+/*
+ * Call the can_join method from the python implementation of the outer
+ * relation, to check if the join with the inner relation can be computed by
+ * the foreign data wrapper.
+ */
+bool
+canJoin(MulticornPlanState * outerstate, MulticornPlanState * innerstate,
+		char *join_type, List *join_clauses)
+{
+	PyObject   *p_clauses = joinClausesToPyList(join_clauses),
+			   *p_outer_quals = qualDefsToPyList(outerstate->qual_list,
+											   outerstate->cinfos),
+			   *p_inner_quals = qualDefsToPyList(innerstate->qual_list,
+											   innerstate->cinfos),
+			   *p_result;
+	bool		result;
+
+	countTableStat(outerstate->foreigntableid, planner_calls);
+	p_result = PyObject_CallMethod(outerstate->fdw_instance, "can_join",
+								   "(O,s,O,O,O)", innerstate->fdw_instance,
+								   join_type, p_clauses, p_outer_quals,
+								   p_inner_quals);
+	Py_DECREF(p_clauses);
+	Py_DECREF(p_outer_quals);
+	Py_DECREF(p_inner_quals);
+	errorCheck();
+	result = PyObject_IsTrue(p_result);
+	Py_DECREF(p_result);
+	return result;
+}
+
+/*
+ * Convert a list of assignments to a pydict mapping the column names to their
+ * new values. Each assignment is a list of the column attnum and its new
+ * value, as a Const.
+ */
+static PyObject *
+assignmentsToPyDict(List *assignments, ConversionInfo ** cinfos)
+{
+	PyObject   *result = PyDict_New();
+	ListCell   *lc;
+
+	foreach(lc, assignments)
+	{
+		List	   *assignment = (List *) lfirst(lc);
+		ConversionInfo *cinfo = cinfos[intVal(linitial(assignment)) - 1];
+		Const	   *value = (Const *) lsecond(assignment);
+		PyObject   *p_value;
+
+		if (value->constisnull)
+		{
+			p_value = Py_None;
+			Py_INCREF(p_value);
+		}
+		else
+		{
+			p_value = datumToPython(value->constvalue, value->consttype,
+									cinfo);
+		}
+		PyDict_SetItemString(result, cinfo->attrname, p_value);
+		Py_DECREF(p_value);
+	}
+	return result;
+}
+
+/*
+ * Call the can_modify_directly method from the python implementation, to
+ * check if an UPDATE or DELETE can be applied by the foreign data wrapper
+ * without fetching the rows.
+ */
+bool
+canModifyDirectly(MulticornPlanState * state, CmdType operation,
+				  List *assignments)
+{
+	PyObject   *p_quals = qualDefsToPyList(state->qual_list, state->cinfos),
+			   *p_assignments = assignmentsToPyDict(assignments, state->cinfos),
+			   *p_result;
+	bool		result;
+
+	countTableStat(state->foreigntableid, planner_calls);
+	p_result = PyObject_CallMethod(state->fdw_instance, "can_modify_directly",
+								   "(s,O,O)",
+								   operation == CMD_UPDATE ? "update" : "delete",
+								   p_quals, p_assignments);
+	Py_DECREF(p_quals);
+	Py_DECREF(p_assignments);
+	errorCheck();
+	result = PyObject_IsTrue(p_result);
+	Py_DECREF(p_result);
+	return result;
+}
+
+/*
+ * Call the update_where or delete_where method from the python
+ * implementation, and return the number of modified rows.
+ */
+int64
+modifyDirectly(MulticornDirectModifyState * dmstate)
+{
+	PyObject   *p_quals = qualDefsToPyList(dmstate->qual_list, dmstate->cinfos),
+			   *p_result;
+	int64		result = 0;
+
+	if (dmstate->operation == CMD_UPDATE)
+	{
+		PyObject   *p_assignments = assignmentsToPyDict(dmstate->assignments,
+														dmstate->cinfos);
+
+		p_result = PyObject_CallMethod(dmstate->fdw_instance, "update_where",
+									   "(O,O)", p_quals, p_assignments);
+		Py_DECREF(p_assignments);
+	}
+	else
+	{
+		p_result = PyObject_CallMethod(dmstate->fdw_instance, "delete_where",
+									   "(O)", p_quals);
+	}
+	Py_DECREF(p_quals);
+	errorCheck();
+	if (p_result != Py_None)
+	{
+		result = PyLong_AsLongLong(p_result);
+	}
+	Py_DECREF(p_result);
+	errorCheck();
+	return result;
+}
+
 PyObject *
 tupleTableSlotToPyObject(TupleTableSlot *slot, ConversionInfo ** cinfos)
 {
@@ -33,6 +33,11 @@ void extractClauseFromScalarArrayOpExpr(Relids base_relids,
 								   ScalarArrayOpExpr *node,
 								   List **quals);
 
+void extractClauseFromBoolVar(Relids base_relids,
+						 Node *node,
+						 bool value,
+						 List **quals);
+
 char	   *getOperatorString(Oid opoid);
 
 MulticornBaseQual *makeQual(AttrNumber varattno, char *opname, Expr *value,
@@ -131,9 +136,12 @@ initConversioninfo(ConversionInfo ** cinfos, AttInMetadata *attinmeta)
 			cinfo->attioparam = attinmeta->attioparams[i];
 			cinfo->attinfunc = &attinmeta->attinfuncs[i];
 			cinfo->attrname = NameStr(attr->attname);
+			cinfo->attrkey = internedColumnName(cinfo->attrname);
 			cinfo->attnum = i + 1;
 			cinfo->attndims = attr->attndims;
+			cinfo->is_array = type_is_array(attr->atttypid);
 			cinfo->need_quote = false;
+			initConverters(cinfo);
 			cinfos[i] = cinfo;
 		}
 		else
@@ -324,6 +332,18 @@ extractRestrictions(Relids base_relids,
 											   (ScalarArrayOpExpr *) node,
 											   quals);
 			break;
+		case T_Var:
+			extractClauseFromBoolVar(base_relids, (Node *) node, true, quals);
+			break;
+		case T_BoolExpr:
+			/* Other trees are converted by extractBoolQual. */
+			if (((BoolExpr *) node)->boolop == NOT_EXPR)
+			{
+				extractClauseFromBoolVar(base_relids,
+										 linitial(((BoolExpr *) node)->args),
+										 false, quals);
+			}
+			break;
 		default:
 			{
 				ereport(WARNING,
@@ -397,6 +417,79 @@ extractClauseFromScalarArrayOpExpr(Relids base_relids,
 }
 
 
+/*
+ *	Convert a test on a boolean column ("WHERE col", or "WHERE NOT col") to
+ *	an equality with true or false.
+ */
+void
+extractClauseFromBoolVar(Relids base_relids,
+						 Node *node,
+						 bool value,
+						 List **quals)
+{
+	Var		   *var = (Var *) node;
+
+	if (IsA(node, Var) && var->vartype == BOOLOID && var->varattno >= 1 &&
+		var->varlevelsup == 0 && bms_is_member(var->varno, base_relids))
+	{
+		*quals = lappend(*quals, makeQual(var->varattno, "=",
+										  (Expr *) makeBoolConst(value, false),
+										  false, false));
+	}
+}
+
+/*
+ *	Convert an AND / OR / NOT tree of restrictions to a MulticornBoolQual.
+ *	Returns NULL if the clause is not such a tree, or if one of its leaves
+ *	cannot be converted to a single qual.
+ */
+MulticornBaseQual *
+extractBoolQual(Relids base_relids, Expr *node)
+{
+	BoolExpr   *boolexpr = (BoolExpr *) node;
+	MulticornBoolQual *result;
+	ListCell   *lc;
+
+	if (!IsA(node, BoolExpr) ||
+		(boolexpr->boolop == NOT_EXPR && IsA(linitial(boolexpr->args), Var)))
+	{
+		return NULL;
+	}
+	result = palloc0(sizeof(MulticornBoolQual));
+	result->base.right_type = T_BoolExpr;
+	result->boolop = boolexpr->boolop;
+	foreach(lc, boolexpr->args)
+	{
+		Expr	   *arg = (Expr *) lfirst(lc);
+		MulticornBaseQual *qual = extractBoolQual(base_relids, arg);
+
+		if (qual == NULL)
+		{
+			List	   *quals = NIL;
+
+			switch (nodeTag(arg))
+			{
+				case T_OpExpr:
+				case T_NullTest:
+				case T_ScalarArrayOpExpr:
+				case T_Var:
+				case T_BoolExpr:
+					extractRestrictions(base_relids, arg, &quals);
+					break;
+				default:
+					break;
+			}
+			if (list_length(quals) != 1)
+			{
+				return NULL;
+			}
+			qual = linitial(quals);
+		}
+		result->args = lappend(result->args, qual);
+	}
+	return (MulticornBaseQual *) result;
+}
+
 /*
  *	Convert a "NullTest" (IS NULL, or IS NOT NULL)
  *	to a suitable intermediate representation.
@@ -0,0 +1,386 @@
+/*-------------------------------------------------------------------------
+ *
+ * The Multicorn Foreign Data Wrapper allows you to fetch foreign data in
+ * Python in your PostgreSQL server.
+ *
+ * This module contains the cumulative statistics of the foreign tables,
+ * shown by the multicorn_stat_foreign_tables view.
+ *
+ * Each backend counts its calls into python in a local hash table, which is
+ * added to a hash table in shared memory at the end of every transaction.
+ * The shared memory is only available when multicorn is loaded through
+ * shared_preload_libraries.
+ *
+ * This software is released under the postgresql licence
+ *
+ * author: Kozea
+ *
+ *
+ *-------------------------------------------------------------------------
+ */
+#include "multicorn.h"
+#include "miscadmin.h"
+#include "storage/ipc.h"
+#include "storage/lwlock.h"
+#include "storage/shmem.h"
+#include "utils/hsearch.h"
+#include "utils/memutils.h"
+#include "utils/tuplestore.h"
+
+/* Foreign tables tracked at most, in every database */
+#define MULTICORN_STATS_MAX 1000
+
+#define MULTICORN_STATS_COLS 11
+
+extern Datum multicorn_stat_foreign_tables(PG_FUNCTION_ARGS);
+extern Datum multicorn_stat_reset(PG_FUNCTION_ARGS);
+
+PG_FUNCTION_INFO_V1(multicorn_stat_foreign_tables);
+PG_FUNCTION_INFO_V1(multicorn_stat_reset);
+
+typedef struct MulticornStatsKey
+{
+	Oid			dbid;
+	Oid			foreigntableid;
+}	MulticornStatsKey;
+
+typedef struct MulticornStatsEntry
+{
+	MulticornStatsKey key;
+	MulticornTableStats counters;
+}	MulticornStatsEntry;
+
+typedef struct MulticornPendingStats
+{
+	Oid			foreigntableid;
+	MulticornTableStats counters;
+}	MulticornPendingStats;
+
+#if PG_VERSION_NUM >= 90600
+typedef struct MulticornSharedStats
+{
+	LWLock	   *lock;
+}	MulticornSharedStats;
+
+static MulticornSharedStats *sharedStats = NULL;
+static HTAB *sharedStatsHash = NULL;
+
+static shmem_startup_hook_type prev_shmem_startup_hook = NULL;
+#if PG_VERSION_NUM >= 150000
+static shmem_request_hook_type prev_shmem_request_hook = NULL;
+#endif
+#endif
+
+/* Counters of this backend, not yet added to the shared ones */
+static HTAB *pendingStatsHash = NULL;
+
+
+#if PG_VERSION_NUM >= 90600
+static Size
+tableStatsShmemSize(void)
+{
+	return add_size(MAXALIGN(sizeof(MulticornSharedStats)),
+					hash_estimate_size(MULTICORN_STATS_MAX,
+									   sizeof(MulticornStatsEntry)));
+}
+
+static void
+tableStatsShmemRequest(void)
+{
+#if PG_VERSION_NUM >= 150000
+	if (prev_shmem_request_hook)
+	{
+		prev_shmem_request_hook();
+	}
+#endif
+	RequestAddinShmemSpace(tableStatsShmemSize());
+	RequestNamedLWLockTranche("multicorn", 1);
+}
+
+static void
+tableStatsShmemStartup(void)
+{
+	HASHCTL		ctl;
+	bool		found;
+
+	if (prev_shmem_startup_hook)
+	{
+		prev_shmem_startup_hook();
+	}
+	LWLockAcquire(AddinShmemInitLock, LW_EXCLUSIVE);
+	sharedStats = ShmemInitStruct("multicorn stats",
+								  sizeof(MulticornSharedStats), &found);
+	if (!found)
+	{
+		sharedStats->lock = &(GetNamedLWLockTranche("multicorn"))->lock;
+	}
+	MemSet(&ctl, 0, sizeof(ctl));
+	ctl.keysize = sizeof(MulticornStatsKey);
+	ctl.entrysize = sizeof(MulticornStatsEntry);
+	sharedStatsHash = ShmemInitHash("multicorn stats hash",
+									MULTICORN_STATS_MAX, MULTICORN_STATS_MAX,
+									&ctl, HASH_ELEM | HASH_BLOBS);
+	LWLockRelease(AddinShmemInitLock);
+}
+#endif
+
+/*
+ * Reserve the shared memory of the statistics. Called by _PG_init, it does
+ * nothing unless the library is in shared_preload_libraries.
+ */
+void
+initTableStats(void)
+{
+#if PG_VERSION_NUM >= 90600
+	if (!process_shared_preload_libraries_in_progress)
+	{
+		return;
+	}
+#if PG_VERSION_NUM >= 150000
+	prev_shmem_request_hook = shmem_request_hook;
+	shmem_request_hook = tableStatsShmemRequest;
+#else
+	tableStatsShmemRequest();
+#endif
+	prev_shmem_startup_hook = shmem_startup_hook;
+	shmem_startup_hook = tableStatsShmemStartup;
+#endif
+}
+
+/*
+ * Returns true if the statistics are collected.
+ */
+bool
+tableStatsEnabled(void)
+{
+#if PG_VERSION_NUM >= 90600
+	return sharedStatsHash != NULL;
+#else
+	return false;
+#endif
+}
+
+/*
+ * Returns the counters of this backend for a foreign table, or NULL if the
+ * statistics are not collected. The counters stay at the same address for
+ * the lifetime of the backend.
+ */
+MulticornTableStats *
+pendingTableStats(Oid foreigntableid)
+{
+	MulticornPendingStats *pending;
+	bool		found;
+
+	if (!tableStatsEnabled())
+	{
+		return NULL;
+	}
+	if (pendingStatsHash == NULL)
+	{
+		HASHCTL		ctl;
+
+		MemSet(&ctl, 0, sizeof(ctl));
+		ctl.keysize = sizeof(Oid);
+		ctl.entrysize = sizeof(MulticornPendingStats);
+		ctl.hash = oid_hash;
+		ctl.hcxt = TopMemoryContext;
+		pendingStatsHash = hash_create("multicorn pending stats", 32, &ctl,
+									   HASH_ELEM | HASH_FUNCTION |
+									   HASH_CONTEXT);
+	}
+	pending = hash_search(pendingStatsHash, &foreigntableid, HASH_ENTER,
+						  &found);
+	if (!found)
+	{
+		MemSet(&pending->counters, 0, sizeof(MulticornTableStats));
+	}
+	return &pending->counters;
+}
+
+/*
+ * Account for a finished scan: its rows, and the time it spent in python.
+ */
+void
+reportScanStats(Oid foreigntableid, MulticornScanStats * scanstats)
+{
+	MulticornTableStats *stats = pendingTableStats(foreigntableid);
+	instr_time	python_time = scanstats->execute_time;
+	double		time;
+
+	if (stats == NULL)
+	{
+		return;
+	}
+	INSTR_TIME_ADD(python_time, scanstats->fetch_time);
+	time = INSTR_TIME_GET_MILLISEC(python_time);
+	stats->scans++;
+	stats->rows += scanstats->rows;
+	stats->total_python_time += time;
+	if (time > stats->max_python_time)
+	{
+		stats->max_python_time = time;
+	}
+}
+
+static void
+addTableStats(MulticornTableStats * to, MulticornTableStats * from)
+{
+	to->scans += from->scans;
+	to->rows += from->rows;
+	to->total_python_time += from->total_python_time;
+	if (from->max_python_time > to->max_python_time)
+	{
+		to->max_python_time = from->max_python_time;
+	}
+	to->planner_calls += from->planner_calls;
+	to->insert_calls += from->insert_calls;
+	to->update_calls += from->update_calls;
+	to->delete_calls += from->delete_calls;
+	to->xact_calls += from->xact_calls;
+}
+
+/*
+ * Add the counters of this backend to the shared ones, at the end of a
+ * transaction. The counters of the foreign tables which do not fit in the
+ * shared memory are lost.
+ */
+void
+flushTableStats(void)
+{
+#if PG_VERSION_NUM >= 90600
+	static const MulticornTableStats zero;
+	HASH_SEQ_STATUS status;
+	MulticornPendingStats *pending;
+
+	if (pendingStatsHash == NULL || sharedStatsHash == NULL)
+	{
+		return;
+	}
+	LWLockAcquire(sharedStats->lock, LW_EXCLUSIVE);
+	hash_seq_init(&status, pendingStatsHash);
+	while ((pending = hash_seq_search(&status)) != NULL)
+	{
+		MulticornStatsKey key;
+		MulticornStatsEntry *entry;
+		bool		found;
+
+		if (memcmp(&pending->counters, &zero, sizeof(zero)) == 0)
+		{
+			continue;
+		}
+		key.dbid = MyDatabaseId;
+		key.foreigntableid = pending->foreigntableid;
+		entry = hash_search(sharedStatsHash, &key, HASH_ENTER_NULL, &found);
+		if (entry != NULL)
+		{
+			if (!found)
+			{
+				MemSet(&entry->counters, 0, sizeof(MulticornTableStats));
+			}
+			addTableStats(&entry->counters, &pending->counters);
+		}
+		MemSet(&pending->counters, 0, sizeof(MulticornTableStats));
+	}
+	LWLockRelease(sharedStats->lock);
+#endif
+}
+
+static void
+checkTableStatsEnabled(void)
+{
+	if (!tableStatsEnabled())
+	{
+		ereport(ERROR,
+				(errcode(ERRCODE_OBJECT_NOT_IN_PREREQUISITE_STATE),
+				 errmsg("multicorn must be loaded via shared_preload_libraries "
+						"to collect statistics")));
+	}
+}
+
+/*
+ * Returns the statistics of the foreign tables of every database.
+ */
+Datum
+multicorn_stat_foreign_tables(PG_FUNCTION_ARGS)
+{
+	ReturnSetInfo *rsinfo = (ReturnSetInfo *) fcinfo->resultinfo;
+	TupleDesc	tupdesc;
+	Tuplestorestate *tupstore;
+	MemoryContext oldcontext;
+
+	checkTableStatsEnabled();
+	if (rsinfo == NULL || !IsA(rsinfo, ReturnSetInfo) ||
+		!(rsinfo->allowedModes & SFRM_Materialize))
+	{
+		ereport(ERROR,
+				(errcode(ERRCODE_FEATURE_NOT_SUPPORTED),
+				 errmsg("set-valued function called in context that cannot "
+						"accept a set")));
+	}
+	if (get_call_result_type(fcinfo, NULL, &tupdesc) != TYPEFUNC_COMPOSITE)
+	{
+		elog(ERROR, "return type must be a row type");
+	}
+	oldcontext = MemoryContextSwitchTo(rsinfo->econtext->ecxt_per_query_memory);
+	tupdesc = CreateTupleDescCopy(tupdesc);
+	tupstore = tuplestore_begin_heap(true, false, work_mem);
+	rsinfo->returnMode = SFRM_Materialize;
+	rsinfo->setResult = tupstore;
+	rsinfo->setDesc = tupdesc;
+	MemoryContextSwitchTo(oldcontext);
+#if PG_VERSION_NUM >= 90600
+	{
+		HASH_SEQ_STATUS status;
+		MulticornStatsEntry *entry;
+
+		LWLockAcquire(sharedStats->lock, LW_SHARED);
+		hash_seq_init(&status, sharedStatsHash);
+		while ((entry = hash_seq_search(&status)) != NULL)
+		{
+			Datum		values[MULTICORN_STATS_COLS];
+			bool		nulls[MULTICORN_STATS_COLS];
+			MulticornTableStats *counters = &entry->counters;
+
+			MemSet(nulls, 0, sizeof(nulls));
+			values[0] = ObjectIdGetDatum(entry->key.dbid);
+			values[1] = ObjectIdGetDatum(entry->key.foreigntableid);
+			values[2] = Int64GetDatum(counters->scans);
+			values[3] = Int64GetDatum(counters->rows);
+			values[4] = Float8GetDatum(counters->total_python_time);
+			values[5] = Float8GetDatum(counters->max_python_time);
+			values[6] = Int64GetDatum(counters->planner_calls);
+			values[7] = Int64GetDatum(counters->insert_calls);
+			values[8] = Int64GetDatum(counters->update_calls);
+			values[9] = Int64GetDatum(counters->delete_calls);
+			values[10] = Int64GetDatum(counters->xact_calls);
+			tuplestore_putvalues(tupstore, tupdesc, values, nulls);
+		}
+		LWLockRelease(sharedStats->lock);
+	}
+#endif
+	return (Datum) 0;
+}
+
+/*
+ * Discard the statistics of the foreign tables of every database.
+ */
+Datum
+multicorn_stat_reset(PG_FUNCTION_ARGS)
+{
+	checkTableStatsEnabled();
+#if PG_VERSION_NUM >= 90600
+	{
+		HASH_SEQ_STATUS status;
+		MulticornStatsEntry *entry;
+
+		LWLockAcquire(sharedStats->lock, LW_EXCLUSIVE);
+		hash_seq_init(&status, sharedStatsHash);
+		while ((entry = hash_seq_search(&status)) != NULL)
+		{
+			hash_search(sharedStatsHash, &entry->key, HASH_REMOVE, NULL);
+		}
+		LWLockRelease(sharedStats->lock);
+	}
+#endif
+	PG_RETURN_VOID();
+}
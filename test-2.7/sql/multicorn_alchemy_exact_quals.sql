@@ -0,0 +1,56 @@
+SET client_min_messages=NOTICE;
+\i test-common/disable_jit.include
+CREATE EXTENSION multicorn;
+
+create or replace function create_foreign_server() returns void as $block$
+  DECLARE
+    current_db varchar;
+  BEGIN
+    SELECT into current_db current_database();
+    EXECUTE $$ 
+    CREATE server multicorn_srv foreign data wrapper multicorn options (
+        wrapper 'multicorn.sqlalchemyfdw.SqlAlchemyFdw',
+        db_url 'postgresql://$$ || current_user || '@localhost/' || current_db || $$'
+    );
+    $$;
+  END;
+$block$ language plpgsql;
+select create_foreign_server();
+
+create foreign table testalchemy (
+  id integer,
+  avarchar varchar
+) server multicorn_srv options (
+  tablename 'basetable'
+);
+
+create table basetable (
+  id integer,
+  avarchar varchar
+);
+
+insert into basetable (id, avarchar) values
+  (1, 'One'),
+  (2, 'Two'),
+  (3, 'Three');
+
+-- Comparisons of integers are not checked again
+explain (costs off) select * from testalchemy where id = 1;
+
+select * from testalchemy where id = 1;
+
+-- Text comparisons and LIKE may differ on the remote side: they are checked
+-- again
+explain (costs off) select * from testalchemy where avarchar like 'T%' and id > 1;
+
+select * from testalchemy where avarchar like 'T%' and id > 1 order by id;
+
+-- Unless every pushed qual is declared exact
+alter foreign table testalchemy options (add exact_quals 'true');
+
+explain (costs off) select * from testalchemy where avarchar like 'T%' and id > 1;
+
+select * from testalchemy where avarchar like 'T%' and id > 1 order by id;
+
+DROP EXTENSION multicorn cascade;
+DROP table basetable;
@@ -0,0 +1,57 @@
+SET client_min_messages=NOTICE;
+\i test-common/disable_jit.include
+CREATE EXTENSION multicorn;
+
+create or replace function create_foreign_server() returns void as $block$
+  DECLARE
+    current_db varchar;
+  BEGIN
+    SELECT into current_db current_database();
+    EXECUTE $$ 
+    CREATE server multicorn_srv foreign data wrapper multicorn options (
+        wrapper 'multicorn.sqlalchemyfdw.SqlAlchemyFdw',
+        db_url 'postgresql://$$ || current_user || '@localhost/' || current_db || $$'
+    );
+    $$;
+  END;
+$block$ language plpgsql;
+select create_foreign_server();
+
+create foreign table testalchemy (
+  id integer,
+  avarchar varchar
+) server multicorn_srv options (
+  tablename 'basetable',
+  partition_column 'id',
+  partitions '3'
+);
+
+create table basetable (
+  id integer,
+  avarchar varchar
+);
+
+insert into basetable (id, avarchar) values
+  (1, 'One'),
+  (2, 'Two'),
+  (3, 'Three'),
+  (4, 'Four'),
+  (-5, 'Minus five'),
+  (NULL, 'Null');
+
+set parallel_setup_cost = 0;
+set parallel_tuple_cost = 0;
+set max_parallel_workers_per_gather = 2;
+
+-- The partitions are scanned by the workers
+explain (costs off) select * from testalchemy;
+
+-- Each row is fetched by one partition, including the one with a null id
+select * from testalchemy order by id nulls first;
+
+reset parallel_setup_cost;
+reset parallel_tuple_cost;
+reset max_parallel_workers_per_gather;
+
+DROP EXTENSION multicorn cascade;
+DROP table basetable;
@@ -0,0 +1,26 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testmulticorn (
+    test1 date,
+    test2 timestamp
+) server multicorn_srv options (
+    option1 'option1',
+    test_type 'date'
+);
+
+-- Aggregates without grouping are computed by the fdw
+SELECT count(*), min(test1), max(test1) FROM testmulticorn;
+
+-- So are grouped rows
+SELECT test1, count(*) FROM testmulticorn GROUP BY test1 ORDER BY 2, 1;
+
+-- Aggregates over filtered rows are computed locally
+SELECT count(*) FROM testmulticorn WHERE test1 < '2011-06-01';
+
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
@@ -0,0 +1,40 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testasync1 (
+    test1 integer,
+    test2 integer
+) server multicorn_srv options (
+    test_type 'int',
+    test_subtype 'async'
+);
+
+CREATE foreign table testasync2 (
+    test1 integer,
+    test2 integer
+) server multicorn_srv options (
+    test_type 'int',
+    test_subtype 'async'
+);
+
+-- Both scans are run at once by the Append
+EXPLAIN (COSTS OFF) SELECT * FROM testasync1 UNION ALL SELECT * FROM testasync2;
+
+SELECT count(*), sum(test1), min(test2), max(test2)
+FROM (SELECT * FROM testasync1 UNION ALL SELECT * FROM testasync2) t;
+
+-- Every row of each scan is counted
+EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF, SUMMARY OFF)
+SELECT * FROM testasync1 UNION ALL SELECT * FROM testasync2;
+
+-- Quals are checked on the rows of async scans too
+SELECT count(*)
+FROM (SELECT * FROM testasync1 UNION ALL SELECT * FROM testasync2) t
+WHERE test1 < 5;
+
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
@@ -0,0 +1,41 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testmulticorn (
+    test1 integer,
+    test2 integer
+) server multicorn_srv options (
+    option1 'option1',
+    test_type 'int',
+    test_subtype 'batch'
+);
+
+-- Rows are returned in batches of 7
+select * from testmulticorn;
+
+-- Stop in the middle of a batch
+select * from testmulticorn limit 3;
+
+-- Quals are still checked against batched rows
+select test1 from testmulticorn where test1 > 15;
+
+select * from testmulticorn order by test1 desc limit 2;
+
+-- Column-oriented batches
+CREATE foreign table testcolumnar (
+    test1 integer,
+    test2 text
+) server multicorn_srv options (
+    test_type 'int',
+    test_subtype 'columnar'
+);
+
+select * from testcolumnar;
+
+select test2 from testcolumnar where test1 < 3;
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
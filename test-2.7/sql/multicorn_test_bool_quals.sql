@@ -0,0 +1,34 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testbool (
+    test1 integer,
+    test2 integer,
+    flag boolean
+) server multicorn_srv options (
+    test_type 'int',
+    test_subtype 'bool_quals'
+);
+
+-- Tests on a boolean column are passed as equalities
+select test1 from testbool where flag;
+
+select test1 from testbool where not flag;
+
+-- Trees of quals are passed as bool quals, and still checked by PostgreSQL
+explain (costs off) select test1, test2 from testbool where test1 = 3 or test2 > 17;
+
+select test1, test2 from testbool where test1 = 3 or test2 > 17;
+
+select test1, flag from testbool where test1 < 2 or not flag;
+
+select * from testbool where test1 = 4 or (test2 > 15 and flag);
+
+-- PostgreSQL pushes the negations down to the leaves of the tree
+select * from testbool where not (test1 > 2 and (flag or test2 < 17));
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
@@ -0,0 +1,28 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testmulticorn (
+    test1 integer,
+    test2 integer
+) server multicorn_srv options (
+    test_type 'int',
+    test_subtype 'exact'
+);
+
+-- The equality on test1 is enforced by the wrapper, and not checked again
+explain (costs off) select * from testmulticorn where test1 = 3;
+
+select * from testmulticorn where test1 = 3;
+
+-- The other quals are still checked
+explain (costs off) select * from testmulticorn where test1 = 3 and test2 > 1;
+
+explain (costs off) select * from testmulticorn where test1 < 3;
+
+select * from testmulticorn where test1 < 3;
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
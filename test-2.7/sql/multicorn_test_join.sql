@@ -0,0 +1,29 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testjoin1 (
+    test1 integer,
+    test2 integer
+) server multicorn_srv options (
+    test_type 'int'
+);
+
+CREATE foreign table testjoin2 (
+    test1 integer,
+    test2 integer
+) server multicorn_srv options (
+    test_type 'int'
+);
+
+-- Join without any needed column
+SELECT count(*) FROM testjoin1 t1 JOIN testjoin2 t2 ON t1.test1 = t2.test2;
+
+-- Outer join
+SELECT t1.test1, t2.test2 FROM testjoin1 t1 LEFT JOIN testjoin2 t2 ON t1.test1 = t2.test2;
+
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
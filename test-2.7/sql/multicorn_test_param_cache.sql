@@ -0,0 +1,35 @@
+SET client_min_messages=NOTICE;
+\i test-common/disable_memoize.include
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testmulticorn (
+    test1 character varying,
+    test2 character varying
+) server multicorn_srv options (
+    test_type 'planner'
+);
+
+CREATE TABLE outer_values (value character varying);
+INSERT INTO outer_values VALUES ('test1 1 0'), ('test1 3 1'), ('test1 1 0'), ('test1 3 1');
+ANALYZE outer_values;
+
+-- The foreign table is scanned once per outer row
+SET enable_hashjoin = off;
+SET enable_mergejoin = off;
+
+-- Only the first scan with each value calls execute
+SELECT o.value, m.test2 FROM outer_values o JOIN testmulticorn m ON m.test1 = o.value;
+
+-- Results larger than the cache are never kept
+ALTER FOREIGN TABLE testmulticorn OPTIONS (ADD param_cache_rows '10');
+SELECT o.value, m.test2 FROM outer_values o JOIN testmulticorn m ON m.test1 = o.value;
+
+RESET enable_hashjoin;
+RESET enable_mergejoin;
+DROP TABLE outer_values;
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
@@ -0,0 +1,36 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testmulticorn (
+    test1 integer,
+    test2 character varying
+) server multicorn_srv options (
+    test_type 'int'
+);
+
+-- The statistics of the scan and the counters of the wrapper are shown
+EXPLAIN (ANALYZE, TIMING OFF, COSTS OFF, SUMMARY OFF)
+SELECT * FROM testmulticorn WHERE test1 < 5;
+
+-- Only the needed columns are converted
+EXPLAIN (ANALYZE, TIMING OFF, COSTS OFF, SUMMARY OFF)
+SELECT test1 FROM testmulticorn;
+
+-- Each scan of a self join has its own counters, summed over its rescans
+SET enable_hashjoin = off;
+SET enable_mergejoin = off;
+SET enable_material = off;
+EXPLAIN (ANALYZE, TIMING OFF, COSTS OFF, SUMMARY OFF)
+SELECT a.test1, b.test1
+FROM testmulticorn a LEFT JOIN testmulticorn b ON b.test1 = a.test1
+WHERE a.test1 < 4;
+RESET enable_hashjoin;
+RESET enable_mergejoin;
+RESET enable_material;
+
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
@@ -19,5 +19,10 @@ EXPLAIN SELECT * FROM testmulticorn ORDER BY test1 DESC;
 -- Data should be sorted
 SELECT * FROM testmulticorn ORDER BY test1 DESC;
 
+-- Limit and offset are pushed down, and applied after the sort
+EXPLAIN (COSTS OFF) SELECT * FROM testmulticorn ORDER BY test1 DESC LIMIT 3 OFFSET 2;
+
+SELECT * FROM testmulticorn ORDER BY test1 DESC LIMIT 3 OFFSET 2;
+
 DROP USER MAPPING FOR current_user SERVER multicorn_srv;
 DROP EXTENSION multicorn cascade;
@@ -0,0 +1,30 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+CREATE server multicorn_srv foreign data wrapper multicorn options (
+    wrapper 'multicorn.testfdw.TestForeignDataWrapper'
+);
+CREATE user mapping FOR current_user server multicorn_srv options (usermapping 'test');
+
+CREATE foreign table testmulticorn (
+    test1 character varying,
+    test2 character varying
+) server multicorn_srv options (
+    option1 'option1',
+    batch_size '2'
+);
+
+-- The rows are sent by batches of batch_size rows
+insert into testmulticorn(test1, test2) VALUES ('a', '1'), ('b', '2'), ('c', '3');
+
+-- But inserted one by one when their values are needed back
+insert into testmulticorn(test1, test2) VALUES ('d', '4'), ('e', '5') RETURNING test1;
+
+-- COPY FROM is batched too
+COPY testmulticorn FROM stdin;
+f	6
+g	7
+h	8
+\.
+
+DROP USER MAPPING FOR current_user SERVER multicorn_srv;
+DROP EXTENSION multicorn cascade;
@@ -0,0 +1,53 @@
+SET client_min_messages=NOTICE;
+CREATE EXTENSION multicorn;
+
+create or replace function create_foreign_server() returns void as $block$
+  DECLARE
+    current_db varchar;
+  BEGIN
+    SELECT into current_db current_database();
+    EXECUTE $$ 
+    CREATE server multicorn_srv foreign data wrapper multicorn options (
+        wrapper 'multicorn.sqlalchemyfdw.SqlAlchemyFdw',
+        db_url 'postgresql://$$ || current_user || '@localhost/' || current_db || $$'
+    );
+    $$;
+  END;
+$block$ language plpgsql;
+select create_foreign_server();
+
+create foreign table testalchemy (
+  id integer,
+  avarchar varchar
+) server multicorn_srv options (
+  tablename 'basetable',
+  primary_key 'id'
+);
+
+create table basetable (
+  id integer primary key,
+  avarchar varchar
+);
+
+insert into basetable (id, avarchar) values
+  (1, 'One'),
+  (2, 'Two'),
+  (3, 'Three'),
+  (4, 'Four');
+
+-- An update setting constant values is run by the remote database
+EXPLAIN (COSTS OFF) UPDATE testalchemy SET avarchar = 'Directly updated' WHERE id > 2;
+
+UPDATE testalchemy SET avarchar = 'Directly updated' WHERE id > 2;
+
+SELECT * from basetable ORDER BY id;
+
+-- So is a delete
+EXPLAIN (COSTS OFF) DELETE FROM testalchemy WHERE id < 2;
+
+DELETE FROM testalchemy WHERE id < 2;
+
+SELECT * from basetable ORDER BY id;
+
+DROP EXTENSION multicorn cascade;
+DROP TABLE basetable;
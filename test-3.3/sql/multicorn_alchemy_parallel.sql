@@ -0,0 +1 @@
+../../test-2.7/sql/multicorn_alchemy_parallel.sql
\ No newline at end of file
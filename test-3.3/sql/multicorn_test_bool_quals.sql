@@ -0,0 +1 @@
+../../test-2.7/sql/multicorn_test_bool_quals.sql
\ No newline at end of file
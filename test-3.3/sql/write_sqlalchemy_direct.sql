@@ -0,0 +1 @@
+../../test-2.7/sql/write_sqlalchemy_direct.sql
\ No newline at end of file